@@ -0,0 +1,291 @@
+# file: admission.py
+#
+# Admission control for /verify and /verify-batch.
+#
+# Under a burst, accepting everything just moves the queue into memory,
+# the spool dir and the inference pools, and every request gets slower
+# until the container runs out of memory. Instead, work is turned away
+# early and cheaply:
+#
+#   1. Body size: every uploaded file has a max size per media type
+#      (413 as soon as it is exceeded, while it streams in).
+#   2. Inference: image, audio and video detection each have a bounded
+#      number of running requests plus a bounded wait queue. When the
+#      queue is full (or a request waited too long) the answer is an
+#      immediate 503 with a Retry-After estimate. For /verify the check
+#      is also made as soon as the file's headers arrive, before its body.
+#   3. Optionally, each client has a token bucket (429 when empty).
+#
+import asyncio
+import math
+import os
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+
+from fastapi import HTTPException, Request
+
+from inference_executor import AUDIO_WORKERS, IMAGE_WORKERS, VIDEO_WORKERS
+from instrumentation import get_logger
+
+logger = get_logger("admission")
+
+# --- Config ---
+# Max size of one uploaded file, in bytes. Files of other types (which
+# are rejected anyway) get the image limit.
+MAX_UPLOAD_BYTES_IMAGE = int(os.getenv("MAX_UPLOAD_BYTES_IMAGE", str(20 * 1024 * 1024)))
+MAX_UPLOAD_BYTES_AUDIO = int(os.getenv("MAX_UPLOAD_BYTES_AUDIO", str(100 * 1024 * 1024)))
+MAX_UPLOAD_BYTES_VIDEO = int(os.getenv("MAX_UPLOAD_BYTES_VIDEO", str(500 * 1024 * 1024)))
+# Archives sent to /verify-batch (each member also gets its own limit).
+MAX_UPLOAD_BYTES_ARCHIVE = int(os.getenv("MAX_UPLOAD_BYTES_ARCHIVE", str(1024 * 1024 * 1024)))
+
+# Requests running detection at once, per media type (default: the size
+# of that type's worker pool), and how many more may wait for a slot.
+ADMISSION_IMAGE_CONCURRENCY = int(os.getenv("ADMISSION_IMAGE_CONCURRENCY", str(IMAGE_WORKERS)))
+ADMISSION_IMAGE_QUEUE = int(os.getenv("ADMISSION_IMAGE_QUEUE", "64"))
+ADMISSION_AUDIO_CONCURRENCY = int(os.getenv("ADMISSION_AUDIO_CONCURRENCY", str(AUDIO_WORKERS)))
+ADMISSION_AUDIO_QUEUE = int(os.getenv("ADMISSION_AUDIO_QUEUE", "8"))
+ADMISSION_VIDEO_CONCURRENCY = int(os.getenv("ADMISSION_VIDEO_CONCURRENCY", str(VIDEO_WORKERS)))
+ADMISSION_VIDEO_QUEUE = int(os.getenv("ADMISSION_VIDEO_QUEUE", "4"))
+# A queued request that hasn't got a slot after this many seconds is
+# rejected (0 = wait as long as it takes).
+ADMISSION_QUEUE_TIMEOUT_S = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_S", "30"))
+
+# Per-client token bucket: requests per second and burst size (0 = off).
+ADMISSION_RATE_PER_S = float(os.getenv("ADMISSION_RATE_PER_S", "0"))
+ADMISSION_BURST = int(os.getenv("ADMISSION_BURST", "20"))
+# Identify clients by the first X-Forwarded-For address (only behind a
+# proxy that sets it) instead of the connection's address.
+ADMISSION_TRUST_FORWARDED = os.getenv("ADMISSION_TRUST_FORWARDED", "0") == "1"
+
+# Clients whose buckets are remembered; the least recently seen go first
+_MAX_BUCKETS = 100_000
+# Longest Retry-After we suggest, in seconds
+_MAX_RETRY_AFTER_S = 120
+# Room for the multipart framing around a single file
+_MULTIPART_OVERHEAD = 64 * 1024
+
+
+def media_kind(content_type: str) -> Optional[str]:
+    """"image", "audio" or "video" for a file's content type, else None."""
+    major = content_type.split("/", 1)[0].strip().lower()
+    return major if major in ("image", "audio", "video") else None
+
+
+def max_upload_bytes(content_type: str) -> int:
+    return {
+        "audio": MAX_UPLOAD_BYTES_AUDIO,
+        "video": MAX_UPLOAD_BYTES_VIDEO,
+    }.get(media_kind(content_type), MAX_UPLOAD_BYTES_IMAGE)
+
+
+class AdmissionGate:
+    """
+    Bounded concurrency plus a bounded wait queue, for one media type.
+    Used from the event loop only, so the counters need no lock.
+    """
+
+    def __init__(self, name: str, limit: int, queue_limit: int,
+                 queue_timeout_s: float = ADMISSION_QUEUE_TIMEOUT_S):
+        self.name = name
+        self.limit = max(1, int(limit))
+        self.queue_limit = max(0, int(queue_limit))
+        self.queue_timeout_s = queue_timeout_s
+        self._slots = asyncio.Semaphore(self.limit)
+        self.running = 0
+        self.waiting = 0
+
+        # --- Stats ---
+        self.admitted = 0
+        self.rejected_full = 0
+        self.rejected_timeout = 0
+        self.max_waiting = 0
+        # Moving average of how long a slot is held, for Retry-After
+        self._avg_hold_s = 1.0
+
+    def is_full(self) -> bool:
+        # Requests between "queued" and "got the semaphore" count as waiting
+        return self.running + self.waiting >= self.limit + self.queue_limit
+
+    def retry_after_s(self) -> int:
+        """Rough time until a newly queued request would get a slot."""
+        estimate = (self.waiting + 1) / self.limit * self._avg_hold_s
+        return min(_MAX_RETRY_AFTER_S, max(1, math.ceil(estimate)))
+
+    def reject_if_full(self):
+        """Fast path: raises 503 if a request couldn't even be queued."""
+        if self.is_full():
+            self.rejected_full += 1
+            raise self._busy()
+
+    def _busy(self) -> HTTPException:
+        retry_after = self.retry_after_s()
+        return HTTPException(
+            status_code=503,
+            detail=f"The {self.name} detector is at capacity. Retry in {retry_after} s.",
+            headers={"Retry-After": str(retry_after)},
+        )
+
+    @asynccontextmanager
+    async def slot(self):
+        """Holds one slot for the duration of the block (or raises 503)."""
+        self.reject_if_full()
+        self.waiting += 1
+        self.max_waiting = max(self.max_waiting, self.waiting)
+        try:
+            if self.queue_timeout_s > 0 and self._slots.locked():
+                await asyncio.wait_for(self._slots.acquire(), self.queue_timeout_s)
+            else:
+                await self._slots.acquire()
+        except asyncio.TimeoutError:
+            self.rejected_timeout += 1
+            raise self._busy()
+        finally:
+            self.waiting -= 1
+
+        self.admitted += 1
+        self.running += 1
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.running -= 1
+            self._slots.release()
+            self._avg_hold_s = 0.9 * self._avg_hold_s + 0.1 * (time.monotonic() - started)
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "queue_limit": self.queue_limit,
+            "running": self.running,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "admitted": self.admitted,
+            "rejected_full": self.rejected_full,
+            "rejected_timeout": self.rejected_timeout,
+            "avg_hold_s": self._avg_hold_s,
+        }
+
+
+class TokenBuckets:
+    """One token bucket per client key, refilled at `rate` per second."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(1, burst)
+        # key -> (tokens, last refill time)
+        self._buckets: "OrderedDict[str, tuple]" = OrderedDict()
+        self.rejected = 0
+
+    def take(self, key: str) -> Optional[float]:
+        """Takes a token; returns None, or the seconds until one is available."""
+        now = time.monotonic()
+        tokens, last = self._buckets.pop(key, (float(self.burst), now))
+        tokens = min(float(self.burst), tokens + (now - last) * self.rate)
+        wait = None
+        if tokens >= 1.0:
+            tokens -= 1.0
+        else:
+            wait = (1.0 - tokens) / self.rate
+            self.rejected += 1
+        self._buckets[key] = (tokens, now)
+        if len(self._buckets) > _MAX_BUCKETS:
+            self._buckets.popitem(last=False)
+        return wait
+
+    def stats(self) -> dict:
+        return {
+            "rate_per_s": self.rate,
+            "burst": self.burst,
+            "clients": len(self._buckets),
+            "rejected": self.rejected,
+        }
+
+
+class Admission:
+    """All of the admission checks of the verify endpoints."""
+
+    def __init__(self):
+        self.gates: Dict[str, AdmissionGate] = {
+            "image": AdmissionGate("image", ADMISSION_IMAGE_CONCURRENCY, ADMISSION_IMAGE_QUEUE),
+            "audio": AdmissionGate("audio", ADMISSION_AUDIO_CONCURRENCY, ADMISSION_AUDIO_QUEUE),
+            "video": AdmissionGate("video", ADMISSION_VIDEO_CONCURRENCY, ADMISSION_VIDEO_QUEUE),
+        }
+        self.buckets = TokenBuckets(ADMISSION_RATE_PER_S, ADMISSION_BURST) if ADMISSION_RATE_PER_S > 0 else None
+        self.rejected_too_large = 0
+
+    # --- Per request ---
+
+    def client_key(self, request: Request) -> str:
+        if ADMISSION_TRUST_FORWARDED:
+            forwarded = request.headers.get("x-forwarded-for", "")
+            if forwarded:
+                return forwarded.split(",")[0].strip()
+        return request.client.host if request.client else "unknown"
+
+    def check_request(self, request: Request, max_body_bytes: Optional[int] = None):
+        """
+        Runs before the body is read: the client's rate limit (429) and,
+        when the Content-Length is known, the body size (413).
+        """
+        if self.buckets is not None:
+            wait = self.buckets.take(self.client_key(request))
+            if wait is not None:
+                retry_after = min(_MAX_RETRY_AFTER_S, max(1, math.ceil(wait)))
+                raise HTTPException(
+                    status_code=429,
+                    detail=f"Too many requests. Retry in {retry_after} s.",
+                    headers={"Retry-After": str(retry_after)},
+                )
+        length = request.headers.get("content-length")
+        if max_body_bytes is not None and length and length.isdigit() and int(length) > max_body_bytes:
+            self.rejected_too_large += 1
+            raise HTTPException(status_code=413, detail="The upload is too large.")
+
+    def max_single_upload_bytes(self) -> int:
+        """Largest /verify body that could hold an acceptable file."""
+        return max(MAX_UPLOAD_BYTES_IMAGE, MAX_UPLOAD_BYTES_AUDIO, MAX_UPLOAD_BYTES_VIDEO) + _MULTIPART_OVERHEAD
+
+    # --- Per file (called as soon as its part headers arrive) ---
+
+    def limit_upload(self, upload, archive: bool = False):
+        """Sets the size limit of an incoming file."""
+        upload.max_bytes = MAX_UPLOAD_BYTES_ARCHIVE if archive else max_upload_bytes(upload.content_type)
+        upload.on_too_large = self._count_too_large
+
+    def admit_upload(self, upload):
+        """
+        For /verify: sets the size limit and rejects the file with a 503
+        before its body is read if its detector can't queue it anyway.
+        """
+        self.limit_upload(upload)
+        kind = media_kind(upload.content_type)
+        if kind is not None:
+            self.gates[kind].reject_if_full()
+
+    def _count_too_large(self):
+        self.rejected_too_large += 1
+
+    # --- Inference ---
+
+    def slot(self, kind: str):
+        """Async context manager holding one detection slot of `kind`."""
+        return self.gates[kind].slot()
+
+    def stats(self) -> dict:
+        return {
+            "rejected_too_large": self.rejected_too_large,
+            "max_upload_bytes": {
+                "image": MAX_UPLOAD_BYTES_IMAGE,
+                "audio": MAX_UPLOAD_BYTES_AUDIO,
+                "video": MAX_UPLOAD_BYTES_VIDEO,
+                "archive": MAX_UPLOAD_BYTES_ARCHIVE,
+            },
+            "gates": {kind: gate.stats() for kind, gate in self.gates.items()},
+            "rate_limit": self.buckets.stats() if self.buckets is not None else None,
+        }
+
+
+# --- Global admission control (Initialized once) ---
+ADMISSION = Admission()
@@ -1,60 +1,321 @@
 # file: ai_detector.py
-from transformers import pipeline
 from PIL import Image
-from typing import Tuple
+from typing import Dict, List, Optional, Tuple
+from concurrent.futures import Future
 import os
+import threading
+import time
 
-# This line initializes the AI pipeline.
-# It will automatically download the model on the first run.
-print("Loading AI deepfake detection model...")
+import numpy as np
+
+from inference_batcher import MicroBatcher
+from image_backends import IMAGE_BACKEND, IMAGE_MODEL_NAME, load_image_backend
+from image_preprocess import ImagePreprocessor
+from cascade import CascadeStats, check_mode, fake_score, in_band, verdict_from_score
+from instrumentation import get_logger, span
+
+logger = get_logger("ai_detector")
+
+# --- Batching config ---
+# Concurrent requests are grouped into one forward pass of up to
+# IMAGE_BATCH_MAX_SIZE images, waiting at most IMAGE_BATCH_MAX_WAIT_MS
+# for the batch to fill up.
+IMAGE_BATCH_MAX_SIZE = int(os.getenv("IMAGE_BATCH_MAX_SIZE", "16"))
+IMAGE_BATCH_MAX_WAIT_MS = float(os.getenv("IMAGE_BATCH_MAX_WAIT_MS", "10"))
+# Decode/resize/normalize with image_preprocess (1) instead of the
+# transformers image processor (0).
+IMAGE_FAST_PREPROCESS = os.getenv("IMAGE_FAST_PREPROCESS", "1") == "1"
+
+# --- Cascade config (see cascade.py) ---
+# "off":      every image goes through the model.
+# "cascade":  IMAGE_CASCADE_FIRST scores every image; images whose fake
+#             score is within [IMAGE_CASCADE_LOW, IMAGE_CASCADE_HIGH] are
+#             re-scored by the model.
+# "ensemble": like "cascade", but uncertain images get the mean score of
+#             the model and every IMAGE_ENSEMBLE_MODELS model.
+# Stages are "<backend>" (the same model on another backend, e.g. int8)
+# or "<backend>:<HuggingFace model name>".
+IMAGE_CASCADE = check_mode("IMAGE_CASCADE", os.getenv("IMAGE_CASCADE", "off"))
+IMAGE_CASCADE_FIRST = os.getenv("IMAGE_CASCADE_FIRST", "onnx-int8")
+IMAGE_CASCADE_LOW = float(os.getenv("IMAGE_CASCADE_LOW", "0.2"))
+IMAGE_CASCADE_HIGH = float(os.getenv("IMAGE_CASCADE_HIGH", "0.8"))
+IMAGE_ENSEMBLE_MODELS = [
+    spec.strip() for spec in os.getenv("IMAGE_ENSEMBLE_MODELS", "").split(",") if spec.strip()
+]
+
+# The model is loaded on first use (or by the startup warmup, see
+# startup.py), not at import, so importing this module stays cheap.
 # We are using a specific, pre-trained image classification model
-model_pipeline = pipeline(
-    "image-classification", 
-    model="dima806/deepfake_vs_real_image_detection"
+# (dima806/deepfake_vs_real_image_detection), run by the configured
+# backend: fp32 torch, int8 torch or ONNX Runtime (see image_backends.py)
+model_pipeline = None
+# None when disabled or when the model's processor isn't supported
+preprocessor: Optional[ImagePreprocessor] = None
+_image_model_lock = threading.Lock()
+
+
+class ImageStage:
+    """One model of the cascade, with the preprocessing it needs."""
+
+    def __init__(self, name: str, backend, stage_preprocessor: Optional[ImagePreprocessor]):
+        self.name = name
+        self.backend = backend
+        self.preprocessor = stage_preprocessor
+
+    @classmethod
+    def load(cls, spec: str) -> "ImageStage":
+        """A stage from "<backend>" or "<backend>:<model name>"."""
+        backend_name, _, model_name = spec.partition(":")
+        logger.info("Loading cascade stage %s...", spec)
+        backend = load_image_backend(backend_name, model_name or IMAGE_MODEL_NAME)
+        stage_preprocessor = (
+            ImagePreprocessor.from_processor(backend.image_processor)
+            if IMAGE_FAST_PREPROCESS and getattr(backend, "image_processor", None) is not None
+            else None
+        )
+        return cls(spec, backend, stage_preprocessor)
+
+    def fake_scores(self, items: list) -> List[float]:
+        """Fake scores of images prepared by _prepare_image."""
+        if self.preprocessor is not None:
+            if not _same_input_size(self.preprocessor, preprocessor):
+                items = [self.preprocessor.resize(_as_image(item)) for item in items]
+            batch_results = self.backend.predict_pixels(self.preprocessor.to_batch(items))
+        else:
+            batch_results = self.backend([_as_image(item) for item in items], batch_size=len(items))
+        return [fake_score(results) for results in batch_results]
+
+
+def _same_input_size(a: Optional[ImagePreprocessor], b: Optional[ImagePreprocessor]) -> bool:
+    return a is not None and b is not None and (a.height, a.width) == (b.height, b.width)
+
+
+def _as_image(item) -> Image.Image:
+    # Prepared items are uint8 arrays on the fast path, PIL images otherwise
+    return Image.fromarray(item) if isinstance(item, np.ndarray) else item
+
+
+# The cascade's full stage is the model itself; set once it is loaded
+full_stage: Optional[ImageStage] = None
+first_stage: Optional[ImageStage] = None
+ensemble_stages: List[ImageStage] = []
+
+
+def load_image_model():
+    """
+    Loads the image model (and the cascade stages, if on) the first
+    time it is called; later calls return at once.
+    """
+    global model_pipeline, preprocessor, full_stage
+    if full_stage is not None:
+        return
+    with _image_model_lock:
+        if full_stage is not None:
+            return
+        # It will automatically download the model on the first run.
+        logger.info("Loading AI deepfake detection model (%s backend)...", IMAGE_BACKEND)
+        model_pipeline = load_image_backend(IMAGE_BACKEND)
+        preprocessor = (
+            ImagePreprocessor.from_processor(model_pipeline.image_processor)
+            if IMAGE_FAST_PREPROCESS and getattr(model_pipeline, "image_processor", None) is not None
+            else None
+        )
+        if IMAGE_FAST_PREPROCESS and preprocessor is None:
+            logger.info("Fast image preprocessing not available for this model, using the pipeline's")
+        if IMAGE_CASCADE != "off":
+            _load_cascade_stages()
+            if IMAGE_CASCADE == "ensemble" and not ensemble_stages:
+                logger.warning("IMAGE_CASCADE=ensemble without IMAGE_ENSEMBLE_MODELS; escalating to the model alone")
+        # Set last: other threads only use the model once this is set
+        full_stage = ImageStage(f"{IMAGE_BACKEND}:{IMAGE_MODEL_NAME}", model_pipeline, preprocessor)
+        logger.info("AI Model loaded successfully.")
+
+
+def image_model_loaded() -> bool:
+    return full_stage is not None
+
+
+def _load_cascade_stages():
+    global first_stage, ensemble_stages
+    if first_stage is None:
+        first_stage = ImageStage.load(IMAGE_CASCADE_FIRST)
+        ensemble_stages = [ImageStage.load(spec) for spec in IMAGE_ENSEMBLE_MODELS]
+
+
+cascade_stats = CascadeStats("image", IMAGE_CASCADE, (IMAGE_CASCADE_LOW, IMAGE_CASCADE_HIGH))
+
+def _verdict_from_results(results) -> Tuple[bool, int]:
+    """Turns one image's pipeline output into (is_fake, confidence_percent)."""
+    # The model's output looks like:
+    # [{'label': 'real', 'score': 0.99}, {'label': 'fake', 'score': 0.01}]
+    # We need to find the label with the highest score.
+    best_result = sorted(results, key=lambda x: x['score'], reverse=True)[0]
+
+    label = best_result['label']
+    confidence = best_result['score']
+
+    # Convert confidence (0.0 to 1.0) to a percentage (0 to 100)
+    confidence_percent = int(confidence * 100)
+
+    if label.lower() == 'fake':
+        # It's a fake!
+        return (True, confidence_percent)
+    else:
+        # It's real!
+        return (False, confidence_percent)
+
+
+def _detect_prepared_batch(items: list) -> List[Tuple[bool, int]]:
+    """
+    Runs ONE batched forward pass over images prepared by _prepare_image:
+    resized uint8 arrays (fast path) or opened PIL images.
+    """
+    load_image_model()
+    if IMAGE_CASCADE != "off":
+        return _detect_cascade_batch(items)
+    if preprocessor is not None:
+        with span("image_normalize"):
+            pixel_values = preprocessor.to_batch(items)
+        with span("image_model_forward"):
+            batch_results = model_pipeline.predict_pixels(pixel_values)
+    else:
+        with span("image_model_forward"):
+            batch_results = model_pipeline(items, batch_size=len(items))
+    return [_verdict_from_results(results) for results in batch_results]
+
+
+def _detect_cascade_batch(items: list) -> List[Tuple[bool, int]]:
+    """
+    The cascade over one batch: the first stage scores every image, the
+    final stage(s) only the uncertain ones (still as one batch).
+    """
+    band = (IMAGE_CASCADE_LOW, IMAGE_CASCADE_HIGH)
+    with span("image_cascade_first"), cascade_stats.stage("first", len(items)):
+        scores = first_stage.fake_scores(items)
+
+    uncertain = [i for (i, score) in enumerate(scores) if in_band(score, band)]
+    cascade_stats.record_routing(len(items), len(uncertain))
+    if uncertain:
+        escalated = [items[i] for i in uncertain]
+        finals = [full_stage] + (ensemble_stages if IMAGE_CASCADE == "ensemble" else [])
+        totals = [0.0] * len(uncertain)
+        with span("image_cascade_escalate"):
+            for (index, stage) in enumerate(finals):
+                name = "full" if index == 0 else f"ensemble:{stage.name}"
+                with cascade_stats.stage(name, len(escalated)):
+                    for (j, score) in enumerate(stage.fake_scores(escalated)):
+                        totals[j] += score
+        for (j, i) in enumerate(uncertain):
+            scores[i] = totals[j] / len(finals)
+    return [verdict_from_score(score) for score in scores]
+
+
+def cascade_stage_scores(paths: List[str], batch_size: int = 16) -> Dict[str, Tuple[List[float], float]]:
+    """
+    Every stage's fake score for every image, plus the model time each
+    stage took in total (for `python cascade.py`).
+    """
+    load_image_model()
+    _load_cascade_stages()
+    stages = {"first": first_stage, "full": full_stage}
+    stages.update((f"ensemble:{stage.name}", stage) for stage in ensemble_stages)
+    measured = {name: ([], 0.0) for name in stages}
+    for start in range(0, len(paths), batch_size):
+        items = [_prepare_image(path) for path in paths[start:start + batch_size]]
+        for (name, stage) in stages.items():
+            started = time.perf_counter()
+            scores = stage.fake_scores(items)
+            elapsed = time.perf_counter() - started
+            measured[name] = (measured[name][0] + scores, measured[name][1] + elapsed)
+    return measured
+
+
+def _prepare_image(image_path):
+    """Decodes one image for _detect_prepared_batch."""
+    # The first request(s) wait here while the model loads
+    load_image_model()
+    if preprocessor is not None:
+        # Reduced-size JPEG decode + resize, straight to the model's size
+        return preprocessor.load(image_path)
+    return Image.open(image_path).convert("RGB")
+
+
+def detect_deepfake_batch(images: List[Image.Image]) -> List[Tuple[bool, int]]:
+    """
+    Runs ONE batched forward pass over several already-opened images.
+
+    Returns one (is_fake, confidence_percent) tuple per image, in order.
+    """
+    load_image_model()
+    if preprocessor is not None:
+        return _detect_prepared_batch([preprocessor.resize(img) for img in images])
+    return _detect_prepared_batch(images)
+
+
+# Shared scheduler in front of model_pipeline. Every caller of
+# detect_deepfake() goes through it, so concurrent requests share batches.
+image_batcher = MicroBatcher(
+    _detect_prepared_batch,
+    max_batch_size=IMAGE_BATCH_MAX_SIZE,
+    max_wait_ms=IMAGE_BATCH_MAX_WAIT_MS,
+    name="image",
 )
-print("AI Model loaded successfully.")
+
+
+def submit_image(img: Image.Image) -> Future:
+    """
+    Queues an already-opened image (e.g. a video frame) on the shared
+    batcher. The Future resolves to (is_fake, confidence_percent).
+    """
+    load_image_model()
+    if preprocessor is not None:
+        return image_batcher.submit(preprocessor.resize(img))
+    return image_batcher.submit(img.convert("RGB"))
+
+
+def get_batcher_stats() -> dict:
+    """Queue-depth and batch-size stats of the image batcher."""
+    return image_batcher.stats()
+
+
+def warmup():
+    """Loads the model and runs one dummy image through it (startup.py)."""
+    load_image_model()
+    img = Image.new("RGB", (224, 224), color="gray")
+    # Through the batcher, which owns the model while it runs
+    image_batcher.infer(preprocessor.resize(img) if preprocessor is not None else img)
+
+
+def get_cascade_stats() -> dict:
+    """Per-stage cost and escalation rate of the image cascade."""
+    return cascade_stats.stats()
+
 
 def detect_deepfake(image_path: str) -> Tuple[bool, int]:
     """
     Analyzes a given image file and returns a deepfake verdict.
 
     Args:
-        image_path (str): The file path to the image.
+        image_path (str): The file path to the image (or a binary
+            file-like object holding it, e.g. an in-memory upload).
 
     Returns:
         A tuple (is_fake, confidence_percent):
         - is_fake (bool): True if the image is a deepfake, False otherwise.
         - confidence_percent (int): The model's confidence (0-100).
-    """
-    try:
-        # Open the image using PIL (Python Imaging Library)
-        img = Image.open(image_path)
-
-        # Run the AI model on the image
-        results = model_pipeline(img)
-
-        # The model's output looks like:
-        # [{'label': 'real', 'score': 0.99}, {'label': 'fake', 'score': 0.01}]
-        # We need to find the label with the highest score.
-        best_result = sorted(results, key=lambda x: x['score'], reverse=True)[0]
-
-        label = best_result['label']
-        confidence = best_result['score']
 
-        # Convert confidence (0.0 to 1.0) to a percentage (0 to 100)
-        confidence_percent = int(confidence * 100)
-
-        if label.lower() == 'fake':
-            # It's a fake!
-            return (True, confidence_percent)
-        else:
-            # It's real!
-            return (False, confidence_percent)
+    Raises if the image can't be decoded or the model fails. There is no
+    "safe" default verdict: it would be cached and registered on chain.
+    """
+    # Open and decode the image in the caller's thread, so decoding
+    # of concurrent requests happens in parallel.
+    with span("image_decode"):
+        img = _prepare_image(image_path)
 
-    except Exception as e:
-        print(f"Error during AI detection: {e}")
-        # In case of an error, we'll default to a safe verdict
-        return (False, 0)
+    # Run the AI model on the image (batched with other requests).
+    # This span covers the wait for a batch slot plus the forward pass.
+    with span("image_batch"):
+        return image_batcher.infer(img)
 
 # --- This block lets us test the file directly ---
 if __name__ == "__main__":
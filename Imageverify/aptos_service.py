@@ -1,8 +1,11 @@
 # file: aptos_service.py
 import os
 import asyncio
+import json
+from datetime import datetime
+from typing import List, Tuple
 from aptos_sdk.account import Account, AccountAddress
-from aptos_sdk.async_client import RestClient, ClientConfig
+from aptos_sdk.async_client import RestClient
 from aptos_sdk.bcs import Serializer
 from aptos_sdk.transactions import (
     EntryFunction,
@@ -11,6 +14,12 @@ from aptos_sdk.transactions import (
     TransactionArgument,
 )
 
+from tx_pipeline import TransactionPipeline
+from chain_transport import FinalityWatcher, ViewCoalescer, make_client, transport_config
+from instrumentation import get_logger, span
+
+logger = get_logger("aptos_service")
+
 # --- ------------------- ---
 # --- CRITICAL CONFIG ---
 # --- ------------------- ---
@@ -23,30 +32,91 @@ ORACLE_PRIVATE_KEY_STR = "ed25519-priv-0x194e267c714fd81ee85cdb8474bb6663291d9ca
 # --- ------------------- ---
 
 # --- Constants ---
-NODE_URL = "https://fullnode.testnet.aptoslabs.com/v1" # Aptos Testnet
+# Aptos Testnet by default; point it at a local node for testing
+NODE_URL = os.getenv("APTOS_NODE_URL", "https://fullnode.testnet.aptoslabs.com/v1")
+
+# Extra oracle signers (comma-separated private keys). Transactions are
+# spread over ORACLE_ACCOUNT plus these, so submission throughput scales
+# with the number of signers. Each account must exist and hold gas.
+EXTRA_ORACLE_PRIVATE_KEYS = [
+    key.strip() for key in os.getenv("ORACLE_PRIVATE_KEYS", "").split(",") if key.strip()
+]
+# Unconfirmed transactions allowed per signer at the same time.
+TX_MAX_IN_FLIGHT_PER_SIGNER = int(os.getenv("TX_MAX_IN_FLIGHT_PER_SIGNER", "8"))
 
 # --- Global Clients (Initialized once) ---
 try:
     MODULE_ADDRESS = AccountAddress.from_str_relaxed(MODULE_ADDRESS_STR)
     ORACLE_ACCOUNT = Account.load_key(ORACLE_PRIVATE_KEY_STR)
-    CLIENT = RestClient(NODE_URL, ClientConfig())
-    print("Aptos Service Loaded.")
-    print(f"Connecting to node: {NODE_URL}")
-    print(f"Using Oracle Address: {ORACLE_ACCOUNT.address()}")
+    ORACLE_ACCOUNTS = [ORACLE_ACCOUNT] + [
+        Account.load_key(key) for key in EXTRA_ORACLE_PRIVATE_KEYS
+        if key != ORACLE_PRIVATE_KEY_STR
+    ]
+    # Created on first use (see get_client), so importing this module
+    # opens no connection
+    CLIENT = None
+    # These look CLIENT up on every call, so tests can swap it for a stub
+    # One polling loop confirms every pending transaction
+    FINALITY_WATCHER = FinalityWatcher(lambda: get_client())
+    # Identical concurrent view calls share one request
+    VIEWS = ViewCoalescer(lambda: get_client())
+    TX_PIPELINE = TransactionPipeline(
+        lambda: get_client(), ORACLE_ACCOUNTS,
+        max_in_flight_per_signer=TX_MAX_IN_FLIGHT_PER_SIGNER,
+        watcher=FINALITY_WATCHER,
+    )
+    logger.info("Aptos Service Loaded.")
+    logger.info("Using node: %s", NODE_URL)
+    logger.info("Using Oracle Address: %s", ORACLE_ACCOUNT.address())
+    if len(ORACLE_ACCOUNTS) > 1:
+        logger.info("Using %d oracle signers", len(ORACLE_ACCOUNTS))
 except Exception as e:
+    # Printed directly: the process exits before a queued log record would be written
     print(f"ERROR: Failed to initialize Aptos Service. Check your private key and address.")
     print(f"Details: {e}")
     # We exit here because the server can't run without this.
     exit(1)
 
 
-async def register_verdict_on_chain(image_hash: bytes, is_fake: bool, confidence: int) -> str:
+def get_client() -> RestClient:
+    """The shared REST client (pooled, see chain_transport.py), created on first use."""
+    global CLIENT
+    if CLIENT is None:
+        CLIENT = make_client(NODE_URL)
+    return CLIENT
+
+
+async def close_client():
+    """Stops the finality watcher and closes the node connections."""
+    global CLIENT
+    await FINALITY_WATCHER.stop()
+    client, CLIENT = CLIENT, None
+    if client is not None:
+        await client.close()
+
+
+def transport_stats() -> dict:
+    return {
+        **transport_config(),
+        "finality_watcher": FINALITY_WATCHER.stats(),
+        "views": VIEWS.stats(),
+    }
+
+
+async def check_node() -> dict:
     """
-    Submits the AI verdict to the Aptos smart contract.
-    Returns the transaction hash.
+    Ledger info of the node (its chain id, version, ...). Raises if the
+    node can't be reached; used by the readiness probe.
     """
+    client = get_client()
+    response = await client.client.get(client.base_url)
+    response.raise_for_status()
+    return response.json()
 
-    # 1. Build the transaction payload using TransactionArgument
+
+def _register_verdict_payload(image_hash: bytes, is_fake: bool, confidence: int) -> TransactionPayload:
+    """Builds the payload of one 'register_verdict' call."""
+    # Build the transaction payload using TransactionArgument
     transaction_args = [
         TransactionArgument(image_hash, Serializer.to_bytes),
         TransactionArgument(is_fake, Serializer.bool),
@@ -59,85 +129,144 @@ async def register_verdict_on_chain(image_hash: bytes, is_fake: bool, confidence
         [],                                     # Type arguments (none for this function)
         transaction_args,
     )
+    return TransactionPayload(payload)
 
-    # 2. Create and submit the signed transaction
-    try:
-        print("Creating and signing transaction...")
-        signed_tx = await CLIENT.create_bcs_signed_transaction(
-            ORACLE_ACCOUNT,
-            TransactionPayload(payload),
+
+def _register_verdicts_batch_payload(entries: List[Tuple[bytes, bool, int]]) -> TransactionPayload:
+    """Builds the payload of one 'register_verdicts_batch' call."""
+    hashes = [image_hash for (image_hash, _, _) in entries]
+    fakes = [bool(is_fake) for (_, is_fake, _) in entries]
+    confidences = bytes(int(confidence) for (_, _, confidence) in entries)
+
+    transaction_args = [
+        TransactionArgument(hashes, Serializer.sequence_serializer(Serializer.to_bytes)),
+        TransactionArgument(fakes, Serializer.sequence_serializer(Serializer.bool)),
+        # vector<u8> is serialized exactly like a byte string
+        TransactionArgument(confidences, Serializer.to_bytes),
+    ]
+
+    payload = EntryFunction.natural(
+        f"{MODULE_ADDRESS_STR}::image_verifier",
+        "register_verdicts_batch",
+        [],
+        transaction_args,
+    )
+    return TransactionPayload(payload)
+
+
+async def submit_verdict(image_hash: bytes, is_fake: bool, confidence: int) -> str:
+    """
+    Signs and submits a 'register_verdict' transaction WITHOUT waiting for it
+    to be finalized. Returns the transaction hash.
+    """
+    with span("chain_submit"):
+        tx_hash = await TX_PIPELINE.submit(
+            _register_verdict_payload(image_hash, is_fake, confidence)
         )
-        
-        print("Submitting transaction...")
-        tx_hash = await CLIENT.submit_bcs_transaction(signed_tx)
-        print(f"Transaction submitted with hash: {tx_hash}")
+    logger.info("Transaction submitted with hash: %s", tx_hash)
+    return tx_hash
+
+
+async def submit_verdicts_batch(entries: List[Tuple[bytes, bool, int]]) -> str:
+    """
+    Signs and submits ONE 'register_verdicts_batch' transaction for many
+    (image_hash, is_fake, confidence) entries, without waiting for it to be
+    finalized. Hashes already on chain are skipped by the contract.
+    Returns the transaction hash.
+    """
+    with span("chain_submit"):
+        tx_hash = await TX_PIPELINE.submit(_register_verdicts_batch_payload(entries))
+    logger.info("Batch transaction for %d verdict(s) submitted with hash: %s", len(entries), tx_hash)
+    return tx_hash
+
+
+async def wait_for_finality(tx_hash: str) -> dict:
+    """
+    Waits until a submitted transaction is committed; raises if it failed.
+    Also frees the signer's in-flight slot in the transaction pipeline.
+    Returns the committed transaction as the node reports it.
+    """
+    with span("chain_finality_wait"):
+        tx = await TX_PIPELINE.wait(tx_hash)
+    logger.info("Transaction finalized: %s", tx_hash)
+    return tx
+
+
+def is_already_registered_error(error: Exception) -> bool:
+    """True if the chain rejected a verdict because the hash already has one."""
+    error_string = str(error)
+    if "E_VERDICT_ALREADY_EXISTS" in error_string:
+        return True
+    # Without the error description the abort shows up as a raw code
+    return "image_verifier" in error_string and "ABORTED" in error_string and "0x1" in error_string
+
+
+async def register_verdict_on_chain(image_hash: bytes, is_fake: bool, confidence: int) -> str:
+    """
+    Submits the AI verdict to the Aptos smart contract.
+    Returns the transaction hash.
+    """
+    try:
+        tx_hash = await submit_verdict(image_hash, is_fake, confidence)
 
         # Wait for the transaction to be finalized
-        await CLIENT.wait_for_transaction(tx_hash) 
-        print(f"Transaction finalized!")
+        await wait_for_finality(tx_hash)
         return tx_hash
     except Exception as e:
-        print(f"Error submitting transaction: {e}")
+        logger.error("Error submitting transaction: %s", e)
         raise Exception(f"Transaction failed. Error: {e}")
     
-# file: aptos_service.py
-# ... all your other imports and code ...
+def format_verified_at(verified_at: int) -> str:
+    """On-chain Unix timestamp -> the readable string our API returns."""
+    return datetime.fromtimestamp(int(verified_at)).strftime('%Y-%m-%d %H:%M:%S')
+
 
 async def get_verdict_from_chain(image_hash_hex: str) -> dict:
     """
     Calls the 'get_verdict' view function on the smart contract.
     Returns the on-chain data.
     """
-    print(f"Checking hash on-chain: {image_hash_hex}")
+    logger.debug("Checking hash on-chain: %s", image_hash_hex)
     
     try:
-        # 1. Convert hex string back to raw bytes
+        # 1. Check it's a valid hex string (the view takes it as "0x...")
         image_hash_bytes = bytes.fromhex(image_hash_hex)
         
-        # 2. Define the view function payload
-        payload = {
-            "function": f"{MODULE_ADDRESS_STR}::image_verifier::get_verdict",
-            "type_arguments": [],
-            "arguments": [
-                Serializer.to_bytes(image_hash_bytes),
-            ],
-        }
-
-        # 3. Call the view function
-        # Note: client.view() is synchronous, so we run it in an executor
-        # to avoid blocking the async server.
-        # (This is an advanced, but correct, way to handle this)
-        import asyncio
-        loop = asyncio.get_event_loop()
-        result = await loop.run_in_executor(None, CLIENT.view, payload)
+        # 2. Call the view function.
+        # RestClient is async (httpx), so we simply await it; concurrent
+        # calls for the same hash share one request.
+        with span("chain_view"):
+            raw_result = await VIEWS.view(
+                f"{MODULE_ADDRESS_STR}::image_verifier::get_verdict",
+                [],
+                ["0x" + image_hash_bytes.hex()],
+            )
+        result = json.loads(raw_result) if isinstance(raw_result, (bytes, str)) else raw_result
         
-        # 4. Decode the result
+        # 3. Decode the result
         # The result from a view function is a simple JSON list
         # based on our return types: (bool, u8, address, u64)
         is_fake = result[0]
-        confidence = result[1]
+        confidence = int(result[1])
         verified_by = result[2]
-        verified_at = result[3] # This is a Unix timestamp
-
-        # Convert timestamp to a readable string
-        from datetime import datetime
-        verified_at_str = datetime.fromtimestamp(verified_at).strftime('%Y-%m-%d %H:%M:%S')
+        verified_at = int(result[3]) # This is a Unix timestamp (u64 comes back as a string)
 
         return {
             "found": True,
             "is_deepfake": is_fake,
             "confidence": confidence,
             "verified_by": verified_by,
-            "verified_at": verified_at_str
+            "verified_at": format_verified_at(verified_at),
+            "verified_at_unix": verified_at,
         }
 
     except Exception as e:
         error_string = str(e)
-        # This is the error Aptos throws when a resource is not found
+        # get_verdict aborts with E_VERDICT_ALREADY_EXISTS when the hash is unknown
         if "E_VERDICT_ALREADY_EXISTS" in error_string or "Resource not found" in error_string:
-             print("Hash not found on chain.")
+             logger.debug("Hash not found on chain: %s", image_hash_hex)
              return {"found": False}
         
         # Handle other errors
-        print(f"Error checking hash: {e}")
-        raise e
\ No newline at end of file
+        logger.error("Error checking hash: %s", e)
+        raise e
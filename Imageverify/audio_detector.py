@@ -1,19 +1,82 @@
 # file: audio_detector.py
-from transformers import pipeline
+# transformers (and torch) and librosa are imported where they are first
+# needed, so importing this module is cheap.
 import os
+import threading
+import time
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+import numpy as np
 import soundfile
-import librosa
+import soxr
+
+from cascade import CascadeStats, check_mode, in_band
+from instrumentation import get_logger, span
+
+logger = get_logger("audio_detector")
+
+# --- Streaming / windowing config ---
+# The model works on 16 kHz mono audio.
+AUDIO_SAMPLE_RATE = 16000
+# Long files are scored as overlapping windows of AUDIO_WINDOW_S seconds,
+# one every AUDIO_HOP_S seconds, AUDIO_WINDOW_BATCH windows per model call.
+AUDIO_WINDOW_S = float(os.getenv("AUDIO_WINDOW_S", "4"))
+AUDIO_HOP_S = float(os.getenv("AUDIO_HOP_S", "2"))
+AUDIO_WINDOW_BATCH = int(os.getenv("AUDIO_WINDOW_BATCH", "8"))
+# Seconds of audio decoded (and resampled) per read.
+AUDIO_BLOCK_S = float(os.getenv("AUDIO_BLOCK_S", "10"))
+# Early exit: stop reading once at least AUDIO_EARLY_EXIT_MIN_WINDOWS
+# windows are scored and their mean spoof score is beyond
+# AUDIO_EARLY_EXIT_CONFIDENCE (or below 1 - it).
+AUDIO_EARLY_EXIT = os.getenv("AUDIO_EARLY_EXIT", "0") == "1"
+AUDIO_EARLY_EXIT_MIN_WINDOWS = int(os.getenv("AUDIO_EARLY_EXIT_MIN_WINDOWS", "8"))
+AUDIO_EARLY_EXIT_CONFIDENCE = float(os.getenv("AUDIO_EARLY_EXIT_CONFIDENCE", "0.9"))
+
+# --- Cascade config (see cascade.py) ---
+# "off":      every window goes through the model.
+# "cascade":  a cheap first pass scores NON-overlapping windows, with
+#             AUDIO_CASCADE_FIRST_MODEL (default: the model itself). Only
+#             files whose spoof score is within [AUDIO_CASCADE_LOW,
+#             AUDIO_CASCADE_HIGH] get the full overlapping pass, which
+#             reuses the first pass's windows when it used the same model.
+# "ensemble": like "cascade", but the full pass averages the model with
+#             every AUDIO_ENSEMBLE_MODELS model.
+AUDIO_CASCADE = check_mode("AUDIO_CASCADE", os.getenv("AUDIO_CASCADE", "off"))
+AUDIO_CASCADE_FIRST_MODEL = os.getenv("AUDIO_CASCADE_FIRST_MODEL", "")
+AUDIO_CASCADE_LOW = float(os.getenv("AUDIO_CASCADE_LOW", "0.2"))
+AUDIO_CASCADE_HIGH = float(os.getenv("AUDIO_CASCADE_HIGH", "0.8"))
+AUDIO_ENSEMBLE_MODELS = [
+    name.strip() for name in os.getenv("AUDIO_ENSEMBLE_MODELS", "").split(",") if name.strip()
+]
+
+# Labels that mean "synthetic" ('spoof' for this model)
+_SPOOF_LABELS = {"spoof", "fake"}
+# A tail shorter than this after the last full window isn't scored on its own
+_MIN_TAIL_S = 0.5
 
 # Lazy loading: Model will be loaded on first use
 audio_pipeline = None
+# Audio runs on a pool of worker threads; only the first one loads the model
+_audio_model_lock = threading.Lock()
+# Cascade / ensemble models, by name
+_extra_audio_pipelines: Dict[str, object] = {}
+
+cascade_stats = CascadeStats("audio", AUDIO_CASCADE, (AUDIO_CASCADE_LOW, AUDIO_CASCADE_HIGH))
 
 def _load_audio_model():
     """Load the audio detection model lazily."""
     global audio_pipeline
     if audio_pipeline is not None:
         return audio_pipeline
-    
-    print("Loading AI audio deepfake model... (This may take a moment)")
+    with _audio_model_lock:
+        if audio_pipeline is not None:
+            return audio_pipeline
+        return _load_audio_model_locked()
+
+def _load_audio_model_locked():
+    """Does the actual loading; caller holds _audio_model_lock."""
+    global audio_pipeline
+    from transformers import pipeline
+    logger.info("Loading AI audio deepfake model... (This may take a moment)")
     # Try alternative models if the primary one fails
     # Note: These models need to be publicly available on HuggingFace
     model_options = [
@@ -26,10 +89,10 @@ def _load_audio_model():
                 "audio-classification",
                 model=model_name
             )
-            print(f"AI Audio Model loaded successfully: {model_name}")
+            logger.info("AI Audio Model loaded successfully: %s", model_name)
             return audio_pipeline
         except Exception as e:
-            print(f"Failed to load model {model_name}: {e}")
+            logger.error("Failed to load model %s: %s", model_name, e)
             if model_name == model_options[-1]:
                 # Last model failed, raise the error with helpful message
                 raise Exception(
@@ -42,47 +105,299 @@ def _load_audio_model():
                 )
     return audio_pipeline
 
+def _load_extra_audio_model(model_name: str):
+    """Loads a cascade / ensemble model lazily (once)."""
+    with _audio_model_lock:
+        if model_name not in _extra_audio_pipelines:
+            from transformers import pipeline
+            logger.info("Loading audio cascade model %s...", model_name)
+            _extra_audio_pipelines[model_name] = pipeline("audio-classification", model=model_name)
+        return _extra_audio_pipelines[model_name]
+
+def iter_audio_blocks(source) -> Iterator[np.ndarray]:
+    """
+    Yields the audio as consecutive 16 kHz mono float32 blocks, decoding
+    and resampling AUDIO_BLOCK_S seconds at a time, so memory use doesn't
+    depend on the file's length.
+    """
+    try:
+        sound = soundfile.SoundFile(source)
+    except Exception:
+        # Formats libsndfile can't read (e.g. m4a) are decoded by librosa
+        # in one go; only these aren't streamed.
+        import librosa
+        if hasattr(source, "seek"):
+            source.seek(0)
+        speech, _ = librosa.load(source, sr=AUDIO_SAMPLE_RATE)
+        yield speech.astype(np.float32, copy=False)
+        return
+
+    with sound:
+        resampler = None
+        if sound.samplerate != AUDIO_SAMPLE_RATE:
+            resampler = soxr.ResampleStream(sound.samplerate, AUDIO_SAMPLE_RATE, 1, dtype="float32")
+        blocksize = max(1, int(AUDIO_BLOCK_S * sound.samplerate))
+        for block in sound.blocks(blocksize=blocksize, dtype="float32", always_2d=True):
+            mono = block.mean(axis=1, dtype=np.float32)
+            if resampler is not None:
+                mono = resampler.resample_chunk(mono)
+            if len(mono):
+                yield mono
+        if resampler is not None:
+            # Flush the resampler's delay line
+            tail = resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True)
+            if len(tail):
+                yield tail
+
+
+def _iter_windows(blocks: Iterator[np.ndarray], window: int, hop: int) -> Iterator[Tuple[int, np.ndarray]]:
+    """
+    Cuts a stream of sample blocks into overlapping windows. Yields
+    (start_sample, samples); only the not-yet-scored part of the audio is
+    kept in memory.
+    """
+    buffer = np.zeros(0, dtype=np.float32)
+    offset = 0      # Sample index of buffer[0]
+    covered = 0     # Everything before this sample is in a yielded window
+    for block in blocks:
+        buffer = np.concatenate((buffer, block))
+        while len(buffer) >= window:
+            yield offset, buffer[:window]
+            covered = offset + window
+            buffer = buffer[hop:]
+            offset += hop
+
+    # The end of the file after the last full window (or a file shorter
+    # than one window) is scored as one shorter window.
+    end = offset + len(buffer)
+    if len(buffer) and (covered == 0 or end - covered >= _MIN_TAIL_S * AUDIO_SAMPLE_RATE):
+        yield offset, buffer
+
+
+def _spoof_score(results: list) -> float:
+    """Probability of the 'spoof' label in one window's pipeline output."""
+    # The output looks like:
+    # [{'label': 'bonafide', 'score': 0.99}, {'label': 'spoof', 'score': 0.01}]
+    for result in results:
+        if result['label'].lower() in _SPOOF_LABELS:
+            return float(result['score'])
+    return 0.0
+
+
+def analyze_audio(file_path) -> dict:
+    """
+    Scores an audio file window by window and aggregates the windows into
+    one verdict. `file_path` may also be a binary file-like object.
+    See analyze_audio_blocks for the result.
+    """
+    def open_blocks():
+        if hasattr(file_path, "seek"):
+            file_path.seek(0)
+        return iter_audio_blocks(file_path)
+
+    return analyze_audio_stream(open_blocks)
+
+
+def analyze_audio_stream(open_blocks: Callable[[], Iterator[np.ndarray]]) -> dict:
+    """
+    Like analyze_audio_blocks, for audio that can be read more than once
+    (each open_blocks() call starts a new block stream), so that it can go
+    through the cascade when AUDIO_CASCADE is on.
+    """
+    if AUDIO_CASCADE == "off":
+        return analyze_audio_blocks(open_blocks())
+
+    window = max(1, int(AUDIO_WINDOW_S * AUDIO_SAMPLE_RATE))
+    first_pipeline = (
+        _load_extra_audio_model(AUDIO_CASCADE_FIRST_MODEL) if AUDIO_CASCADE_FIRST_MODEL
+        else _load_audio_model()
+    )
+    with span("audio_cascade_first"), cascade_stats.stage("first", 1):
+        probe, probe_early_exit = _score_windows(open_blocks(), [first_pipeline], hop=window)
+    if not probe:
+        raise ValueError("The audio file contains no samples.")
+
+    escalate = in_band(sum(score for (_, _, score) in probe) / len(probe),
+                       (AUDIO_CASCADE_LOW, AUDIO_CASCADE_HIGH))
+    cascade_stats.record_routing(1, int(escalate))
+    if not escalate:
+        return _audio_verdict(probe, probe_early_exit)
+
+    pipelines = [_load_audio_model()]
+    if AUDIO_CASCADE == "ensemble":
+        pipelines += [_load_extra_audio_model(name) for name in AUDIO_ENSEMBLE_MODELS]
+    # The probe's windows are a subset of the full pass's when hop divides
+    # the window, so the model doesn't score them twice
+    known = {} if AUDIO_CASCADE_FIRST_MODEL else {start: score for (start, _, score) in probe}
+    with span("audio_cascade_escalate"), cascade_stats.stage("escalated", 1):
+        windows, early_exit = _score_windows(open_blocks(), pipelines, known=known)
+    return _audio_verdict(windows, early_exit)
+
+
+def analyze_audio_blocks(blocks: Iterator[np.ndarray]) -> dict:
+    """
+    Scores a stream of 16 kHz mono float32 sample blocks (e.g. from
+    iter_audio_blocks, or a video's audio track) window by window.
+
+    Returns a dict with:
+        - is_fake (bool) / confidence (int, 0-100): the file-level verdict,
+          from the mean spoof score of all scored windows.
+        - segments: one {"start_s", "end_s", "spoof_score"} per window.
+        - early_exit (bool): True if scoring stopped before the end of the
+          file because the verdict was already clear.
+    """
+    windows, early_exit = _score_windows(blocks, [_load_audio_model()])
+    return _audio_verdict(windows, early_exit)
+
+
+def _score_windows(blocks: Iterator[np.ndarray], pipelines: list, hop: Optional[int] = None,
+                   known: Optional[Dict[int, float]] = None) -> Tuple[List[Tuple[int, int, float]], bool]:
+    """
+    Cuts a block stream into windows and scores them in batches. A
+    window's score is the mean spoof score of all `pipelines`; `known`
+    holds already computed scores of the first pipeline, by start sample.
+
+    Returns ([(start_sample, length, score)], early_exit).
+    """
+    window = max(1, int(AUDIO_WINDOW_S * AUDIO_SAMPLE_RATE))
+    if hop is None:
+        hop = min(window, max(1, int(AUDIO_HOP_S * AUDIO_SAMPLE_RATE)))
+    known = known or {}
+
+    scored: List[Tuple[int, int, float]] = []
+    score_total = 0.0
+    early_exit = False
+    pending: List[Tuple[int, np.ndarray]] = []
+
+    def score_pending():
+        nonlocal score_total
+        totals = [0.0] * len(pending)
+        for (index, pipe) in enumerate(pipelines):
+            todo = [
+                i for (i, (start, samples)) in enumerate(pending)
+                if not (index == 0 and len(samples) == window and start in known)
+            ]
+            if index == 0:
+                for i in set(range(len(pending))) - set(todo):
+                    totals[i] += known[pending[i][0]]
+            if not todo:
+                continue
+            # We need to pass each window as a dictionary to the pipeline
+            inputs = [{"raw": pending[i][1], "sampling_rate": AUDIO_SAMPLE_RATE} for i in todo]
+            with span("audio_model_forward"):
+                batch_results = pipe(inputs, batch_size=len(inputs), top_k=None)
+            for i, results in zip(todo, batch_results):
+                totals[i] += _spoof_score(results)
+        for (start, samples), total in zip(pending, totals):
+            score = total / len(pipelines)
+            score_total += score
+            scored.append((start, len(samples), score))
+        pending.clear()
+
+    def decided() -> bool:
+        if not AUDIO_EARLY_EXIT or len(scored) < AUDIO_EARLY_EXIT_MIN_WINDOWS:
+            return False
+        mean = score_total / len(scored)
+        return mean >= AUDIO_EARLY_EXIT_CONFIDENCE or mean <= 1.0 - AUDIO_EARLY_EXIT_CONFIDENCE
+
+    with span("audio_analyze"):
+        windows = _iter_windows(blocks, window, hop)
+        try:
+            for item in windows:
+                pending.append(item)
+                if len(pending) >= AUDIO_WINDOW_BATCH:
+                    score_pending()
+                    if decided():
+                        early_exit = True
+                        break
+            if pending:
+                score_pending()
+        finally:
+            # Closes the decoder too when we stop early
+            windows.close()
+            if hasattr(blocks, "close"):
+                blocks.close()
+    return scored, early_exit
+
+
+def _audio_verdict(scored: List[Tuple[int, int, float]], early_exit: bool) -> dict:
+    if not scored:
+        raise ValueError("The audio file contains no samples.")
+
+    # This model uses 'spoof' (fake) and 'bonafide' (real)
+    spoof_score = sum(score for (_, _, score) in scored) / len(scored)
+    is_fake = spoof_score >= 0.5
+    confidence = spoof_score if is_fake else 1.0 - spoof_score
+    return {
+        "is_fake": is_fake,
+        "confidence": int(confidence * 100),
+        "segments": [
+            {
+                "start_s": round(start / AUDIO_SAMPLE_RATE, 3),
+                "end_s": round((start + length) / AUDIO_SAMPLE_RATE, 3),
+                "spoof_score": round(score, 4),
+            }
+            for (start, length, score) in scored
+        ],
+        "early_exit": early_exit,
+    }
+
+
+def cascade_stage_scores(paths: List[str]) -> Dict[str, Tuple[List[float], float]]:
+    """
+    Every stage's spoof score for every file, plus the model time each
+    stage took in total (for `python cascade.py --kind audio`).
+    """
+    window = max(1, int(AUDIO_WINDOW_S * AUDIO_SAMPLE_RATE))
+    main_pipeline = _load_audio_model()
+    first_pipeline = (
+        _load_extra_audio_model(AUDIO_CASCADE_FIRST_MODEL) if AUDIO_CASCADE_FIRST_MODEL
+        else main_pipeline
+    )
+    stages = {"first": ([first_pipeline], window), "full": ([main_pipeline], None)}
+    stages.update(
+        (f"ensemble:{name}", ([_load_extra_audio_model(name)], None)) for name in AUDIO_ENSEMBLE_MODELS
+    )
+    measured = {}
+    for (name, (pipelines, hop)) in stages.items():
+        scores, elapsed = [], 0.0
+        for path in paths:
+            started = time.perf_counter()
+            scored, _ = _score_windows(iter_audio_blocks(path), pipelines, hop=hop)
+            elapsed += time.perf_counter() - started
+            scores.append(sum(score for (_, _, score) in scored) / len(scored) if scored else 0.0)
+        measured[name] = (scores, elapsed)
+    return measured
+
+
+def audio_model_loaded() -> bool:
+    return audio_pipeline is not None
+
+
+def warmup():
+    """Loads the model and scores one second of silence (startup.py)."""
+    analyze_audio_blocks(iter([np.zeros(AUDIO_SAMPLE_RATE, dtype=np.float32)]))
+
+
+def get_cascade_stats() -> dict:
+    """Per-stage cost and escalation rate of the audio cascade."""
+    return cascade_stats.stats()
+
+
 def detect_audio_deepfake(file_path: str) -> (bool, int):
     """
     Analyzes an audio file and returns a verdict on whether it's synthetic.
+    `file_path` may also be a binary file-like object (e.g. an in-memory upload).
 
     Returns:
         A tuple (is_fake, confidence_percent):
+
+    Raises, like ai_detector.detect_deepfake, if the audio can't be decoded
+    (ValueError / OSError) or the model fails; the caller decides the
+    response (main.py: _detection_error).
     """
-    try:
-        # Load the model lazily if not already loaded
-        pipeline = _load_audio_model()
-        
-        # Load the audio file.
-        # We must resample it to 16000 Hz, as required by this model.
-        speech, sample_rate = librosa.load(file_path, sr=16000)
-        
-        # We need to save it as a dictionary for the pipeline
-        audio_input = {"raw": speech, "sampling_rate": 16000}
-
-        # Run the AI model
-        results = pipeline(audio_input)
-        
-        # The output looks like:
-        # [{'label': 'bonafide', 'score': 0.99}, {'label': 'spoof', 'score': 0.01}]
-        
-        best_result = sorted(results, key=lambda x: x['score'], reverse=True)[0]
-        
-        label = best_result['label']
-        confidence = best_result['score']
-        
-        confidence_percent = int(confidence * 100)
-        
-        # This model uses 'spoof' (fake) and 'bonafide' (real)
-        if label.lower() == 'spoof':
-            return (True, confidence_percent)
-        else:
-            # The other label is 'bonafide'
-            return (False, confidence_percent)
-
-    except Exception as e:
-        print(f"Error during Audio AI detection: {e}")
-        return (False, 0)
+    analysis = analyze_audio(file_path)
+    return (analysis["is_fake"], analysis["confidence"])
 
 # --- Test this file directly ---
 if __name__ == "__main__":
@@ -93,10 +408,11 @@ if __name__ == "__main__":
     test_file = "your_test_file.wav" # <-- PUT A REAL .WAV FILE HERE
     
     if os.path.exists(test_file):
-        (is_fake, confidence) = detect_audio_deepfake(test_file)
+        analysis = analyze_audio(test_file)
         print("\n--- Test Result ---")
         print(f"File: {test_file}")
-        print(f"Verdict: Is Fake? -> {is_fake}")
-        print(f"Confidence: {confidence}%")
+        print(f"Verdict: Is Fake? -> {analysis['is_fake']}")
+        print(f"Confidence: {analysis['confidence']}%")
+        print(f"Windows scored: {len(analysis['segments'])} (early exit: {analysis['early_exit']})")
     else:
         print(f"Test file not found: {test_file}. Skipping self-test.")
\ No newline at end of file
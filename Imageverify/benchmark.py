@@ -0,0 +1,502 @@
+# file: benchmark.py
+#
+# End-to-end load benchmark for the API.
+#
+# Runs `main.app` in-process (or under uvicorn) with the Aptos RestClient
+# replaced by a local fake with configurable latency / failure rate, and
+# optionally the HuggingFace pipelines replaced by fixed-cost stubs, then
+# drives a mixed image/audio load at a target concurrency.
+#
+# Results (latency percentiles, requests/sec, per-stage breakdown, the
+# server's /stats) are written as JSON so runs can be compared between
+# commits.
+#
+# Usage:
+#   python benchmark.py --requests 500 --concurrency 32 --stub-models --output bench.json
+#   python benchmark.py --uvicorn --audio-ratio 0.2 --chain-failure-rate 0.05
+#
+import argparse
+import asyncio
+import io
+import json
+import math
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import types
+import wave
+from typing import Optional
+
+# --- Stage timing shared by the fakes ---
+
+class StageTimer:
+    """Thread-safe collection of durations (seconds) per named stage."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._durations = {}
+
+    def record(self, stage: str, seconds: float):
+        with self._lock:
+            self._durations.setdefault(stage, []).append(seconds)
+
+    def reset(self):
+        with self._lock:
+            self._durations = {}
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {stage: latency_summary(values) for stage, values in self._durations.items()}
+
+
+STAGES = StageTimer()
+
+
+def percentile(sorted_values: list, q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, math.ceil(q / 100.0 * len(sorted_values)) - 1))
+    return sorted_values[index]
+
+
+def latency_summary(values: list) -> dict:
+    ordered = sorted(values)
+    return {
+        "count": len(ordered),
+        "mean_ms": (sum(ordered) / len(ordered) * 1000.0) if ordered else 0.0,
+        "p50_ms": percentile(ordered, 50) * 1000.0,
+        "p95_ms": percentile(ordered, 95) * 1000.0,
+        "p99_ms": percentile(ordered, 99) * 1000.0,
+        "max_ms": (ordered[-1] * 1000.0) if ordered else 0.0,
+    }
+
+
+# --- Fixed-cost model stubs ---
+
+class StubPipeline:
+    """
+    Stands in for a transformers pipeline: sleeps a fixed cost per call
+    plus a cost per item, and returns a plausible label list per item.
+    """
+
+    def __init__(self, task: str, call_ms: float, item_ms: float):
+        self.task = task
+        self.call_s = call_ms / 1000.0
+        self.item_s = item_ms / 1000.0
+        if task == "audio-classification":
+            self.labels = ("spoof", "bonafide")
+        else:
+            self.labels = ("fake", "real")
+
+    def _result(self) -> list:
+        fake_score = random.random()
+        return [
+            {"label": self.labels[0], "score": fake_score},
+            {"label": self.labels[1], "score": 1.0 - fake_score},
+        ]
+
+    def __call__(self, inputs, **kwargs):
+        batch = isinstance(inputs, list)
+        items = len(inputs) if batch else 1
+        started = time.perf_counter()
+        time.sleep(self.call_s + self.item_s * items)
+        STAGES.record(f"model_{self.task}", time.perf_counter() - started)
+        if batch:
+            return [self._result() for _ in range(items)]
+        return self._result()
+
+
+def install_stub_models(image_call_ms: float, image_item_ms: float, audio_call_ms: float):
+    """
+    Makes `from transformers import pipeline` return stubs. Must run before
+    ai_detector / audio_detector are imported.
+    """
+    def pipeline(task, model=None, **kwargs):
+        if task == "audio-classification":
+            return StubPipeline(task, audio_call_ms, 0.0)
+        return StubPipeline(task, image_call_ms, image_item_ms)
+
+    stub = types.ModuleType("transformers")
+    stub.pipeline = pipeline
+    sys.modules["transformers"] = stub
+
+
+# --- Fake Aptos node ---
+
+class FakeResponse:
+    def __init__(self, status_code: int, body):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception(f"fake node: HTTP {self.status_code}")
+
+
+class FakeHttpClient:
+    """The httpx client of FakeRestClient, for the REST routes called directly."""
+
+    def __init__(self, node: "FakeRestClient"):
+        self.node = node
+
+    async def get(self, url: str, params=None) -> FakeResponse:
+        path = url[len(self.node.base_url):]
+        parts = path.strip("/").split("/")
+        if len(parts) == 3 and parts[0] == "accounts" and parts[2] == "transactions":
+            params = params or {}
+            listed = await self.node.transactions_by_account(
+                parts[1], limit=params.get("limit"), start=params.get("start")
+            )
+            return FakeResponse(200, listed)
+        return FakeResponse(404, {"message": f"fake node: no route {path}"})
+
+
+class FakeRestClient:
+    """
+    Local stand-in for aptos_sdk's async RestClient, covering the calls
+    the service makes. Every call sleeps `latency_ms` (+/- jitter) and
+    submissions fail with probability `failure_rate`.
+    """
+
+    def __init__(self, latency_ms: float = 50.0, finality_ms: float = 500.0,
+                 failure_rate: float = 0.0):
+        self.latency_s = latency_ms / 1000.0
+        self.finality_s = finality_ms / 1000.0
+        self.failure_rate = failure_rate
+        self.base_url = "http://fake-node/v1"
+        self._sequence_numbers = {}
+        # tx_hash -> transaction JSON, with the time it becomes committed
+        self._transactions = {}
+        self.submitted = 0
+        self.failed = 0
+        # Requests made to the fake node, by kind
+        self.requests = {}
+        # Raw REST calls (RestClient.client) go to the same fake node
+        self.client = FakeHttpClient(self)
+
+    async def _delay(self, seconds: float):
+        await asyncio.sleep(seconds * random.uniform(0.8, 1.2))
+
+    def _count(self, kind: str):
+        self.requests[kind] = self.requests.get(kind, 0) + 1
+
+    async def close(self):
+        pass
+
+    async def account_sequence_number(self, address) -> int:
+        self._count("account")
+        await self._delay(self.latency_s)
+        return self._sequence_numbers.get(str(address), 0)
+
+    async def create_bcs_signed_transaction(self, sender, payload, sequence_number=None):
+        # Signing is local in the real client too; no delay.
+        return (str(sender.address()), sequence_number, payload)
+
+    async def submit_bcs_transaction(self, signed_tx) -> str:
+        self._count("submit")
+        started = time.perf_counter()
+        await self._delay(self.latency_s)
+        STAGES.record("chain_submit", time.perf_counter() - started)
+        if random.random() < self.failure_rate:
+            self.failed += 1
+            raise Exception("fake node: transaction rejected")
+        sender, sequence_number, _ = signed_tx
+        if sequence_number is not None:
+            self._sequence_numbers[sender] = max(self._sequence_numbers.get(sender, 0), sequence_number + 1)
+        self.submitted += 1
+        tx_hash = "0x" + os.urandom(32).hex()
+        self._transactions[tx_hash] = (
+            time.monotonic() + self.finality_s * random.uniform(0.8, 1.2),
+            {"type": "user_transaction", "hash": tx_hash, "sender": sender,
+             "sequence_number": str(sequence_number), "success": True, "vm_status": "Executed successfully"},
+        )
+        return tx_hash
+
+    def _transaction(self, tx_hash: str) -> Optional[dict]:
+        entry = self._transactions.get(tx_hash)
+        if entry is None:
+            return None
+        committed_at, tx = entry
+        if time.monotonic() < committed_at:
+            return {**tx, "type": "pending_transaction"}
+        return tx
+
+    async def wait_for_transaction(self, tx_hash: str):
+        # Like the SDK: poll the transaction once a second
+        started = time.perf_counter()
+        while True:
+            self._count("transaction_by_hash")
+            await self._delay(self.latency_s)
+            tx = self._transaction(tx_hash)
+            if tx is not None and tx["type"] != "pending_transaction":
+                break
+            await asyncio.sleep(1.0)
+        STAGES.record("chain_finality", time.perf_counter() - started)
+
+    async def transaction_by_hash(self, tx_hash: str) -> dict:
+        from aptos_sdk.async_client import ApiError
+        self._count("transaction_by_hash")
+        await self._delay(self.latency_s)
+        tx = self._transaction(tx_hash)
+        if tx is None:
+            raise ApiError("fake node: transaction not found", 404)
+        return tx
+
+    async def transactions_by_account(self, address, limit=None, start=None) -> list:
+        # GET /accounts/{address}/transactions (see FakeHttpClient)
+        self._count("transactions_by_account")
+        await self._delay(self.latency_s)
+        committed = sorted(
+            (int(tx["sequence_number"]), tx) for tx in map(self._transaction, list(self._transactions))
+            if tx["sender"] == str(address) and tx["type"] != "pending_transaction"
+        )
+        # The node lists an account's committed transactions in order, from `start`
+        listed = []
+        for sequence_number, tx in committed:
+            if sequence_number < (start or 0):
+                continue
+            if sequence_number != (start or 0) + len(listed):
+                break
+            listed.append(tx)
+        return listed[:limit or 100]
+
+    async def view(self, function, type_arguments, arguments, ledger_version=None):
+        self._count("view")
+        started = time.perf_counter()
+        await self._delay(self.latency_s)
+        STAGES.record("chain_view", time.perf_counter() - started)
+        raise Exception("fake node: Move abort: E_VERDICT_ALREADY_EXISTS(0x1)")
+
+
+# --- Synthetic payloads ---
+
+def make_image(seed: int) -> bytes:
+    from PIL import Image
+    rng = random.Random(seed)
+    img = Image.new("RGB", (640, 480), (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    # A few random pixels make every payload's hash unique
+    for _ in range(32):
+        img.putpixel((rng.randrange(640), rng.randrange(480)),
+                     (rng.randrange(256), rng.randrange(256), rng.randrange(256)))
+    buffer = io.BytesIO()
+    img.save(buffer, format="JPEG", quality=85)
+    return buffer.getvalue()
+
+
+def make_audio(seed: int, seconds: float) -> bytes:
+    rng = random.Random(seed)
+    rate = 16000
+    frequency = rng.uniform(200, 800)
+    frames = bytearray()
+    for i in range(int(rate * seconds)):
+        sample = int(8000 * math.sin(2 * math.pi * frequency * i / rate) + rng.uniform(-500, 500))
+        frames += sample.to_bytes(2, "little", signed=True)
+    buffer = io.BytesIO()
+    with wave.open(buffer, "wb") as out:
+        out.setnchannels(1)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        out.writeframes(bytes(frames))
+    return buffer.getvalue()
+
+
+class PayloadFactory:
+    """Builds request payloads; `repeat_ratio` of them reuse earlier content."""
+
+    def __init__(self, audio_ratio: float, audio_seconds: float, repeat_ratio: float):
+        self.audio_ratio = audio_ratio
+        self.audio_seconds = audio_seconds
+        self.repeat_ratio = repeat_ratio
+        self._seed = 0
+        self._seen = []
+
+    def next(self):
+        if self._seen and random.random() < self.repeat_ratio:
+            return random.choice(self._seen)
+        self._seed += 1
+        if random.random() < self.audio_ratio:
+            payload = ("audio", f"bench_{self._seed}.wav", "audio/wav",
+                       make_audio(self._seed, self.audio_seconds))
+        else:
+            payload = ("image", f"bench_{self._seed}.jpg", "image/jpeg", make_image(self._seed))
+        self._seen.append(payload)
+        return payload
+
+
+# --- Load generation ---
+
+async def run_load(client, payloads: list, concurrency: int) -> dict:
+    latencies = {"image": [], "audio": [], "all": []}
+    errors = {}
+    next_index = 0
+
+    async def worker():
+        nonlocal next_index
+        while next_index < len(payloads):
+            kind, filename, content_type, data = payloads[next_index]
+            next_index += 1
+            started = time.perf_counter()
+            try:
+                response = await client.post("/verify", files={"file": (filename, data, content_type)})
+                body = response.json()
+                if response.status_code != 200 or "error" in body:
+                    key = f"{response.status_code}: {body.get('error', body.get('detail', ''))}"[:200]
+                    errors[key] = errors.get(key, 0) + 1
+                    continue
+            except Exception as e:
+                key = f"client: {e}"[:200]
+                errors[key] = errors.get(key, 0) + 1
+                continue
+            elapsed = time.perf_counter() - started
+            latencies[kind].append(elapsed)
+            latencies["all"].append(elapsed)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    wall = time.perf_counter() - started
+
+    ok = len(latencies["all"])
+    return {
+        "wall_seconds": wall,
+        "requests": len(payloads),
+        "succeeded": ok,
+        "failed": sum(errors.values()),
+        "requests_per_sec": ok / wall if wall else 0.0,
+        "latency": {kind: latency_summary(values) for kind, values in latencies.items()},
+        "errors": errors,
+    }
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True,
+                                       stderr=subprocess.DEVNULL).strip()
+    except Exception:
+        return "unknown"
+
+
+async def benchmark(args) -> dict:
+    import httpx
+
+    # Keep the benchmark's state out of the real databases
+    workdir = tempfile.mkdtemp(prefix="deepshield_bench_")
+    os.environ.setdefault("CHAIN_QUEUE_DB", os.path.join(workdir, "chain_jobs.db"))
+    os.environ.setdefault("VERDICT_INDEX_DB", os.path.join(workdir, "verdict_index.db"))
+    os.environ.setdefault("VERDICT_INDEX_FOLLOW", "0")
+
+    if args.stub_models:
+        install_stub_models(args.image_call_ms, args.image_item_ms, args.audio_call_ms)
+
+    import aptos_service
+    fake_client = FakeRestClient(args.chain_latency_ms, args.chain_finality_ms, args.chain_failure_rate)
+    aptos_service.CLIENT = fake_client
+
+    import main
+
+    factory = PayloadFactory(args.audio_ratio, args.audio_seconds, args.repeat_ratio)
+    print(f"Generating {args.requests} payload(s)...")
+    payloads = [factory.next() for _ in range(args.requests)]
+
+    if args.uvicorn:
+        import uvicorn
+        config = uvicorn.Config(main.app, host="127.0.0.1", port=args.port, log_level="warning")
+        server = uvicorn.Server(config)
+        server_task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.05)
+        client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{args.port}", timeout=args.timeout)
+        lifespan = None
+    else:
+        # ASGITransport doesn't run the lifespan, so start it by hand
+        lifespan = main.app.router.lifespan_context(main.app)
+        await lifespan.__aenter__()
+        client = httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app),
+                                   base_url="http://bench", timeout=args.timeout)
+        server = server_task = None
+
+    try:
+        if args.warmup:
+            print(f"Warming up with {args.warmup} request(s)...")
+            await run_load(client, [factory.next() for _ in range(args.warmup)], args.concurrency)
+            STAGES.reset()
+
+        print(f"Running {args.requests} request(s) at concurrency {args.concurrency}...")
+        load = await run_load(client, payloads, args.concurrency)
+
+        # Give the chain workers a moment to drain, then snapshot the server
+        await asyncio.sleep(args.drain_seconds)
+        server_stats = (await client.get("/stats")).json()
+    finally:
+        await client.aclose()
+        if lifespan is not None:
+            await lifespan.__aexit__(None, None, None)
+        if server is not None:
+            server.should_exit = True
+            await server_task
+
+    return {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "config": vars(args),
+        **load,
+        "stages": STAGES.summary(),
+        "fake_chain": {
+            "submitted": fake_client.submitted,
+            "failed": fake_client.failed,
+            "requests": fake_client.requests,
+        },
+        "server_stats": server_stats,
+    }
+
+
+def main_cli(argv=None):
+    parser = argparse.ArgumentParser(description="Load benchmark for the deepfake verification API.")
+    parser.add_argument("--requests", type=int, default=200, help="Measured requests (200)")
+    parser.add_argument("--warmup", type=int, default=10, help="Unmeasured warm-up requests (10)")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients (16)")
+    parser.add_argument("--audio-ratio", type=float, default=0.1, help="Share of audio requests (0.1)")
+    parser.add_argument("--audio-seconds", type=float, default=3.0, help="Length of audio payloads (3)")
+    parser.add_argument("--repeat-ratio", type=float, default=0.0,
+                        help="Share of requests re-sending earlier content (0)")
+    parser.add_argument("--stub-models", action="store_true",
+                        help="Replace the HuggingFace pipelines by fixed-cost stubs")
+    parser.add_argument("--image-call-ms", type=float, default=20.0, help="Stub image model cost per call")
+    parser.add_argument("--image-item-ms", type=float, default=5.0, help="Stub image model cost per image")
+    parser.add_argument("--audio-call-ms", type=float, default=150.0, help="Stub audio model cost per call")
+    parser.add_argument("--chain-latency-ms", type=float, default=50.0, help="Fake node latency per call")
+    parser.add_argument("--chain-finality-ms", type=float, default=500.0, help="Fake time to finality")
+    parser.add_argument("--chain-failure-rate", type=float, default=0.0, help="Fake submission failure rate")
+    parser.add_argument("--drain-seconds", type=float, default=2.0,
+                        help="Wait after the load before reading /stats (2)")
+    parser.add_argument("--uvicorn", action="store_true", help="Serve over real HTTP with uvicorn")
+    parser.add_argument("--port", type=int, default=8765, help="Port for --uvicorn (8765)")
+    parser.add_argument("--timeout", type=float, default=120.0, help="Client timeout per request (120)")
+    parser.add_argument("--output", "-o", help="Write the JSON results to this file")
+    args = parser.parse_args(argv)
+
+    results = asyncio.run(benchmark(args))
+
+    overall = results["latency"]["all"]
+    print("\n--- Benchmark Results ---")
+    print(f"Requests: {results['succeeded']}/{results['requests']} ok, {results['failed']} failed")
+    print(f"Throughput: {results['requests_per_sec']:.1f} req/s")
+    print(f"Latency: p50 {overall['p50_ms']:.1f} ms, p95 {overall['p95_ms']:.1f} ms, "
+          f"p99 {overall['p99_ms']:.1f} ms")
+    for stage, summary in sorted(results["stages"].items()):
+        print(f"  {stage}: {summary['count']} x, mean {summary['mean_ms']:.1f} ms, p99 {summary['p99_ms']:.1f} ms")
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2, default=str)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,333 @@
+# file: bulk_scan.py
+#
+# Offline bulk scanner for local image datasets.
+#
+# Walks a directory tree, decodes images in a pool of processes, runs the
+# image model in batches and writes one result row per file as it goes.
+# Runs are resumable: files that already have a row are skipped. A file
+# with the same content (SHA-256) as one already scored isn't run through
+# the model again; its row copies that verdict and names the original in
+# "duplicate_of". When the folder names carry labels (e.g. Dataset/real and
+# Dataset/fack) it also reports accuracy / precision / recall.
+#
+# Usage:
+#   python bulk_scan.py ../Dataset --output scan.csv
+#   python bulk_scan.py ../Dataset --output scan.parquet --batch-size 32 --workers 8
+#
+import argparse
+import csv
+import hashlib
+import json
+import os
+import sys
+import time
+from io import BytesIO
+from multiprocessing import Pool
+
+from PIL import Image
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".gif", ".webp", ".tif", ".tiff")
+
+# Folder names that tell us the ground truth.
+REAL_LABELS = {"real"}
+FAKE_LABELS = {"fake", "fack", "deepfake", "fakes"}
+
+# The model's input size; decoding workers resize to it, so only small
+# images travel between processes.
+MODEL_INPUT_SIZE = (224, 224)
+
+FIELDS = ["path", "sha256", "label", "is_fake", "confidence", "error", "duplicate_of"]
+
+
+def label_for(path: str):
+    """'real' / 'fake' from the nearest labelled parent folder, or None."""
+    for part in reversed(os.path.normpath(os.path.dirname(path)).split(os.sep)):
+        name = part.lower()
+        if name in REAL_LABELS:
+            return "real"
+        if name in FAKE_LABELS:
+            return "fake"
+    return None
+
+
+def find_images(root: str):
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith(IMAGE_EXTENSIONS):
+                yield os.path.join(dirpath, filename)
+
+
+def decode_image(path: str):
+    """
+    Runs in a worker process: hashes and decodes one file.
+    Returns (path, sha256, image or None, error or None).
+    """
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        sha256 = hashlib.sha256(data).hexdigest()
+    except Exception as e:
+        return (path, None, None, f"read failed: {e}")
+
+    try:
+        img = Image.open(BytesIO(data))
+        # JPEGs are decoded at reduced size (DCT scaling), close to the
+        # model's input size, instead of at full resolution
+        img.draft("RGB", MODEL_INPUT_SIZE)
+        img = img.convert("RGB").resize(MODEL_INPUT_SIZE, Image.BILINEAR)
+        return (path, sha256, img, None)
+    except Exception as e:
+        return (path, sha256, None, f"decode failed: {e}")
+
+
+# --- Output writers ---
+
+class CsvWriter:
+    def __init__(self, path: str, resume: bool):
+        new_file = not (resume and os.path.exists(path))
+        self._file = open(path, "a" if not new_file else "w", newline="")
+        self._writer = csv.DictWriter(self._file, fieldnames=FIELDS)
+        if new_file:
+            self._writer.writeheader()
+
+    def write(self, rows: list):
+        self._writer.writerows(rows)
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class JsonlWriter:
+    def __init__(self, path: str, resume: bool):
+        self._file = open(path, "a" if resume else "w")
+
+    def write(self, rows: list):
+        for row in rows:
+            self._file.write(json.dumps(row) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+
+class ParquetWriter:
+    """
+    Writes one row group per batch. Parquet files can't be appended to,
+    so on resume the rows from the checkpoint are written first.
+    """
+
+    def __init__(self, path: str, previous_rows: list):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise SystemExit("Parquet output needs pyarrow: pip install pyarrow")
+        self._pa = pyarrow
+        self._schema = pyarrow.schema([
+            ("path", pyarrow.string()),
+            ("sha256", pyarrow.string()),
+            ("label", pyarrow.string()),
+            ("is_fake", pyarrow.bool_()),
+            ("confidence", pyarrow.int32()),
+            ("error", pyarrow.string()),
+            ("duplicate_of", pyarrow.string()),
+        ])
+        self._writer = pyarrow.parquet.ParquetWriter(path, self._schema)
+        if previous_rows:
+            self.write(previous_rows)
+
+    def write(self, rows: list):
+        table = self._pa.Table.from_pylist(rows, schema=self._schema)
+        self._writer.write_table(table)
+
+    def close(self):
+        self._writer.close()
+
+
+def load_checkpoint(path: str) -> list:
+    """Rows written by a previous run (JSON lines), or [] if none."""
+    if not os.path.exists(path):
+        return []
+    rows = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rows.append(json.loads(line))
+            except ValueError:
+                # A run killed mid-write can leave a partial last line
+                break
+    return rows
+
+
+# --- Metrics ---
+
+class Metrics:
+    """Confusion counts for rows that have both a label and a verdict."""
+
+    def __init__(self):
+        self.tp = self.fp = self.tn = self.fn = 0
+
+    def add(self, row: dict):
+        # Duplicates count once, under the file that was scored
+        if row["label"] is None or row["error"] or row.get("duplicate_of"):
+            return
+        actual_fake = row["label"] == "fake"
+        if row["is_fake"] and actual_fake:
+            self.tp += 1
+        elif row["is_fake"]:
+            self.fp += 1
+        elif actual_fake:
+            self.fn += 1
+        else:
+            self.tn += 1
+
+    def report(self) -> dict:
+        total = self.tp + self.fp + self.tn + self.fn
+        precision = self.tp / (self.tp + self.fp) if self.tp + self.fp else 0.0
+        recall = self.tp / (self.tp + self.fn) if self.tp + self.fn else 0.0
+        return {
+            "labelled": total,
+            "accuracy": (self.tp + self.tn) / total if total else 0.0,
+            "precision": precision,
+            "recall": recall,
+            "f1": 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+            "confusion": {"tp": self.tp, "fp": self.fp, "tn": self.tn, "fn": self.fn},
+        }
+
+
+def scan(args) -> dict:
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip(".").lower()
+    if fmt not in ("csv", "jsonl", "parquet"):
+        raise SystemExit(f"Unknown output format '{fmt}', use csv, jsonl or parquet")
+
+    # The checkpoint is a JSON-lines file of finished rows. For JSONL output
+    # that's the output itself.
+    checkpoint_path = args.output if fmt == "jsonl" else args.output + ".checkpoint.jsonl"
+    previous = load_checkpoint(checkpoint_path) if args.resume else []
+    done_paths = {row["path"] for row in previous}
+    # sha256 -> the row of the first file scored with that content
+    originals = {
+        row["sha256"]: row for row in previous
+        if row["sha256"] and not row["error"] and not row.get("duplicate_of")
+    }
+    done_hashes = set(originals)
+    if previous:
+        print(f"Resuming: {len(previous)} file(s) already scored")
+
+    if fmt == "csv":
+        writer = CsvWriter(args.output, resume=bool(previous))
+    elif fmt == "parquet":
+        writer = ParquetWriter(args.output, previous)
+    else:
+        writer = None
+    checkpoint = JsonlWriter(checkpoint_path, resume=bool(previous))
+
+    metrics = Metrics()
+    for row in previous:
+        metrics.add(row)
+
+    paths = [path for path in find_images(args.root) if path not in done_paths]
+    print(f"Found {len(paths)} image(s) to scan under {args.root}")
+
+    scanned = skipped = 0
+    started = time.perf_counter()
+    pending = []
+
+    def flush():
+        nonlocal scanned
+        from ai_detector import detect_deepfake_batch
+        images = [item["image"] for item in pending if item["image"] is not None]
+        verdicts = iter(detect_deepfake_batch(images)) if images else iter(())
+        rows = []
+        for item in pending:
+            row = {"path": item["path"], "sha256": item["sha256"], "label": label_for(item["path"]),
+                   "is_fake": None, "confidence": None, "error": item["error"], "duplicate_of": None}
+            if item["duplicate"]:
+                # Its original comes earlier: in this batch or a previous one
+                original = originals[item["sha256"]]
+                row["is_fake"], row["confidence"] = original["is_fake"], original["confidence"]
+                row["duplicate_of"] = original["path"]
+            elif item["image"] is not None:
+                row["is_fake"], row["confidence"] = next(verdicts)
+                originals[item["sha256"]] = row
+            rows.append(row)
+            metrics.add(row)
+        checkpoint.write(rows)
+        if writer is not None:
+            writer.write(rows)
+        scanned += sum(1 for row in rows if not row["duplicate_of"])
+        pending.clear()
+
+        elapsed = time.perf_counter() - started
+        print(f"  {scanned}/{len(paths)} scanned, {skipped} skipped, "
+              f"{scanned / elapsed if elapsed else 0.0:.1f} images/sec")
+
+    try:
+        # The pool is started before the model is loaded (on the first
+        # flush), so the decoding workers don't inherit a copy of it.
+        with Pool(processes=args.workers) as pool:
+            for (path, sha256, image, error) in pool.imap(decode_image, paths, chunksize=4):
+                duplicate = sha256 is not None and sha256 in done_hashes
+                if duplicate:
+                    # Same content as a file we already scored: not run
+                    # again, but still gets a row so a resume skips it
+                    skipped += 1
+                    image, error = None, None
+                elif sha256 is not None and error is None:
+                    done_hashes.add(sha256)
+                pending.append({"path": path, "sha256": sha256, "image": image, "error": error,
+                                "duplicate": duplicate})
+                if len(pending) >= args.batch_size:
+                    flush()
+            if pending:
+                flush()
+    finally:
+        checkpoint.close()
+        if writer is not None:
+            writer.close()
+
+    elapsed = time.perf_counter() - started
+    summary = {
+        "scanned": scanned,
+        "skipped_duplicates": skipped,
+        "seconds": elapsed,
+        "images_per_sec": scanned / elapsed if elapsed else 0.0,
+        **metrics.report(),
+    }
+    return summary
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk deepfake scan of a local image folder.")
+    parser.add_argument("root", help="Folder to scan (searched recursively)")
+    parser.add_argument("--output", "-o", required=True, help="Result file (.csv, .jsonl or .parquet)")
+    parser.add_argument("--format", choices=["csv", "jsonl", "parquet"],
+                        help="Output format (default: from the --output extension)")
+    parser.add_argument("--batch-size", type=int, default=32, help="Images per model call (32)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="Decoding processes (default: CPU count)")
+    parser.add_argument("--no-resume", dest="resume", action="store_false",
+                        help="Start over instead of skipping files from a previous run")
+    args = parser.parse_args(argv)
+
+    summary = scan(args)
+
+    print("\n--- Bulk Scan Summary ---")
+    print(f"Scanned: {summary['scanned']} ({summary['skipped_duplicates']} duplicate(s) skipped)")
+    print(f"Throughput: {summary['images_per_sec']:.1f} images/sec")
+    if summary["labelled"]:
+        print(f"Labelled files: {summary['labelled']}")
+        print(f"Accuracy:  {summary['accuracy']:.3f}")
+        print(f"Precision: {summary['precision']:.3f} (fake = positive)")
+        print(f"Recall:    {summary['recall']:.3f}")
+        print(f"F1:        {summary['f1']:.3f}")
+    print(json.dumps(summary))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
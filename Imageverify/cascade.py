@@ -0,0 +1,233 @@
+# file: cascade.py
+#
+# Confidence-gated model cascades.
+#
+# Most uploads are clearly real (or clearly fake), and a cheap model is
+# just as sure about those as the full one. In cascade mode a cheap first
+# stage scores every input, and only inputs whose fake score lands inside
+# the uncertainty band [low, high] are escalated to the full model - or,
+# in ensemble mode, to the full model averaged with extra models.
+#
+# The stages themselves live with their detectors (IMAGE_CASCADE in
+# ai_detector.py, AUDIO_CASCADE in audio_detector.py); this module has
+# the shared bookkeeping and the offline evaluation:
+#
+#   python cascade.py ../Dataset
+#   python cascade.py ../Dataset --band 0.1,0.9 0.2,0.8 0.3,0.7
+#
+# It scores every file with every stage once, then replays the cascade for
+# each band: accuracy, escalation rate and the average cost per file,
+# compared with running the full model on everything.
+#
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Optional, Tuple
+
+MODES = ("off", "cascade", "ensemble")
+
+# Labels that mean "synthetic", across the models we use
+FAKE_LABELS = {"fake", "deepfake", "spoof", "artificial"}
+
+
+def check_mode(setting: str, mode: str) -> str:
+    if mode not in MODES:
+        raise ValueError(f"Unknown {setting} '{mode}', use one of: {', '.join(MODES)}")
+    return mode
+
+
+def fake_score(results: list) -> float:
+    """Probability of the "fake" label in one input's pipeline output."""
+    return sum(float(r["score"]) for r in results if r["label"].lower() in FAKE_LABELS)
+
+
+def verdict_from_score(score: float) -> Tuple[bool, int]:
+    """A fake score (0-1) -> (is_fake, confidence_percent)."""
+    is_fake = score >= 0.5
+    return (is_fake, int((score if is_fake else 1.0 - score) * 100))
+
+
+def in_band(score: float, band: Tuple[float, float]) -> bool:
+    """True if `score` is uncertain enough to escalate."""
+    return band[0] <= score <= band[1]
+
+
+class CascadeStats:
+    """Per-stage cost and escalation counts of one cascade."""
+
+    def __init__(self, name: str, mode: str, band: Tuple[float, float]):
+        self.name = name
+        self.mode = mode
+        self.band = band
+        self._lock = threading.Lock()
+        self._inputs = 0
+        self._escalated = 0
+        # stage -> [calls, inputs, seconds]
+        self._stages: Dict[str, list] = {}
+
+    @contextmanager
+    def stage(self, stage: str, inputs: int):
+        """Times one call of `stage` over `inputs` inputs."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - started
+            with self._lock:
+                totals = self._stages.setdefault(stage, [0, 0, 0.0])
+                totals[0] += 1
+                totals[1] += inputs
+                totals[2] += elapsed
+
+    def record_routing(self, inputs: int, escalated: int):
+        with self._lock:
+            self._inputs += inputs
+            self._escalated += escalated
+
+    def stats(self) -> dict:
+        with self._lock:
+            total_s = sum(seconds for (_, _, seconds) in self._stages.values())
+            return {
+                "mode": self.mode,
+                "band_low": self.band[0],
+                "band_high": self.band[1],
+                "inputs": self._inputs,
+                "escalated": self._escalated,
+                "escalation_rate": self._escalated / self._inputs if self._inputs else 0.0,
+                # Model time per input, all stages together
+                "avg_ms_per_input": total_s / self._inputs * 1000.0 if self._inputs else 0.0,
+                "stages": {
+                    stage: {
+                        "calls": calls,
+                        "inputs": inputs,
+                        "seconds": seconds,
+                        "ms_per_input": seconds / inputs * 1000.0 if inputs else 0.0,
+                    }
+                    for stage, (calls, inputs, seconds) in self._stages.items()
+                },
+            }
+
+
+# --- Offline evaluation ---
+
+def _replay(scores: Dict[str, List[float]], costs: Dict[str, float], labels: List[Optional[str]],
+            band: Tuple[float, float], finals: List[str]) -> dict:
+    """
+    The outcome of a cascade with this band, from every stage's scores
+    on every input. `costs` are seconds per input.
+    """
+    first = scores["first"]
+    verdicts = []
+    escalated = 0
+    for i, score in enumerate(first):
+        if in_band(score, band):
+            escalated += 1
+            score = sum(scores[stage][i] for stage in finals) / len(finals)
+        verdicts.append(score)
+    rate = escalated / len(first)
+    return {
+        "band": list(band),
+        "escalation_rate": rate,
+        "accuracy": _accuracy(verdicts, labels),
+        "agreement_with_full": sum(
+            (a >= 0.5) == (b >= 0.5) for a, b in zip(verdicts, scores["full"])
+        ) / len(first),
+        # Escalated inputs pay for the first stage AND the final stages
+        "ms_per_input": (costs["first"] + rate * sum(costs[stage] for stage in finals)) * 1000.0,
+    }
+
+
+def _accuracy(fake_scores: List[float], labels: List[Optional[str]]) -> Optional[float]:
+    labelled = [(score, label) for score, label in zip(fake_scores, labels) if label]
+    if not labelled:
+        return None
+    return sum((score >= 0.5) == (label == "fake") for score, label in labelled) / len(labelled)
+
+
+def evaluate(kind: str, paths: List[str], bands: List[Tuple[float, float]], batch_size: int) -> dict:
+    from bulk_scan import label_for
+
+    if kind == "image":
+        from ai_detector import cascade_stage_scores
+        measured = cascade_stage_scores(paths, batch_size)
+    else:
+        from audio_detector import cascade_stage_scores
+        measured = cascade_stage_scores(paths)
+
+    labels = [label_for(path) for path in paths]
+    scores = {stage: stage_scores for stage, (stage_scores, _) in measured.items()}
+    costs = {stage: seconds / len(paths) for stage, (_, seconds) in measured.items()}
+    ensemble = [stage for stage in measured if stage.startswith("ensemble:")]
+
+    report = {
+        "files": len(paths),
+        "stages": {
+            stage: {"accuracy": _accuracy(scores[stage], labels), "ms_per_input": costs[stage] * 1000.0}
+            for stage in measured
+        },
+        "cascade": [],
+    }
+    full_ms = costs["full"] * 1000.0
+    modes = [("cascade", ["full"])] + ([("ensemble", ["full"] + ensemble)] if ensemble else [])
+    for mode, finals in modes:
+        for band in bands:
+            outcome = _replay(scores, costs, labels, band, finals)
+            outcome["mode"] = mode
+            # Relative to running the full model on every input
+            outcome["cost_saving"] = 1.0 - outcome["ms_per_input"] / full_ms if full_ms else None
+            report["cascade"].append(outcome)
+    return report
+
+
+def _parse_band(text: str) -> Tuple[float, float]:
+    low, _, high = text.partition(",")
+    return (float(low), float(high))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure accuracy vs. cost of the model cascade on a labelled folder."
+    )
+    parser.add_argument("dataset", nargs="?", default=os.path.join("..", "Dataset"),
+                        help="Folder of (labelled) files (../Dataset)")
+    parser.add_argument("--kind", choices=("image", "audio"), default="image",
+                        help="Which detector's cascade to evaluate (image)")
+    parser.add_argument("--band", nargs="+", type=_parse_band, default=None,
+                        help="Uncertainty bands to replay, as low,high (the configured band)")
+    parser.add_argument("--limit", type=int, default=0, help="Use at most this many files")
+    parser.add_argument("--batch-size", type=int, default=16, help="Images per call (16)")
+    args = parser.parse_args(argv)
+
+    if args.kind == "image":
+        from bulk_scan import find_images
+        paths = list(find_images(args.dataset))
+    else:
+        paths = [
+            os.path.join(dirpath, filename)
+            for dirpath, _, filenames in sorted(os.walk(args.dataset))
+            for filename in sorted(filenames)
+            if filename.lower().endswith((".wav", ".flac", ".mp3", ".ogg", ".m4a"))
+        ]
+    if args.limit:
+        paths = paths[:args.limit]
+    if not paths:
+        raise SystemExit(f"No {args.kind} files found under {args.dataset}")
+
+    if args.band is None:
+        if args.kind == "image":
+            from ai_detector import IMAGE_CASCADE_LOW as low, IMAGE_CASCADE_HIGH as high
+        else:
+            from audio_detector import AUDIO_CASCADE_LOW as low, AUDIO_CASCADE_HIGH as high
+        args.band = [(low, high)]
+
+    report = evaluate(args.kind, paths, args.band, args.batch_size)
+    print(json.dumps(report, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
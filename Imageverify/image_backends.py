@@ -0,0 +1,334 @@
+# file: image_backends.py
+#
+# Pluggable CPU inference backends for the image detector, selected with
+# IMAGE_BACKEND:
+#   - "torch":      the fp32 transformers pipeline (the default)
+#   - "torch-int8": the same model with its Linear layers dynamically
+#                   quantized to int8 at load time (no artifact needed)
+#   - "onnx":       an exported ONNX graph run by ONNX Runtime
+#   - "onnx-int8":  the ONNX graph with int8-quantized weights
+#
+# Every backend is called like the pipeline it replaces:
+#   backend(images, batch_size=n) -> one [{"label", "score"}, ...] list per image
+# and can also score ready-made model input (see image_preprocess.py):
+#   backend.predict_pixels(pixel_values) -> the same lists
+# `backend.image_processor` is the model's transformers image processor
+# (None if unknown).
+#
+# The ONNX artifacts are built once with the export command below and
+# cached in MODEL_CACHE_DIR (if they are missing, the first load builds
+# them). The parity command checks a backend against the fp32 model on
+# the labelled images in Dataset/.
+#
+# Usage:
+#   python image_backends.py export                    # build the ONNX artifacts
+#   python image_backends.py parity ../Dataset --backend onnx-int8 torch-int8
+#
+# ONNX Runtime is optional: pip install onnxruntime onnx
+#
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import List, Optional
+
+from instrumentation import get_logger
+
+logger = get_logger("image_backends")
+
+# --- Config ---
+IMAGE_MODEL_NAME = os.getenv("IMAGE_MODEL_NAME", "dima806/deepfake_vs_real_image_detection")
+IMAGE_BACKEND = os.getenv("IMAGE_BACKEND", "torch")
+# Where exported model artifacts are kept.
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR", "model_cache")
+# ONNX Runtime intra-op threads per session (0 = ORT default).
+ONNX_THREADS = int(os.getenv("ONNX_THREADS", "0"))
+
+BACKENDS = ("torch", "torch-int8", "onnx", "onnx-int8")
+
+_ONNX_FILES = {"onnx": "model.onnx", "onnx-int8": "model.int8.onnx"}
+
+
+def artifact_dir(model_name: str = IMAGE_MODEL_NAME) -> str:
+    """Directory holding the exported artifacts of one model."""
+    return os.path.join(MODEL_CACHE_DIR, model_name.replace("/", "__"))
+
+
+def _softmax(logits):
+    import numpy as np
+    shifted = logits - logits.max(axis=-1, keepdims=True)
+    exp = np.exp(shifted)
+    return exp / exp.sum(axis=-1, keepdims=True)
+
+
+def _label_scores(probabilities, labels: List[str]) -> List[List[dict]]:
+    """Per-image probabilities -> the pipeline's sorted label/score lists."""
+    results = []
+    for row in probabilities:
+        scores = [{"label": labels[i], "score": float(p)} for i, p in enumerate(row)]
+        results.append(sorted(scores, key=lambda x: x["score"], reverse=True))
+    return results
+
+
+class TorchBackend:
+    """The transformers pipeline, optionally with int8 dynamic quantization."""
+
+    def __init__(self, model_name: str = IMAGE_MODEL_NAME, quantize: bool = False):
+        from transformers import pipeline
+        self.name = "torch-int8" if quantize else "torch"
+        self.pipeline = pipeline("image-classification", model=model_name)
+        if quantize:
+            import torch
+            # Swaps every nn.Linear for an int8 one in place, so the fp32
+            # weights are freed instead of kept next to the copies.
+            torch.quantization.quantize_dynamic(
+                self.pipeline.model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True
+            )
+
+    @property
+    def image_processor(self):
+        return getattr(self.pipeline, "image_processor", None)
+
+    def __call__(self, images, batch_size: Optional[int] = None):
+        return self.pipeline(images, batch_size=batch_size or len(images))
+
+    def predict_pixels(self, pixel_values):
+        """Scores an (N, 3, H, W) float32 array, skipping the image processor."""
+        import torch
+        model = self.pipeline.model
+        with torch.inference_mode():
+            logits = model(pixel_values=torch.from_numpy(pixel_values)).logits
+        labels = [model.config.id2label[i] for i in range(logits.shape[-1])]
+        return _label_scores(_softmax(logits.float().numpy()), labels)
+
+
+class OnnxBackend:
+    """An exported graph of the model, run by ONNX Runtime."""
+
+    def __init__(self, model_name: str = IMAGE_MODEL_NAME, quantized: bool = False):
+        try:
+            import onnxruntime
+        except ImportError:
+            raise RuntimeError("The onnx backends need ONNX Runtime: pip install onnxruntime onnx")
+        from transformers import AutoImageProcessor
+
+        self.name = "onnx-int8" if quantized else "onnx"
+        directory = artifact_dir(model_name)
+        path = os.path.join(directory, _ONNX_FILES[self.name])
+        if not os.path.exists(path):
+            logger.info("No %s artifact for %s yet, exporting it (one time)...", self.name, model_name)
+            export(model_name, [self.name])
+
+        with open(os.path.join(directory, "config.json")) as f:
+            id2label = json.load(f)["id2label"]
+        self.labels = [id2label[str(i)] for i in range(len(id2label))]
+        self.image_processor = AutoImageProcessor.from_pretrained(directory)
+
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if ONNX_THREADS > 0:
+            options.intra_op_num_threads = ONNX_THREADS
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+
+    def __call__(self, images, batch_size: Optional[int] = None):
+        pixel_values = self.image_processor(images, return_tensors="np")["pixel_values"]
+        return self.predict_pixels(pixel_values)
+
+    def predict_pixels(self, pixel_values):
+        """Scores an (N, 3, H, W) float32 array, skipping the image processor."""
+        (logits,) = self.session.run(["logits"], {"pixel_values": pixel_values})
+        return _label_scores(_softmax(logits), self.labels)
+
+
+def load_image_backend(name: str = IMAGE_BACKEND, model_name: str = IMAGE_MODEL_NAME):
+    """Creates the backend called `name` (one of BACKENDS)."""
+    if name == "torch":
+        return TorchBackend(model_name)
+    if name == "torch-int8":
+        return TorchBackend(model_name, quantize=True)
+    if name in ("onnx", "onnx-int8"):
+        return OnnxBackend(model_name, quantized=name == "onnx-int8")
+    raise ValueError(f"Unknown IMAGE_BACKEND '{name}', use one of: {', '.join(BACKENDS)}")
+
+
+# --- Export ---
+
+def export(model_name: str = IMAGE_MODEL_NAME, backends=("onnx", "onnx-int8")):
+    """
+    Builds the ONNX artifacts of the model in artifact_dir(): the graph
+    (with a dynamic batch dimension), its int8 version, and the model's
+    config and image processor settings.
+    """
+    import torch
+    from transformers import AutoImageProcessor, AutoModelForImageClassification
+
+    directory = artifact_dir(model_name)
+    os.makedirs(directory, exist_ok=True)
+    fp32_path = os.path.join(directory, _ONNX_FILES["onnx"])
+
+    model = AutoModelForImageClassification.from_pretrained(model_name).eval()
+    processor = AutoImageProcessor.from_pretrained(model_name)
+    model.config.save_pretrained(directory)
+    processor.save_pretrained(directory)
+
+    if not os.path.exists(fp32_path):
+        size = processor.size
+        height = size.get("height") or size.get("shortest_edge")
+        width = size.get("width") or size.get("shortest_edge")
+        dummy = torch.zeros(1, 3, height, width)
+        # Plain tuple outputs trace more reliably than ModelOutput objects
+        model.config.return_dict = False
+        logger.info("Exporting %s to %s", model_name, fp32_path)
+        # Written under a temporary name and renamed, so a worker loading
+        # the artifact at the same time never sees a half-written file.
+        with torch.no_grad():
+            torch.onnx.export(
+                model, (dummy,), fp32_path + ".tmp",
+                input_names=["pixel_values"],
+                output_names=["logits"],
+                dynamic_axes={"pixel_values": {0: "batch"}, "logits": {0: "batch"}},
+                opset_version=17,
+                dynamo=False,
+            )
+        os.replace(fp32_path + ".tmp", fp32_path)
+
+    int8_path = os.path.join(directory, _ONNX_FILES["onnx-int8"])
+    if "onnx-int8" in backends and not os.path.exists(int8_path):
+        try:
+            from onnxruntime.quantization import QuantType, quantize_dynamic
+        except ImportError:
+            raise RuntimeError("Quantizing the ONNX graph needs: pip install onnxruntime onnx")
+        # Dynamic quantization: int8 weights, activations quantized per
+        # batch at run time, so no calibration data is needed.
+        logger.info("Quantizing %s to %s", fp32_path, int8_path)
+        quantize_dynamic(fp32_path, int8_path + ".tmp", weight_type=QuantType.QInt8)
+        os.replace(int8_path + ".tmp", int8_path)
+
+    return directory
+
+
+# --- Parity check ---
+
+def _score_images(backend_name: str, paths: List[str], batch_size: int) -> dict:
+    """
+    Runs in a fresh process per backend, so the memory numbers belong to
+    that backend alone.
+    """
+    from PIL import Image
+
+    started = time.perf_counter()
+    backend = load_image_backend(backend_name)
+    load_s = time.perf_counter() - started
+
+    fake_scores = []
+    inference_s = 0.0
+    for i in range(0, len(paths), batch_size):
+        images = [Image.open(path).convert("RGB") for path in paths[i:i + batch_size]]
+        started = time.perf_counter()
+        results = backend(images, batch_size=len(images))
+        inference_s += time.perf_counter() - started
+        for result in results:
+            scores = {item["label"].lower(): item["score"] for item in result}
+            fake_scores.append(scores.get("fake", 0.0))
+
+    return {
+        "fake_scores": fake_scores,
+        "load_s": load_s,
+        "ms_per_image": inference_s / len(paths) * 1000.0 if paths else 0.0,
+        # ru_maxrss is in KiB on Linux
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0,
+    }
+
+
+def parity(args) -> dict:
+    from bulk_scan import find_images, label_for
+
+    paths = list(find_images(args.dataset))
+    if args.limit:
+        paths = paths[:args.limit]
+    if not paths:
+        raise SystemExit(f"No images found under {args.dataset}")
+    labels = [label_for(path) for path in paths]
+
+    def run(backend_name: str) -> dict:
+        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+            return pool.submit(_score_images, backend_name, paths, args.batch_size).result()
+
+    def accuracy(fake_scores) -> Optional[float]:
+        labelled = [(score, label) for score, label in zip(fake_scores, labels) if label]
+        if not labelled:
+            return None
+        return sum((score >= 0.5) == (label == "fake") for score, label in labelled) / len(labelled)
+
+    print(f"Scoring {len(paths)} image(s) with the fp32 reference...")
+    reference = run("torch")
+    report = {
+        "images": len(paths),
+        "reference": {
+            "backend": "torch",
+            "accuracy": accuracy(reference["fake_scores"]),
+            "ms_per_image": reference["ms_per_image"],
+            "max_rss_mb": reference["max_rss_mb"],
+        },
+        "backends": [],
+    }
+
+    for backend_name in args.backend:
+        print(f"Scoring {len(paths)} image(s) with {backend_name}...")
+        candidate = run(backend_name)
+        diffs = [abs(a - b) for a, b in zip(candidate["fake_scores"], reference["fake_scores"])]
+        agreement = sum(
+            (a >= 0.5) == (b >= 0.5) for a, b in zip(candidate["fake_scores"], reference["fake_scores"])
+        ) / len(paths)
+        report["backends"].append({
+            "backend": backend_name,
+            "verdict_agreement": agreement,
+            "max_score_diff": max(diffs),
+            "mean_score_diff": sum(diffs) / len(diffs),
+            "accuracy": accuracy(candidate["fake_scores"]),
+            "ms_per_image": candidate["ms_per_image"],
+            "speedup": reference["ms_per_image"] / candidate["ms_per_image"] if candidate["ms_per_image"] else None,
+            "max_rss_mb": candidate["max_rss_mb"],
+            "passed": agreement >= args.min_agreement,
+        })
+    return report
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Image detector inference backends.")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Build the cached ONNX artifacts")
+    export_parser.add_argument("--model", default=IMAGE_MODEL_NAME, help="HuggingFace model name")
+    export_parser.add_argument("--no-int8", dest="int8", action="store_false",
+                               help="Only export the fp32 graph")
+
+    parity_parser = commands.add_parser("parity", help="Compare backends with the fp32 model")
+    parity_parser.add_argument("dataset", nargs="?", default=os.path.join("..", "Dataset"),
+                               help="Folder of (labelled) images (../Dataset)")
+    parity_parser.add_argument("--backend", nargs="+", default=["torch-int8", "onnx", "onnx-int8"],
+                               choices=[name for name in BACKENDS if name != "torch"],
+                               help="Backends to check (all)")
+    parity_parser.add_argument("--limit", type=int, default=0, help="Use at most this many images")
+    parity_parser.add_argument("--batch-size", type=int, default=16, help="Images per call (16)")
+    parity_parser.add_argument("--min-agreement", type=float, default=0.99,
+                               help="Share of verdicts that must match fp32 (0.99)")
+    args = parser.parse_args(argv)
+
+    if args.command == "export":
+        backends = ("onnx", "onnx-int8") if args.int8 else ("onnx",)
+        directory = export(args.model, backends)
+        print(f"Artifacts written to {directory}")
+        return 0
+
+    report = parity(args)
+    print(json.dumps(report, indent=2))
+    return 0 if all(backend["passed"] for backend in report["backends"]) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
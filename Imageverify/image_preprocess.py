@@ -0,0 +1,188 @@
+# file: image_preprocess.py
+#
+# Fast decode + preprocessing for the image model, replacing the generic
+# transformers image processor on the hot path.
+#
+#   1. JPEGs are decoded at reduced size (PIL draft mode: the decoder's
+#      DCT scaling gives 1/2, 1/4 or 1/8 of the resolution directly), so
+#      a 12 MP phone photo is never decoded at full size.
+#   2. The image is resized to the model's input size.
+#   3. Rescale + normalize is one vectorized NumPy operation per image,
+#      written straight into a preallocated (N, 3, H, W) float32 batch.
+#
+# The output is the model's `pixel_values` input; see
+# image_backends.*.predict_pixels.
+#
+# Parity check against the transformers processor (and the model's
+# verdicts on both inputs):
+#   python image_preprocess.py ../Dataset
+#
+import argparse
+import json
+import os
+import sys
+import threading
+from typing import List, Optional
+
+import numpy as np
+from PIL import Image
+
+# --- Config ---
+# Decode JPEGs at reduced size (1) or always at full size (0).
+IMAGE_DRAFT_DECODE = os.getenv("IMAGE_DRAFT_DECODE", "1") == "1"
+
+
+class ImagePreprocessor:
+    """
+    Decodes, resizes and normalizes images exactly like a ViT-style
+    transformers image processor (resize to a fixed height x width,
+    rescale, normalize), but without its per-call overhead.
+    """
+
+    def __init__(self, height: int, width: int, mean, std,
+                 rescale_factor: float = 1 / 255, resample=Image.BILINEAR,
+                 draft: bool = IMAGE_DRAFT_DECODE):
+        self.height = height
+        self.width = width
+        self.resample = resample
+        self.draft = draft
+        # (x * rescale - mean) / std == x * scale + offset
+        std = np.asarray(std, dtype=np.float32)
+        self._scale = (np.float32(rescale_factor) / std).reshape(3, 1, 1)
+        self._offset = (-np.asarray(mean, dtype=np.float32) / std).reshape(3, 1, 1)
+        # One reusable batch buffer per thread (see to_batch)
+        self._buffers = threading.local()
+
+    @classmethod
+    def from_processor(cls, processor, **kwargs) -> Optional["ImagePreprocessor"]:
+        """
+        Mirrors a transformers image processor's settings, or returns None
+        if it does something this fast path doesn't (e.g. center cropping).
+        """
+        size = getattr(processor, "size", None) or {}
+        if "height" not in size or "width" not in size or getattr(processor, "do_center_crop", False):
+            return None
+        do_rescale = getattr(processor, "do_rescale", True)
+        do_normalize = getattr(processor, "do_normalize", True)
+        return cls(
+            height=size["height"],
+            width=size["width"],
+            mean=processor.image_mean if do_normalize else (0.0, 0.0, 0.0),
+            std=processor.image_std if do_normalize else (1.0, 1.0, 1.0),
+            rescale_factor=processor.rescale_factor if do_rescale else 1.0,
+            resample=Image.Resampling(int(getattr(processor, "resample", Image.BILINEAR))),
+            **kwargs,
+        )
+
+    # --- Per image (runs in the request's worker thread) ---
+
+    def resize(self, img: Image.Image) -> np.ndarray:
+        """An opened image -> (H, W, 3) uint8 array at the model's input size."""
+        if img.mode != "RGB":
+            img = img.convert("RGB")
+        if img.size != (self.width, self.height):
+            img = img.resize((self.width, self.height), resample=self.resample)
+        return np.asarray(img, dtype=np.uint8)
+
+    def load(self, source) -> np.ndarray:
+        """
+        Decodes a file (path or binary file-like) straight to the model's
+        input size. Returns an (H, W, 3) uint8 array.
+        """
+        with Image.open(source) as img:
+            if self.draft and img.format == "JPEG":
+                # Picks the smallest DCT scale that is still at least the
+                # target size; a no-op for small images.
+                img.draft("RGB", (self.width, self.height))
+            return self.resize(img)
+
+    # --- Per batch (the batcher's worker thread, or a direct batch call) ---
+
+    def to_batch(self, arrays: List[np.ndarray]) -> np.ndarray:
+        """
+        Normalizes (H, W, 3) uint8 arrays into an (N, 3, H, W) float32 batch.
+
+        The batch buffer is reused from call to call on the same thread, so
+        the result is valid until that thread's next call: run the forward
+        pass on it before normalizing the next batch. Other threads (the
+        micro-batcher vs. detect_deepfake_batch) have their own buffers.
+        """
+        n = len(arrays)
+        buffer: Optional[np.ndarray] = getattr(self._buffers, "batch", None)
+        if buffer is None or len(buffer) < n:
+            buffer = self._buffers.batch = np.empty((n, 3, self.height, self.width), dtype=np.float32)
+        batch = buffer[:n]
+        for i, array in enumerate(arrays):
+            chw = array.transpose(2, 0, 1)
+            np.multiply(chw, self._scale, out=batch[i], casting="unsafe")
+            batch[i] += self._offset
+        return batch
+
+
+# --- Parity check ---
+
+def parity(args) -> dict:
+    from bulk_scan import find_images
+    from image_backends import load_image_backend
+
+    paths = list(find_images(args.dataset))
+    if args.limit:
+        paths = paths[:args.limit]
+    if not paths:
+        raise SystemExit(f"No images found under {args.dataset}")
+
+    backend = load_image_backend(args.backend)
+    processor = backend.image_processor
+    fast = ImagePreprocessor.from_processor(processor, draft=args.draft)
+    if fast is None:
+        raise SystemExit("This model's image processor isn't supported by the fast path")
+
+    pixel_diffs = []
+    score_diffs = []
+    agreement = 0
+    for path in paths:
+        with Image.open(path) as img:
+            reference = processor(img.convert("RGB"), return_tensors="np")["pixel_values"]
+        candidate = fast.to_batch([fast.load(path)]).copy()
+        pixel_diffs.append(float(np.abs(reference - candidate).max()))
+
+        (ref_result,), (fast_result,) = backend.predict_pixels(reference), backend.predict_pixels(candidate)
+        ref_fake = {r["label"].lower(): r["score"] for r in ref_result}.get("fake", 0.0)
+        fast_fake = {r["label"].lower(): r["score"] for r in fast_result}.get("fake", 0.0)
+        score_diffs.append(abs(ref_fake - fast_fake))
+        agreement += (ref_fake >= 0.5) == (fast_fake >= 0.5)
+
+    return {
+        "images": len(paths),
+        "draft_decode": args.draft,
+        "max_pixel_diff": max(pixel_diffs),
+        "mean_pixel_diff": sum(pixel_diffs) / len(pixel_diffs),
+        "max_score_diff": max(score_diffs),
+        "verdict_agreement": agreement / len(paths),
+        "passed": agreement / len(paths) >= args.min_agreement and max(score_diffs) <= args.max_score_diff,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Check the fast image preprocessing against the transformers processor."
+    )
+    parser.add_argument("dataset", nargs="?", default=os.path.join("..", "Dataset"),
+                        help="Folder of images (../Dataset)")
+    parser.add_argument("--backend", default="torch", help="Image backend to score with (torch)")
+    parser.add_argument("--no-draft", dest="draft", action="store_false",
+                        help="Decode at full size (should then match the processor exactly)")
+    parser.add_argument("--limit", type=int, default=0, help="Use at most this many images")
+    parser.add_argument("--min-agreement", type=float, default=0.99,
+                        help="Share of verdicts that must match (0.99)")
+    parser.add_argument("--max-score-diff", type=float, default=0.05,
+                        help="Largest allowed change of the fake score (0.05)")
+    args = parser.parse_args(argv)
+
+    report = parity(args)
+    print(json.dumps(report, indent=2))
+    return 0 if report["passed"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
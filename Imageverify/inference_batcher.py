@@ -0,0 +1,146 @@
+# file: inference_batcher.py
+#
+# A small dynamic micro-batching scheduler.
+#
+# Callers from many threads hand in one item each. A single background
+# thread collects items until either `max_batch_size` is reached or
+# `max_wait_ms` has passed since the first item arrived, runs ONE batched
+# call, and hands each caller back its own result.
+#
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List
+
+
+class MicroBatcher:
+    """
+    Collects single items from concurrent callers into batches.
+
+    Args:
+        batch_fn: Called with a list of items, must return a list of
+            results in the same order.
+        max_batch_size: Largest batch that will be handed to `batch_fn`.
+        max_wait_ms: How long to wait for more items after the first one
+            of a batch has arrived.
+        name: Used in log lines and stats.
+    """
+
+    def __init__(self, batch_fn: Callable[[List[Any]], List[Any]],
+                 max_batch_size: int = 16, max_wait_ms: float = 10.0,
+                 name: str = "batcher"):
+        self.batch_fn = batch_fn
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait_s = max(0.0, float(max_wait_ms)) / 1000.0
+        self.name = name
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._worker = None
+
+        # --- Stats ---
+        self._items_total = 0
+        self._batches_total = 0
+        self._max_queue_depth = 0
+        self._batch_size_counts: Dict[int, int] = {}
+        self._wait_time_total_s = 0.0
+        self._run_time_total_s = 0.0
+
+    def _ensure_worker(self):
+        # The worker thread is started on first use (not in __init__) so that
+        # a batcher created at import time survives a fork() of the process.
+        if self._worker is not None and self._worker.is_alive():
+            return
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(
+                    target=self._run, name=f"{self.name}-worker", daemon=True
+                )
+                self._worker.start()
+
+    def submit(self, item: Any) -> Future:
+        """Queues one item and returns a Future for its result."""
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((item, future, time.perf_counter()))
+        depth = self._queue.qsize()
+        if depth > self._max_queue_depth:
+            self._max_queue_depth = depth
+        return future
+
+    def infer(self, item: Any, timeout: float = None) -> Any:
+        """Blocking helper: submit one item and wait for its result."""
+        return self.submit(item).result(timeout=timeout)
+
+    def _collect_batch(self) -> list:
+        # Block until the first item of the next batch shows up.
+        batch = [self._queue.get()]
+        deadline = time.perf_counter() + self.max_wait_s
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                # Don't wait any more, but still take whatever is queued.
+                try:
+                    batch.append(self._queue.get_nowait())
+                    continue
+                except queue.Empty:
+                    break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            items = [item for (item, _, _) in batch]
+            futures = [future for (_, future, _) in batch]
+
+            started = time.perf_counter()
+            try:
+                results = self.batch_fn(items)
+                if len(results) != len(items):
+                    raise RuntimeError(
+                        f"{self.name}: batch_fn returned {len(results)} results for {len(items)} items"
+                    )
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+                results = None
+            finished = time.perf_counter()
+
+            if results is not None:
+                for future, result in zip(futures, results):
+                    if not future.done():
+                        future.set_result(result)
+
+            with self._lock:
+                size = len(batch)
+                self._items_total += size
+                self._batches_total += 1
+                self._batch_size_counts[size] = self._batch_size_counts.get(size, 0) + 1
+                self._wait_time_total_s += sum(started - queued_at for (_, _, queued_at) in batch)
+                self._run_time_total_s += finished - started
+
+    def stats(self) -> dict:
+        """Returns counters that help tune `max_batch_size` / `max_wait_ms`."""
+        with self._lock:
+            batches = self._batches_total
+            items = self._items_total
+            return {
+                "name": self.name,
+                "max_batch_size": self.max_batch_size,
+                "max_wait_ms": self.max_wait_s * 1000.0,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "items_total": items,
+                "batches_total": batches,
+                "avg_batch_size": (items / batches) if batches else 0.0,
+                "batch_size_histogram": dict(sorted(self._batch_size_counts.items())),
+                "avg_queue_wait_ms": (self._wait_time_total_s / items * 1000.0) if items else 0.0,
+                "avg_batch_run_ms": (self._run_time_total_s / batches * 1000.0) if batches else 0.0,
+            }
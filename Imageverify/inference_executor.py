@@ -0,0 +1,238 @@
+# file: inference_executor.py
+#
+# Runs the blocking, CPU-heavy model calls (torch / librosa) outside of
+# the FastAPI event loop.
+#
+# Image, audio and video get SEPARATE worker pools, so a burst of long
+# audio files or videos can't starve image verification, and none of them
+# can stall cheap endpoints like "/" or "/check-hash".
+#
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+from instrumentation import get_logger
+
+logger = get_logger("inference_executor")
+
+# --- Config ---
+# "thread": workers share one process (and one copy of each model).
+#           The image micro-batcher then sees all concurrent requests.
+# "process": each worker is its own process with its own model copy.
+INFERENCE_WORKER_KIND = os.getenv("INFERENCE_WORKER_KIND", "thread")
+# Start method used for "process" workers. "spawn" is the safe default
+# once torch has started its own threads.
+INFERENCE_MP_START = os.getenv("INFERENCE_MP_START", "spawn")
+
+# Image workers mostly wait on the shared batcher, so there should be at
+# least as many of them as the max batch size for batches to fill up.
+IMAGE_WORKERS = int(os.getenv("IMAGE_WORKERS", "16"))
+AUDIO_WORKERS = int(os.getenv("AUDIO_WORKERS", "2"))
+# Video workers decode frames and wait on the image batcher; a video's
+# audio track is scored on the audio pool at the same time.
+VIDEO_WORKERS = int(os.getenv("VIDEO_WORKERS", "2"))
+
+# torch intra-op threads per worker (0 = leave torch's default alone).
+# With "thread" workers torch's setting is process-wide, so the larger
+# of the two values wins.
+IMAGE_TORCH_THREADS = int(os.getenv("IMAGE_TORCH_THREADS", "0"))
+AUDIO_TORCH_THREADS = int(os.getenv("AUDIO_TORCH_THREADS", "0"))
+
+
+def _init_worker(torch_threads: int):
+    """Runs once in every new worker process (or once per thread pool)."""
+    if torch_threads <= 0:
+        return
+    try:
+        import torch
+        torch.set_num_threads(torch_threads)
+    except Exception as e:
+        logger.warning("Could not set torch threads to %d: %s", torch_threads, e)
+
+
+# --- Worker entry points ---
+# These are module-level functions so that "process" workers can pickle them.
+# All of them raise when detection fails (never a default verdict), and
+# the exception reaches the awaiting caller unchanged.
+
+def _run_image_detection(source):
+    from ai_detector import detect_deepfake
+    return detect_deepfake(source)
+
+
+def _run_audio_detection(source, from_video: bool = False):
+    if from_video:
+        from video_detector import analyze_video_audio
+        return analyze_video_audio(source)
+    from audio_detector import analyze_audio
+    return analyze_audio(source)
+
+
+def _run_video_detection(source):
+    from video_detector import analyze_video_frames
+    return analyze_video_frames(source)
+
+
+class InferencePool:
+    """
+    One named pool of inference workers.
+
+    The underlying executor is created on first use, so importing this
+    module (e.g. before a fork) doesn't start any threads or processes.
+    """
+
+    def __init__(self, name: str, fn: Callable, workers: int,
+                 kind: str = "thread", torch_threads: int = 0):
+        if kind not in ("thread", "process"):
+            raise ValueError(f"Unknown worker kind '{kind}', expected 'thread' or 'process'")
+        self.name = name
+        self.fn = fn
+        self.workers = max(1, int(workers))
+        self.kind = kind
+        self.torch_threads = torch_threads
+
+        self._executor: Executor = None
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._running = 0
+        self._completed = 0
+        self._failed = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is not None:
+            return self._executor
+        with self._lock:
+            if self._executor is None:
+                if self.kind == "process":
+                    self._executor = ProcessPoolExecutor(
+                        max_workers=self.workers,
+                        mp_context=multiprocessing.get_context(INFERENCE_MP_START),
+                        initializer=_init_worker,
+                        initargs=(self.torch_threads,),
+                    )
+                else:
+                    _init_worker(self.torch_threads)
+                    self._executor = ThreadPoolExecutor(
+                        max_workers=self.workers,
+                        thread_name_prefix=f"{self.name}-infer",
+                    )
+                logger.info("Started %s inference pool: %d %s worker(s)", self.name, self.workers, self.kind)
+        return self._executor
+
+    def _tracked(self, *args):
+        # Only used for thread workers; process workers are tracked from the
+        # event loop side because this function would run in the child.
+        with self._lock:
+            self._queued -= 1
+            self._running += 1
+        try:
+            return self.fn(*args)
+        finally:
+            with self._lock:
+                self._running -= 1
+
+    async def run(self, *args) -> Any:
+        """Runs `fn(*args)` on a worker and awaits the result."""
+        executor = self._get_executor()
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            self._queued += 1
+
+        try:
+            if self.kind == "process":
+                try:
+                    result = await loop.run_in_executor(executor, self.fn, *args)
+                finally:
+                    with self._lock:
+                        self._queued -= 1
+            else:
+                result = await loop.run_in_executor(executor, self._tracked, *args)
+        except Exception:
+            with self._lock:
+                self._failed += 1
+            raise
+
+        with self._lock:
+            self._completed += 1
+        return result
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "kind": self.kind,
+                "workers": self.workers,
+                "torch_threads": self.torch_threads,
+                "started": self._executor is not None,
+                # For process workers "queued" also counts running tasks.
+                "queued": self._queued,
+                "running": self._running,
+                "completed": self._completed,
+                "failed": self._failed,
+            }
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False, cancel_futures=True)
+
+
+# --- Global pools (one per media type) ---
+IMAGE_POOL = InferencePool(
+    "image", _run_image_detection, IMAGE_WORKERS,
+    kind=INFERENCE_WORKER_KIND, torch_threads=IMAGE_TORCH_THREADS,
+)
+AUDIO_POOL = InferencePool(
+    "audio", _run_audio_detection, AUDIO_WORKERS,
+    kind=INFERENCE_WORKER_KIND, torch_threads=AUDIO_TORCH_THREADS,
+)
+# Always threads: frames are scored by the image batcher of this process
+VIDEO_POOL = InferencePool(
+    "video", _run_video_detection, VIDEO_WORKERS,
+    kind="thread", torch_threads=IMAGE_TORCH_THREADS,
+)
+
+
+async def run_image_detection(source) -> tuple:
+    """Awaitable version of ai_detector.detect_deepfake."""
+    return await IMAGE_POOL.run(source)
+
+
+async def run_audio_detection(source) -> dict:
+    """
+    Awaitable version of audio_detector.analyze_audio: the verdict plus
+    per-segment scores.
+    """
+    return await AUDIO_POOL.run(source)
+
+
+async def run_video_detection(source, audio_source) -> dict:
+    """
+    Scores a video's sampled frames (video pool) and its audio track
+    (audio pool) in parallel and combines them into one verdict; see
+    video_detector.combine_verdicts. `source` and `audio_source` must be
+    independent readers of the same file.
+    """
+    from video_detector import combine_verdicts
+    frames, audio = await asyncio.gather(
+        VIDEO_POOL.run(source),
+        AUDIO_POOL.run(audio_source, True),
+    )
+    return combine_verdicts(frames, audio)
+
+
+def get_executor_stats() -> dict:
+    return {
+        "image": IMAGE_POOL.stats(),
+        "audio": AUDIO_POOL.stats(),
+        "video": VIDEO_POOL.stats(),
+    }
+
+
+def shutdown_executors():
+    IMAGE_POOL.shutdown()
+    AUDIO_POOL.shutdown()
+    VIDEO_POOL.shutdown()
@@ -0,0 +1,445 @@
+# file: instrumentation.py
+#
+# Structured instrumentation for the service:
+#   - Prometheus-style metrics (counters, gauges, histograms) rendered in
+#     the Prometheus text format for GET /metrics,
+#   - timing spans around each pipeline stage ("with span('decode'):"),
+#   - a non-blocking logger (records are handed to a background thread,
+#     so request handlers never block on stdout),
+#   - an opt-in profiler that dumps a cProfile profile for the next N
+#     requests.
+#
+import asyncio
+import cProfile
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# --- Config ---
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# Profile this many requests after startup (0 = off).
+PROFILE_REQUESTS = int(os.getenv("PROFILE_REQUESTS", "0"))
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+# Allow arming the profiler at runtime through POST /debug/profile.
+PROFILE_ENDPOINT = os.getenv("PROFILE_ENDPOINT", "0") == "1"
+
+# Latency buckets (seconds) shared by all timing histograms.
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+LabelValues = Tuple[str, ...]
+
+
+# --- Logging ---
+
+_log_listener = None
+_log_lock = threading.Lock()
+
+
+def get_logger(name: str) -> logging.Logger:
+    """
+    Returns a logger under the "deepshield" namespace. Records go through a
+    queue to a background thread that does the actual (blocking) writing.
+    """
+    if _log_listener is None:
+        with _log_lock:
+            if _log_listener is None:
+                _start_logging()
+    return logging.getLogger(f"deepshield.{name}")
+
+
+def _start_logging():
+    global _log_listener
+    root = logging.getLogger("deepshield")
+    root.setLevel(LOG_LEVEL)
+    root.propagate = False
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    records = queue.SimpleQueue()
+    root.addHandler(logging.handlers.QueueHandler(records))
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    _log_listener = logging.handlers.QueueListener(records, output)
+    _log_listener.start()
+
+
+def _restart_logging_after_fork():
+    # The writer thread doesn't exist in a forked child (see serve.py):
+    # give the child its own queue and writer.
+    global _log_lock
+    _log_lock = threading.Lock()
+    if _log_listener is not None:
+        _start_logging()
+
+
+os.register_at_fork(after_in_child=_restart_logging_after_fork)
+
+
+def stop_logging():
+    """Flushes and stops the background log writer."""
+    global _log_listener
+    with _log_lock:
+        if _log_listener is not None:
+            _log_listener.stop()
+            _log_listener = None
+
+
+# --- Metrics ---
+
+def _format_labels(names: Tuple[str, ...], values: LabelValues, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.label_names = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: dict) -> LabelValues:
+        return tuple(str(labels.get(name, "")) for name in self.label_names)
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_number(value)}"
+                for key, value in items]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelValues, float] = {}
+
+    def set(self, value: float, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount: float = 1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(self.label_names, key)} {_format_number(value)}"
+                for key, value in items]
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Iterable[str] = (),
+                 buckets: Iterable[float] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # label values -> [bucket counts..., sum, count]
+        self._series: Dict[LabelValues, list] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._series.items()]
+        lines = []
+        for key, series in items:
+            for bound, count in zip(self.buckets, series):
+                le = f'le="{_format_number(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, le)} {count}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.label_names, key, inf)} {series[-1]}")
+            lines.append(f"{self.name}_sum{_format_labels(self.label_names, key)} {_format_number(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.label_names, key)} {series[-1]}")
+        return lines
+
+
+class Registry:
+    """All metrics of the process, plus callbacks that export other stats."""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], Iterable[_Metric]]] = []
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, cls, name: str, help_text: str, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, help_text, **kwargs)
+            return metric
+
+    def counter(self, name: str, help_text: str, labels: Iterable[str] = ()) -> Counter:
+        return self._get_or_create(Counter, name, help_text, labels=labels)
+
+    def gauge(self, name: str, help_text: str, labels: Iterable[str] = ()) -> Gauge:
+        return self._get_or_create(Gauge, name, help_text, labels=labels)
+
+    def histogram(self, name: str, help_text: str, labels: Iterable[str] = (),
+                  buckets: Iterable[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(Histogram, name, help_text, labels=labels, buckets=buckets)
+
+    def add_collector(self, collect: Callable[[], Iterable[_Metric]]):
+        """`collect()` is called on every scrape and returns fresh metrics."""
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for collect in self._collectors:
+            try:
+                metrics.extend(collect())
+            except Exception as e:
+                get_logger("instrumentation").warning("Metrics collector failed: %s", e)
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "deepshield_stage_seconds", "Time spent in each processing stage.", labels=("stage",)
+)
+STAGE_IN_FLIGHT = REGISTRY.gauge(
+    "deepshield_stage_in_flight", "Operations currently inside each processing stage.", labels=("stage",)
+)
+STAGE_ERRORS = REGISTRY.counter(
+    "deepshield_stage_errors_total", "Processing stages that raised an error.", labels=("stage",)
+)
+
+
+@contextmanager
+def span(stage: str):
+    """
+    Times a block of code as one processing stage. Works in sync code and
+    around awaits in async code alike.
+    """
+    STAGE_IN_FLIGHT.inc(stage=stage)
+    started = time.perf_counter()
+    try:
+        yield
+    except BaseException:
+        STAGE_ERRORS.inc(stage=stage)
+        raise
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
+        STAGE_IN_FLIGHT.dec(stage=stage)
+
+
+def _metric_name(*parts) -> str:
+    name = "_".join(str(part) for part in parts if part != "")
+    return "".join(c if c.isalnum() else "_" for c in name).lower()
+
+
+def gauges_from_stats(prefix: str, stats: dict) -> List[Gauge]:
+    """
+    Turns one of the existing stats() dicts into gauges, so everything on
+    /stats is also scraped from /metrics. Numbers and booleans become
+    `deepshield_<prefix>_<key>`; a nested dict keyed by numbers (e.g. a
+    batch-size histogram) becomes one gauge with a "key" label. Strings
+    and lists are skipped.
+    """
+    gauges = []
+    for key, value in stats.items():
+        name = _metric_name("deepshield", prefix, key)
+        if isinstance(value, bool) or isinstance(value, (int, float)):
+            gauge = Gauge(name, f"{prefix} {key} (from /stats).")
+            gauge.set(int(value) if isinstance(value, bool) else value)
+            gauges.append(gauge)
+        elif isinstance(value, dict) and value and all(str(k).isdigit() for k in value):
+            gauge = Gauge(name, f"{prefix} {key} (from /stats).", labels=("key",))
+            for k, v in value.items():
+                gauge.set(v, key=k)
+            gauges.append(gauge)
+        elif isinstance(value, dict):
+            gauges.extend(gauges_from_stats(_metric_name(prefix, key), value))
+    return gauges
+
+
+def render_metrics() -> str:
+    """All metrics in the Prometheus text exposition format."""
+    return REGISTRY.render()
+
+
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "deepshield_http_request_seconds", "Time from request start to the end of the response.",
+    labels=("method", "route", "status"),
+)
+HTTP_IN_FLIGHT = REGISTRY.gauge(
+    "deepshield_http_requests_in_flight", "HTTP requests currently being handled."
+)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware that times every HTTP request (including streamed
+    responses, up to their last byte), tracks requests in flight and runs
+    the request profiler. Requests are labelled with the route template
+    (e.g. /jobs/{job_id}), not the raw path.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        HTTP_IN_FLIGHT.inc()
+        started = time.perf_counter()
+        try:
+            async with PROFILER.maybe_profile(f"{scope['method']} {scope['path']}"):
+                await self.app(scope, receive, send_with_status)
+        finally:
+            HTTP_IN_FLIGHT.dec()
+            # The router stores the matched route in the scope
+            route = scope.get("route")
+            HTTP_REQUEST_SECONDS.observe(
+                time.perf_counter() - started,
+                method=scope["method"],
+                route=getattr(route, "path", "unmatched"),
+                status=status["code"],
+            )
+
+
+# --- Sampling profiler ---
+
+class RequestProfiler:
+    """
+    Profiles the next N requests with cProfile and dumps one .prof file per
+    request into PROFILE_DIR (open with `python -m pstats` or snakeviz).
+
+    Only one request is profiled at a time, and since the event loop runs
+    other requests' code in between awaits, a profile also contains their
+    work on the loop thread; inference on worker threads is not included.
+    """
+
+    def __init__(self, requests: int = 0, directory: str = "profiles"):
+        self.remaining = max(0, int(requests))
+        self.directory = directory
+        self.written = 0
+        self._busy = False
+        self._lock = threading.Lock()
+
+    def arm(self, requests: int):
+        with self._lock:
+            self.remaining = max(0, int(requests))
+
+    def _try_start(self) -> bool:
+        with self._lock:
+            if self.remaining <= 0 or self._busy:
+                return False
+            self.remaining -= 1
+            self._busy = True
+            return True
+
+    def _write(self, profile: cProfile.Profile, name: str) -> str:
+        # Collecting and marshalling the stats takes a while for a big
+        # profile, so this runs on a worker thread, not the event loop
+        os.makedirs(self.directory, exist_ok=True)
+        safe_name = "".join(c if c.isalnum() else "_" for c in name).strip("_") or "request"
+        path = os.path.join(self.directory, f"{int(time.time() * 1000)}_{safe_name}.prof")
+        profile.dump_stats(path)
+        return path
+
+    @asynccontextmanager
+    async def maybe_profile(self, name: str):
+        if not self._try_start():
+            yield
+            return
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # Another profiler (e.g. a debugger) is already active
+            with self._lock:
+                self._busy = False
+            yield
+            return
+        try:
+            yield
+        finally:
+            profile.disable()
+            try:
+                path = await asyncio.to_thread(self._write, profile, name)
+            finally:
+                with self._lock:
+                    self._busy = False
+            with self._lock:
+                self.written += 1
+            get_logger("instrumentation").info("Wrote request profile %s", path)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"remaining": self.remaining, "written": self.written, "directory": self.directory}
+
+
+PROFILER = RequestProfiler(PROFILE_REQUESTS, PROFILE_DIR)
@@ -1,27 +1,107 @@
 # file: main.py
 import uvicorn
-import hashlib
+import asyncio
+import json
 import os
-import shutil
-from fastapi import FastAPI, File, UploadFile, HTTPException
+import re
+from contextlib import asynccontextmanager
+from typing import List
+from fastapi import Body, FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware # To allow our webpage to talk to it
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 
-from ai_detector import detect_deepfake
-from audio_detector import detect_audio_deepfake # <-- ADD THIS
-from aptos_service import register_verdict_on_chain, get_verdict_from_chain
-# --- Import our other Python modules ---
-from ai_detector import detect_deepfake       # Our AI Model (Phase 2)
-from aptos_service import register_verdict_on_chain # Our Aptos Connector (Step 4)
+# Cheap imports: the models (and torch / transformers) are loaded on
+# first use or by the startup warmup, see startup.py
+from ai_detector import get_batcher_stats, get_cascade_stats as get_image_cascade_stats
+from audio_detector import get_cascade_stats as get_audio_cascade_stats
+import aptos_service
+from inference_executor import (
+    run_image_detection,
+    run_audio_detection,
+    run_video_detection,
+    get_executor_stats,
+    shutdown_executors,
+)
+from verdict_cache import VERDICT_CACHE
+from upload_ingest import (
+    IngestedUpload,
+    receive_upload,
+    iter_uploads,
+    is_archive,
+    iter_archive_members,
+)
+from submission_queue import SUBMISSION_QUEUE, STATUS_FAILED, explorer_url
+from admission import ADMISSION
+from verdict_index import (
+    VERDICT_INDEX,
+    VERDICT_INDEX_FOLLOW,
+    CHAIN_FOLLOWER,
+    lookup_verdict,
+    lookup_verdicts,
+)
+from perceptual_index import (
+    PERCEPTUAL,
+    PERCEPTUAL_INDEX,
+    fingerprint,
+    find_near_duplicate,
+    remember,
+)
+from instrumentation import (
+    REGISTRY,
+    PROFILER,
+    PROFILE_ENDPOINT,
+    MetricsMiddleware,
+    gauges_from_stats,
+    get_logger,
+    render_metrics,
+    span,
+    stop_logging,
+)
+from startup import readiness, start_warmup
+
+# Run the chain submission workers and the chain follower in this
+# process. serve.py turns them off in all but one of its workers.
+BACKGROUND_WORKERS = os.getenv("BACKGROUND_WORKERS", "1") == "1"
+# Max hashes in one POST /lookup-hashes request.
+LOOKUP_MAX_HASHES = int(os.getenv("LOOKUP_MAX_HASHES", "256"))
+
+_SHA256_HEX = re.compile(r"[0-9a-f]{64}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """ Starts and stops the background parts of the server. """
+    # Load and warm up the models in the background; /readyz reports
+    # when they're done
+    start_warmup()
+    if BACKGROUND_WORKERS:
+        # Start the on-chain submission workers (also resumes jobs left
+        # over from a previous run)
+        SUBMISSION_QUEUE.start()
+        # Keep the local verdict index in sync with the chain
+        if VERDICT_INDEX_FOLLOW:
+            CHAIN_FOLLOWER.start()
+    yield
+    await CHAIN_FOLLOWER.stop()
+    await SUBMISSION_QUEUE.stop()
+    await aptos_service.close_client()
+    # Stop the inference worker pools on shutdown
+    shutdown_executors()
+    stop_logging()
 
 # --- Create the FastAPI App ---
 app = FastAPI(
     title="Deepfake Detection API",
-    description="An API to detect deepfakes and log results on the Aptos blockchain."
+    description="An API to detect deepfakes and log results on the Aptos blockchain.",
+    lifespan=lifespan,
 )
 
+logger = get_logger("main")
+
+# Max files of one /verify-batch request being processed at the same time
+VERIFY_BATCH_CONCURRENCY = int(os.getenv("VERIFY_BATCH_CONCURRENCY", "32"))
+
 # --- Add CORS Middleware ---
 # This is required to allow our (future) HTML webpage to call this API
-import os
 
 # Get allowed origins from environment variable or use defaults
 ALLOWED_ORIGINS = os.getenv(
@@ -37,124 +117,564 @@ app.add_middleware(
     allow_headers=["*"], # Allows all headers
 )
 
+# Request latency / in-flight metrics and the opt-in request profiler
+app.add_middleware(MetricsMiddleware)
+
 @app.get("/")
 def read_root():
     """ A simple 'hello' endpoint to check if the server is running. """
     return {
         "message": "Welcome to the Deepfake Verifier API. Use the POST /verify endpoint to upload an image or audio file.",
         "endpoints": {
-            "verify": "POST /verify - Upload an image or audio file for deepfake detection",
+            "verify": "POST /verify - Upload an image, audio or video file for deepfake detection",
+            "verify_batch": "POST /verify-batch - Upload many files (or zip/tar archives), get NDJSON results",
+            "lookup_hashes": "POST /lookup-hashes - Existing verdicts of many SHA-256 hashes, to skip known uploads",
+            "jobs": "GET /jobs/{job_id} - Status of the on-chain submission of a verdict",
+            "stats": "GET /stats - Inference, worker pool, cache and chain queue stats",
+            "metrics": "GET /metrics - Prometheus metrics (stage latencies, request rates, /stats values)",
+            "healthz": "GET /healthz - Liveness probe",
+            "readyz": "GET /readyz - Readiness probe (models warm, chain node reachable)",
             "docs": "GET /docs - Interactive API documentation"
         }
     }
 
 
-@app.post("/verify")
-async def verify_image_endpoint(file: UploadFile = File(...)):
+@app.get("/healthz")
+def healthz_endpoint():
+    """ Liveness: the process is up and serving requests. """
+    return {"status": "ok"}
+
+
+@app.get("/readyz")
+async def readyz_endpoint():
     """
-    This is the main endpoint for our project.
-    It performs the full end-to-end verification process.
+    Readiness: 200 once the startup models are loaded and warm (and the
+    chain node answers), 503 until then.
     """
+    report = await readiness()
+    return JSONResponse(report, status_code=200 if report["ready"] else 503)
 
-    # 1. Save the uploaded file temporarily
-    temp_file_path = f"temp_{file.filename}"
-    with open(temp_file_path, "wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
 
-    print(f"\n--- New Request: Verifying {file.filename} ---")
+@app.get("/stats")
+async def stats_endpoint():
+    """ Runtime stats used to tune the inference knobs. """
+    return {
+        "image_batcher": get_batcher_stats(),
+        "inference_pools": get_executor_stats(),
+        "cascade": {"image": get_image_cascade_stats(), "audio": get_audio_cascade_stats()},
+        "admission": ADMISSION.stats(),
+        "verdict_cache": VERDICT_CACHE.stats(),
+        "submission_queue": await asyncio.to_thread(SUBMISSION_QUEUE.stats),
+        "tx_pipeline": aptos_service.TX_PIPELINE.stats(),
+        "chain_transport": aptos_service.transport_stats(),
+        "verdict_index": await asyncio.to_thread(VERDICT_INDEX.stats),
+        "chain_follower": CHAIN_FOLLOWER.stats(),
+        "perceptual_index": await asyncio.to_thread(PERCEPTUAL.stats),
+        "profiler": PROFILER.stats(),
+    }
 
-    try:
-        # 2. Calculate the image's SHA-256 hash
-        print("Calculating image hash...")
-        sha256_hash = hashlib.sha256()
-        with open(temp_file_path, "rb") as f:
-            # Read in 4K chunks
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-
-        image_hash_bytes = sha256_hash.digest() # The raw bytes
-        image_hash_hex = image_hash_bytes.hex() # The string representation
-        print(f"Hash: {image_hash_hex}")
-
-        # 3. Run AI Detection (based on file type)
-        print(f"File content type: {file.content_type}")
-        
-        if file.content_type.startswith("image/"):
-            print("Routing to image detector...")
-            (is_fake, confidence) = detect_deepfake(temp_file_path)
-        
-        elif file.content_type.startswith("audio/"):
-            print("Routing to audio detector...")
-            (is_fake, confidence) = detect_audio_deepfake(temp_file_path)
-        
+
+def _stats_gauges():
+    # Runs in a worker thread on every scrape (the queue/index stats read SQLite)
+    return [
+        *gauges_from_stats("image_batcher", get_batcher_stats()),
+        *gauges_from_stats("inference_pool", get_executor_stats()),
+        *gauges_from_stats("image_cascade", get_image_cascade_stats()),
+        *gauges_from_stats("audio_cascade", get_audio_cascade_stats()),
+        *gauges_from_stats("admission", ADMISSION.stats()),
+        *gauges_from_stats("verdict_cache", VERDICT_CACHE.stats()),
+        *gauges_from_stats("submission_queue", SUBMISSION_QUEUE.stats()),
+        *gauges_from_stats("tx_pipeline", aptos_service.TX_PIPELINE.stats()),
+        *gauges_from_stats("chain_transport", aptos_service.transport_stats()),
+        *gauges_from_stats("verdict_index", VERDICT_INDEX.stats()),
+        *gauges_from_stats("chain_follower", CHAIN_FOLLOWER.stats()),
+        *gauges_from_stats("perceptual_index", PERCEPTUAL.stats()),
+    ]
+
+
+REGISTRY.add_collector(_stats_gauges)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """ Prometheus scrape endpoint (text exposition format). """
+    return PlainTextResponse(
+        await asyncio.to_thread(render_metrics),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
+@app.post("/debug/profile")
+async def profile_endpoint(requests: int = 1):
+    """
+    Profiles the next `requests` requests with cProfile (one .prof file
+    each in PROFILE_DIR). Only available with PROFILE_ENDPOINT=1.
+    """
+    if not PROFILE_ENDPOINT:
+        raise HTTPException(status_code=404, detail="Not Found")
+    PROFILER.arm(requests)
+    return PROFILER.stats()
+
+
+def _blockchain_result(job: dict) -> dict:
+    """ The chain-related part of a /verify response, from a queue job. """
+    if job is None:
+        return {"status": "unknown"}
+    return {
+        "job_id": job["job_id"],
+        "status": job["status"],
+        "status_url": f"/jobs/{job['job_id']}",
+        "transaction_hash": job["transaction_hash"],
+        "explorer_url": job["explorer_url"],
+    }
+
+
+# The body is parsed by upload_ingest (streaming), so describe it by hand
+# to keep the interactive docs' upload form.
+VERIFY_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {"file": {"type": "string", "format": "binary"}},
+                    "required": ["file"],
+                }
+            }
+        },
+    }
+}
+
+VERIFY_BATCH_REQUEST_BODY = {
+    "requestBody": {
+        "required": True,
+        "content": {
+            "multipart/form-data": {
+                "schema": {
+                    "type": "object",
+                    "properties": {
+                        "files": {
+                            "type": "array",
+                            "items": {"type": "string", "format": "binary"},
+                            "description": "Images, audio files and/or zip / tar archives of them",
+                        }
+                    },
+                    "required": ["files"],
+                }
+            }
+        },
+    }
+}
+
+
+def _detection_error(image_hash_hex: str, kind: str, error: Exception) -> HTTPException:
+    """
+    The response for a failed detection, for every media type: 422 when
+    the file couldn't be decoded, 500 when the model itself failed.
+    """
+    if isinstance(error, (ValueError, OSError)):
+        logger.info("Could not decode %s %s: %s", kind, image_hash_hex, error)
+        return HTTPException(status_code=422, detail=f"The {kind} file could not be decoded: {error}")
+    logger.error("The %s detector failed on %s: %s", kind, image_hash_hex, error)
+    return HTTPException(status_code=500, detail=f"The {kind} detector failed. Please retry later.")
+
+
+async def verify_upload(file: IngestedUpload) -> dict:
+    """
+    Steps 2-6 of the verification of one received file: hash lookup,
+    AI detection, queueing the on-chain submission and building the
+    response. Raises HTTPException(415) for unsupported file types,
+    HTTPException(503) when the detector for its type is at capacity and
+    HTTPException(422 / 500) when detection fails.
+    """
+    # 2. The image's SHA-256 hash was computed while it streamed in
+    image_hash_bytes = file.digest() # The raw bytes
+    image_hash_hex = image_hash_bytes.hex() # The string representation
+    logger.debug("Hash: %s (%d bytes, in_memory=%s)", image_hash_hex, file.size, file.in_memory)
+
+    # 3. Pick the detector (based on file type)
+    logger.debug("File content type: %s", file.content_type)
+    
+    if file.content_type.startswith("image/"):
+        logger.debug("Routing to image detector...")
+        # Runs on the image worker pool, off the event loop
+        run_detection = run_image_detection
+        kind = "image"
+    
+    elif file.content_type.startswith("audio/"):
+        logger.debug("Routing to audio detector...")
+        # Runs on the (separate) audio worker pool
+        run_detection = run_audio_detection
+        kind = "audio"
+
+    elif file.content_type.startswith("video/"):
+        logger.debug("Routing to video detector...")
+        # Frames (video pool) and the audio track (audio pool) are scored
+        # in parallel, each from its own reader of the upload
+        run_detection = lambda source: run_video_detection(source, file.source())
+        kind = "video"
+    
+    else:
+        # If it's not an image, audio or video, reject it.
+        logger.info("Unsupported file type: %s", file.content_type)
+        raise HTTPException(
+            status_code=415, # 415 Unsupported Media Type
+            detail=f"Unsupported file type: {file.content_type}. Only images, audio and video are allowed."
+        )
+
+    async def compute_verdict():
+        # Only cache misses need the detector. Each media type has bounded
+        # concurrency and a bounded queue: past that, a fast 503 with
+        # Retry-After instead of an ever longer wait.
+        async with ADMISSION.slot(kind):
+            return await detect_and_enqueue()
+
+    async def detect_and_enqueue():
+        # 4a. Re-encoded / resized copies of a file we've already judged
+        # get that file's verdict, without the model or a new transaction.
+        file_fingerprint = None
+        if PERCEPTUAL_INDEX:
+            try:
+                with span("fingerprint"):
+                    file_fingerprint = await asyncio.to_thread(fingerprint, kind, file.source())
+                if file_fingerprint is not None:
+                    match = await asyncio.to_thread(find_near_duplicate, kind, file_fingerprint)
+                    if match is not None:
+                        logger.info("%s is a near-duplicate of %s (distance %d)",
+                                    image_hash_hex, match["content_hash"], match["distance"])
+                        return {
+                            **match["result"],
+                            "near_duplicate_of": {
+                                "image_hash_hex": match["content_hash"],
+                                "distance": match["distance"],
+                            },
+                        }
+            except Exception as e:
+                # No fingerprint: just run the model
+                logger.warning("Could not fingerprint %s: %s", image_hash_hex, e)
+                file_fingerprint = None
+
+        # 4b. Run AI Detection
+        # The decoder reads straight from the ingest buffer. A failed
+        # detection raises: nothing is cached or sent to the chain.
+        try:
+            with span("detect"):
+                detection = await run_detection(file.source())
+        except Exception as e:
+            raise _detection_error(image_hash_hex, kind, e)
+        # Images give (is_fake, confidence); audio and video also give
+        # per-segment / per-frame scores
+        if isinstance(detection, dict):
+            (is_fake, confidence) = (detection["is_fake"], detection["confidence"])
         else:
-            # If it's not an image or audio, reject it.
-            print(f"Unsupported file type: {file.content_type}")
-            raise HTTPException(
-                status_code=415, # 415 Unsupported Media Type
-                detail=f"Unsupported file type: {file.content_type}. Only images and audio are allowed."
+            (is_fake, confidence) = detection
+        logger.info("AI Verdict for %s: is_fake=%s, confidence=%d%%", image_hash_hex, is_fake, confidence)
+
+        # 5. Queue the on-chain submission (done by background workers)
+        with span("chain_enqueue"):
+            job = await asyncio.to_thread(
+                SUBMISSION_QUEUE.enqueue, image_hash_hex, is_fake, confidence
             )
-        
-        print(f"AI Verdict: is_fake={is_fake}, confidence={confidence}%")
-        
-        # 4. Submit to Aptos Blockchain (from aptos_service.py)
-        print("Submitting verdict to Aptos blockchain...")
-        tx_hash = await register_verdict_on_chain(
-            image_hash=image_hash_bytes,
-            is_fake=is_fake,
-            confidence=confidence
-        )
-        print(f"Blockchain TX Hash: {tx_hash}")
-
-        # 5. Return the full result to the user
-        return {
-            "filename": file.filename,
-            "image_hash_hex": image_hash_hex,
-            "ai_verdict": {
-                "is_deepfake": is_fake,
-                "confidence": confidence
-            },
-            "blockchain_result": {
-                "transaction_hash": tx_hash,
-                "explorer_url": f"https://explorer.aptoslabs.com/txn/{tx_hash}?network=testnet"
-            }
+        logger.debug("Queued blockchain submission: job %s (%s)", job['job_id'], job['status'])
+
+        ai_verdict = {
+            "is_deepfake": is_fake,
+            "confidence": confidence
         }
+        if isinstance(detection, dict):
+            # segments / frames / audio / early_exit
+            ai_verdict.update(
+                (key, value) for (key, value) in detection.items()
+                if key not in ("is_fake", "confidence")
+            )
+
+        result = {
+            "ai_verdict": ai_verdict,
+            "job_id": job["job_id"],
+        }
+        if file_fingerprint is not None:
+            await asyncio.to_thread(remember, kind, file_fingerprint, image_hash_hex, result)
+        return result
+
+    # Known hashes are answered from the cache; concurrent uploads of
+    # the same file share one inference + submission job.
+    verdict, cache_source = await VERDICT_CACHE.get_or_compute(image_hash_hex, compute_verdict)
+    logger.debug("Verdict source: %s", cache_source)
+
+    # The chain status is always read fresh from the job queue
+    job = await asyncio.to_thread(SUBMISSION_QUEUE.get_job, verdict["job_id"])
+    if job is None or job["status"] == STATUS_FAILED:
+        # A cached verdict whose submission gave up (or whose job is gone
+        # from the queue): this upload queues it again. A near-duplicate's
+        # job is its original's, so that is the hash that gets registered.
+        if job is not None:
+            job_hash = job["image_hash_hex"]
+        else:
+            job_hash = verdict.get("near_duplicate_of", {}).get("image_hash_hex", image_hash_hex)
+        with span("chain_enqueue"):
+            job = await asyncio.to_thread(
+                SUBMISSION_QUEUE.enqueue, job_hash,
+                verdict["ai_verdict"]["is_deepfake"], verdict["ai_verdict"]["confidence"],
+            )
+        logger.info("Re-queued blockchain submission for %s: job %s", job_hash, job["job_id"])
+
+    # 6. Return the result to the user without waiting for the chain
+    response = {
+        "filename": file.filename,
+        "image_hash_hex": image_hash_hex,
+        "ai_verdict": verdict["ai_verdict"],
+        "blockchain_result": _blockchain_result(job),
+        "cache": cache_source,
+    }
+    if "near_duplicate_of" in verdict:
+        # The verdict (and its on-chain record) belong to this original
+        response["near_duplicate_of"] = verdict["near_duplicate_of"]
+    return response
+
+
+@app.post("/verify", openapi_extra=VERIFY_REQUEST_BODY)
+async def verify_image_endpoint(request: Request):
+    """
+    This is the main endpoint for our project.
+    It performs the full end-to-end verification process.
+    """
+
+    # 1. Stream the upload in, hashing it on the fly.
+    # Small files stay in memory; big ones spill to a unique spool file.
+    # (The SHA-256 is computed inside this span, chunk by chunk.)
+    # Rate limit, size limit and "is the detector's queue full?" are all
+    # checked before (or while) the body streams in.
+    ADMISSION.check_request(request, ADMISSION.max_single_upload_bytes())
+    with span("upload"):
+        file = await receive_upload(request, on_part=ADMISSION.admit_upload)
+
+    logger.info("New request: verifying %s", file.filename)
+
+    try:
+        return await verify_upload(file)
+
+    except HTTPException:
+        # 415 / 422 / 500 / 503: a real status code (and Retry-After) for the client
+        raise
 
     except Exception as e:
-        # If anything fails (e.g., blockchain transaction)
-        print(f"An error occurred during verification: {e}")
+        # If anything fails (e.g., unsupported type or inference error)
+        logger.warning("An error occurred during verification: %s", e)
         return {"error": str(e)}
 
     finally:
-        # 6. Clean up the temporary file
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
+        # 7. Free the buffer / remove the spool file
+        file.close()
+
+
+@app.post("/verify-batch", openapi_extra=VERIFY_BATCH_REQUEST_BODY)
+async def verify_batch_endpoint(request: Request):
+    """
+    Verifies many files in one request: any number of file parts, and/or
+    zip / tar archives of files. Streams back one NDJSON line per file
+    (in completion order, with its "index" in the upload) holding the
+    same fields as /verify, or an "error".
+    """
+    ADMISSION.check_request(request)
+    results = asyncio.Queue()
+    # At most this many files are received-but-unfinished at once; when
+    # the limit is reached we stop reading the body (backpressure), so
+    # memory stays bounded however big the batch is.
+    slots = asyncio.Semaphore(VERIFY_BATCH_CONCURRENCY)
+    tasks = []
+    # Result lines queued directly, without a task (unreadable archives)
+    extra_lines = 0
+
+    async def verify_one(index: int, file: IngestedUpload):
+        try:
+            result = await verify_upload(file)
+        except HTTPException as e:
+            result = {"filename": file.filename, "error": e.detail, "status_code": e.status_code}
+        except Exception as e:
+            logger.warning("Error verifying %s in batch: %s", file.filename, e)
+            result = {"filename": file.filename, "error": str(e)}
+        finally:
+            file.close()
+            slots.release()
+        await results.put({"index": index, **result})
+
+    async def schedule(file: IngestedUpload):
+        await slots.acquire()
+        tasks.append(asyncio.create_task(verify_one(len(tasks), file)))
+
+    async def expand_archive(archive: IngestedUpload):
+        nonlocal extra_lines
+        # Members are read one by one in a worker thread
+        members = iter_archive_members(archive, on_member=ADMISSION.limit_upload)
+        try:
+            while True:
+                member = await asyncio.to_thread(next, members, None)
+                if member is None:
+                    break
+                await schedule(member)
+        except Exception as e:
+            logger.warning("Could not read archive %s: %s", archive.filename, e)
+            extra_lines += 1
+            await results.put({"index": None, "filename": archive.filename,
+                               "error": f"Could not read archive: {e}"})
+        finally:
+            members.close()
+            archive.close()
+
+    # 1. Receive the body part by part; verification starts as soon as a
+    # file is complete. (The response only starts streaming once the
+    # whole body is in, since the server can't read and stream at once.)
+    def limit_part(part: IngestedUpload):
+        ADMISSION.limit_upload(part, archive=is_archive(part))
+
+    try:
+        async for part in iter_uploads(request, on_part=limit_part):
+            if is_archive(part):
+                await expand_archive(part)
+            else:
+                await schedule(part)
+    except Exception:
+        for task in tasks:
+            task.cancel()
+        raise
+
+    logger.info("Batch request: %d file(s)", len(tasks))
+
+    async def stream_results():
+        try:
+            for _ in range(len(tasks) + extra_lines):
+                yield json.dumps(await results.get()) + "\n"
+        finally:
+            # Client went away: stop the remaining work
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+@app.get("/jobs/{job_id}")
+async def job_status_endpoint(job_id: int):
+    """
+    Status of an on-chain submission: pending, submitted, finalized or failed.
+    """
+    job = await asyncio.to_thread(SUBMISSION_QUEUE.get_job, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"No job with id {job_id}.")
+    return job
+
+
+@app.get("/jobs/by-hash/{hash_hex}")
+async def job_status_by_hash_endpoint(hash_hex: str):
+    """
+    Same as /jobs/{job_id}, looked up by the file's SHA-256 hash.
+    """
+    job = await asyncio.to_thread(SUBMISSION_QUEUE.get_job_by_hash, hash_hex.lower())
+    if job is None:
+        raise HTTPException(status_code=404, detail="No submission job for this hash.")
+    return job
+
 
 @app.get("/check-hash/{hash_hex}")
 async def check_hash_endpoint(hash_hex: str):
     """
-    Checks the on-chain ledger for a pre-existing verdict.
+    Checks the ledger for a pre-existing verdict.
+    Answered from the local verdict index; unknown hashes fall through
+    to the on-chain view function (see verdict_index.py).
     """
     try:
-        # Call our new service function
-        result = await get_verdict_from_chain(hash_hex)
-        
-        if not result["found"]:
-            raise HTTPException(
-                status_code=404, # 404 Not Found
-                detail="This hash has not been verified yet. No verdict was found on the blockchain."
-            )
-        
-        # Return the data
-        return result
-
+        result = await lookup_verdict(hash_hex)
     except Exception as e:
-        print(f"Error in /check-hash: {e}")
+        logger.error("Error in /check-hash: %s", e)
         raise HTTPException(
             status_code=500,
             detail="An error occurred while checking the blockchain."
         )
 
+    if not result["found"]:
+        raise HTTPException(
+            status_code=404, # 404 Not Found
+            detail="This hash has not been verified yet. No verdict was found on the blockchain."
+        )
+
+    # Return the data
+    return result
+
+@app.post("/lookup-hashes")
+async def lookup_hashes_endpoint(request: Request, hashes: List[str] = Body(..., embed=True)):
+    """
+    Upload precheck: the existing verdicts of many files, by the SHA-256
+    of their bytes (the image_hash_hex /verify would give them). Clients
+    hash a file locally and only upload it when it isn't found.
+
+    Answered from this server's verdict cache, then the verdict index,
+    then (for the rest, concurrently) the chain. Returns
+    {"results": {hash: result}}; a found result has the same ai_verdict
+    and blockchain_result as a /verify response.
+    """
+    ADMISSION.check_request(request)
+    if len(hashes) > LOOKUP_MAX_HASHES:
+        raise HTTPException(status_code=413, detail=f"At most {LOOKUP_MAX_HASHES} hashes per request.")
+
+    normalized = {}   # hash as sent -> lowercase hex without 0x
+    for value in hashes:
+        hash_hex = value.strip().lower()
+        normalized[value] = hash_hex[2:] if hash_hex.startswith("0x") else hash_hex
+    valid = list(dict.fromkeys(h for h in normalized.values() if _SHA256_HEX.fullmatch(h)))
+
+    results = {}
+    with span("lookup_hashes"):
+        # 1. Verdicts of this server (finished even if not on chain yet)
+        cached = await asyncio.to_thread(VERDICT_CACHE.peek_many, valid)
+        jobs = await asyncio.to_thread(
+            lambda: {h: SUBMISSION_QUEUE.get_job(verdict["job_id"]) for h, verdict in cached.items()}
+        )
+        for hash_hex, verdict in cached.items():
+            result = {
+                "found": True,
+                "source": "cache",
+                "image_hash_hex": hash_hex,
+                "ai_verdict": verdict["ai_verdict"],
+                "blockchain_result": _blockchain_result(jobs[hash_hex]),
+            }
+            if "near_duplicate_of" in verdict:
+                result["near_duplicate_of"] = verdict["near_duplicate_of"]
+            results[hash_hex] = result
+
+        # 2. The verdict index, then the chain
+        try:
+            indexed = await lookup_verdicts([h for h in valid if h not in results])
+        except Exception as e:
+            logger.error("Error in /lookup-hashes: %s", e)
+            raise HTTPException(status_code=500, detail="An error occurred while looking up the hashes.")
+        for hash_hex, found in indexed.items():
+            if not found["found"]:
+                results[hash_hex] = found
+                continue
+            results[hash_hex] = {
+                "found": True,
+                "source": found["source"],
+                "image_hash_hex": hash_hex,
+                "ai_verdict": {
+                    "is_deepfake": found["is_deepfake"],
+                    "confidence": found["confidence"],
+                },
+                "blockchain_result": {
+                    "status": "finalized",
+                    "transaction_hash": found.get("transaction_hash"),
+                    "explorer_url": explorer_url(found.get("transaction_hash")),
+                    "verified_by": found["verified_by"],
+                    "verified_at": found["verified_at"],
+                },
+            }
+
+    return {
+        "results": {
+            value: results.get(hash_hex, {"found": False, "error": "Not a SHA-256 hex digest."})
+            for value, hash_hex in normalized.items()
+        }
+    }
+
 # --- This block lets us run the server directly ---
 if __name__ == "__main__":
     print("Starting FastAPI server...")
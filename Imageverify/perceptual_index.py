@@ -0,0 +1,267 @@
+# file: perceptual_index.py
+#
+# Near-duplicate detection for uploads that are NOT byte-identical to a
+# file we've seen (re-compressed, resized, metadata stripped, re-encoded).
+#
+# Every file gets a 64-bit perceptual fingerprint:
+#   - images: pHash (low frequencies of a 32x32 DCT) or dHash (gradients
+#     of a 9x8 thumbnail)
+#   - audio:  signs of the log-energy differences between adjacent mel
+#     bands, in 4 time segments (robust to re-encoding and volume changes)
+#
+# Fingerprints live in a SQLite multi-index hashing table: the 64 bits are
+# split into 4 blocks of 16, each with its own index. Two fingerprints
+# within distance r agree on at least one block up to r // 4 bits, so a
+# lookup only probes the block values within that distance and checks the
+# few candidates it finds. Lookups stay index-only at millions of entries,
+# and new verdicts are added one row at a time.
+#
+import itertools
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+import numpy as np
+from PIL import Image
+
+from instrumentation import get_logger
+
+logger = get_logger("perceptual_index")
+
+# --- Config ---
+# Reuse verdicts of near-duplicates (1) or only of exact SHA-256 matches (0).
+PERCEPTUAL_INDEX = os.getenv("PERCEPTUAL_INDEX", "1") == "1"
+PERCEPTUAL_INDEX_DB = os.getenv("PERCEPTUAL_INDEX_DB", "perceptual_index.db")
+# "phash" or "dhash"
+PERCEPTUAL_IMAGE_HASH = os.getenv("PERCEPTUAL_IMAGE_HASH", "phash")
+# Max Hamming distance (out of 64 bits) that still counts as the same file.
+# Kept small on purpose: a manipulated copy of a real photo must NOT be
+# matched to the real original.
+PERCEPTUAL_IMAGE_MAX_DISTANCE = int(os.getenv("PERCEPTUAL_IMAGE_MAX_DISTANCE", "4"))
+PERCEPTUAL_AUDIO_MAX_DISTANCE = int(os.getenv("PERCEPTUAL_AUDIO_MAX_DISTANCE", "4"))
+# Seconds of audio (from the start) the audio fingerprint is computed on.
+PERCEPTUAL_AUDIO_SECONDS = float(os.getenv("PERCEPTUAL_AUDIO_SECONDS", "30"))
+
+_BLOCKS = 4
+_BLOCK_BITS = 16
+
+
+# --- Fingerprints ---
+
+def _bits_to_int(bits) -> int:
+    value = 0
+    for bit in bits:
+        value = (value << 1) | int(bool(bit))
+    return value
+
+
+def _thumbnail(source, size) -> np.ndarray:
+    with Image.open(source) as img:
+        # Only a thumbnail is needed, so let the JPEG decoder downscale
+        img.draft("L", (size[0] * 2, size[1] * 2))
+        gray = img.convert("L").resize(size, Image.LANCZOS)
+        return np.asarray(gray, dtype=np.float32)
+
+
+def phash(source) -> int:
+    """64-bit DCT perceptual hash of an image (path or file-like)."""
+    from scipy.fft import dctn
+    pixels = _thumbnail(source, (32, 32))
+    low = dctn(pixels, norm="ortho")[:8, :8]
+    return _bits_to_int((low > np.median(low)).flatten())
+
+
+def dhash(source) -> int:
+    """64-bit difference hash of an image (path or file-like)."""
+    pixels = _thumbnail(source, (9, 8))
+    return _bits_to_int((pixels[:, 1:] > pixels[:, :-1]).flatten())
+
+
+def image_fingerprint(source) -> int:
+    return dhash(source) if PERCEPTUAL_IMAGE_HASH == "dhash" else phash(source)
+
+
+def audio_fingerprint(source) -> Optional[int]:
+    """
+    64-bit spectral fingerprint of the first PERCEPTUAL_AUDIO_SECONDS of an
+    audio file, or None if it's too short.
+    """
+    import librosa
+    from audio_detector import AUDIO_SAMPLE_RATE, iter_audio_blocks
+
+    # Streamed, so only the fingerprinted prefix is ever decoded
+    wanted = int(PERCEPTUAL_AUDIO_SECONDS * AUDIO_SAMPLE_RATE)
+    blocks, have = [], 0
+    stream = iter_audio_blocks(source)
+    try:
+        for block in stream:
+            blocks.append(block[:wanted - have])
+            have += len(blocks[-1])
+            if have >= wanted:
+                break
+    finally:
+        stream.close()
+    if not blocks:
+        return None
+
+    samples = np.concatenate(blocks)
+    mel = librosa.feature.melspectrogram(y=samples, sr=AUDIO_SAMPLE_RATE, n_mels=17)
+    log_mel = np.log(mel + 1e-10)
+    if log_mel.shape[1] < 4:
+        return None
+    bits = []
+    for segment in np.array_split(log_mel, 4, axis=1):
+        bands = segment.mean(axis=1)
+        bits.extend(bands[1:] > bands[:-1])
+    return _bits_to_int(bits)
+
+
+def fingerprint(kind: str, source) -> Optional[int]:
+    """Fingerprint of an "image" or "audio" upload (None if unavailable)."""
+    if kind == "image":
+        return image_fingerprint(source)
+    if kind == "audio":
+        return audio_fingerprint(source)
+    return None
+
+
+# --- Index ---
+
+def _blocks(value: int) -> List[int]:
+    mask = (1 << _BLOCK_BITS) - 1
+    return [(value >> (_BLOCK_BITS * i)) & mask for i in range(_BLOCKS)]
+
+
+def _block_variants(block: int, max_bits: int) -> List[int]:
+    """`block` and every value within `max_bits` flipped bits of it."""
+    variants = [block]
+    for flips in range(1, max_bits + 1):
+        for positions in itertools.combinations(range(_BLOCK_BITS), flips):
+            value = block
+            for position in positions:
+                value ^= 1 << position
+            variants.append(value)
+    return variants
+
+
+def _to_signed(value: int) -> int:
+    # SQLite integers are signed 64-bit
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def _to_unsigned(value: int) -> int:
+    return value + (1 << 64) if value < 0 else value
+
+
+class PerceptualIndex:
+    """Persistent multi-index hamming table: fingerprint -> prior verdict."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS fingerprints ("
+            " id INTEGER PRIMARY KEY,"
+            " kind TEXT NOT NULL,"
+            " fingerprint INTEGER NOT NULL,"
+            " b0 INTEGER NOT NULL, b1 INTEGER NOT NULL,"
+            " b2 INTEGER NOT NULL, b3 INTEGER NOT NULL,"
+            " content_hash TEXT NOT NULL,"
+            " result TEXT NOT NULL,"
+            " created_at REAL NOT NULL,"
+            " UNIQUE (kind, content_hash))"
+        )
+        for i in range(_BLOCKS):
+            self._db.execute(
+                f"CREATE INDEX IF NOT EXISTS fingerprints_b{i} ON fingerprints (kind, b{i})"
+            )
+        self._db.commit()
+
+        # --- Stats ---
+        self.lookups = 0
+        self.matches = 0
+        self.candidates_checked = 0
+
+    def add(self, kind: str, value: int, content_hash: str, result: dict):
+        """Indexes the verdict of an original (not near-duplicate) file."""
+        with self._lock:
+            self._db.execute(
+                "INSERT OR IGNORE INTO fingerprints (kind, fingerprint, b0, b1, b2, b3,"
+                " content_hash, result, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind, _to_signed(value), *_blocks(value), content_hash, json.dumps(result), time.time()),
+            )
+            self._db.commit()
+
+    def nearest(self, kind: str, value: int, max_distance: int) -> Optional[dict]:
+        """
+        The closest indexed file within `max_distance` bits, as
+        {"content_hash", "distance", "result"}, or None.
+        """
+        probe_bits = max_distance // _BLOCKS
+        seen = set()
+        best = None
+        with self._lock:
+            for i, block in enumerate(_blocks(value)):
+                variants = _block_variants(block, probe_bits)
+                for start in range(0, len(variants), 500):
+                    chunk = variants[start:start + 500]
+                    rows = self._db.execute(
+                        f"SELECT id, fingerprint, content_hash, result FROM fingerprints"
+                        f" WHERE kind = ? AND b{i} IN ({','.join('?' * len(chunk))})",
+                        (kind, *chunk),
+                    ).fetchall()
+                    for (row_id, other, content_hash, result) in rows:
+                        if row_id in seen:
+                            continue
+                        seen.add(row_id)
+                        distance = (value ^ _to_unsigned(other)).bit_count()
+                        if distance <= max_distance and (best is None or distance < best["distance"]):
+                            best = {"content_hash": content_hash, "distance": distance, "result": result}
+        self.lookups += 1
+        self.candidates_checked += len(seen)
+        if best is None:
+            return None
+        self.matches += 1
+        best["result"] = json.loads(best["result"])
+        return best
+
+    def stats(self) -> dict:
+        with self._lock:
+            counts = dict(self._db.execute(
+                "SELECT kind, COUNT(*) FROM fingerprints GROUP BY kind"
+            ).fetchall())
+        return {
+            "enabled": PERCEPTUAL_INDEX,
+            "entries": counts,
+            "lookups": self.lookups,
+            "matches": self.matches,
+            "candidates_checked": self.candidates_checked,
+            "image_max_distance": PERCEPTUAL_IMAGE_MAX_DISTANCE,
+            "audio_max_distance": PERCEPTUAL_AUDIO_MAX_DISTANCE,
+        }
+
+
+def _index_kind(kind: str) -> str:
+    # Image hashes of different algorithms must never be compared
+    return f"image:{PERCEPTUAL_IMAGE_HASH}" if kind == "image" else kind
+
+
+def find_near_duplicate(kind: str, value: int) -> Optional[dict]:
+    """Prior verdict of an "image" / "audio" file close to `value`, or None."""
+    limit = PERCEPTUAL_AUDIO_MAX_DISTANCE if kind == "audio" else PERCEPTUAL_IMAGE_MAX_DISTANCE
+    return PERCEPTUAL.nearest(_index_kind(kind), value, limit)
+
+
+def remember(kind: str, value: int, content_hash: str, result: dict):
+    """Adds a freshly computed verdict to the index."""
+    PERCEPTUAL.add(_index_kind(kind), value, content_hash, result)
+
+
+# --- Global index (Initialized once) ---
+PERCEPTUAL = PerceptualIndex(PERCEPTUAL_INDEX_DB)
@@ -0,0 +1,152 @@
+# file: serve.py
+#
+# Multi-worker launcher:
+#   python serve.py
+#
+# `uvicorn --workers N` starts N fresh interpreters, and each one imports
+# torch and loads its own copy of the model weights. Instead, this:
+#
+#   1. loads the STARTUP_MODELS' weights ONCE, in the parent process. No
+#      inference runs there (and torch is kept to one thread), so no
+#      inference thread pools exist when we fork,
+#   2. gc.freeze()s everything loaded so far, so the garbage collector of
+#      a worker never writes to (and so un-shares) those pages,
+#   3. binds the listening socket and forks WEB_WORKERS workers. Each one
+#      imports main and serves the shared socket with uvicorn; the startup
+#      warmup then only runs the dummy inference,
+#   4. restarts workers that die (from the loaded parent, so that is fast)
+#      and stops them all on SIGTERM / SIGINT.
+#
+# The weights are shared copy-on-write by all workers, so each worker's
+# own memory is mostly its activations and buffers.
+#
+import gc
+import os
+import signal
+import socket
+import sys
+import time
+
+from instrumentation import get_logger, stop_logging
+
+logger = get_logger("serve")
+
+# --- Config ---
+HOST = os.getenv("HOST", "0.0.0.0")
+PORT = int(os.getenv("PORT", "8000"))
+WEB_WORKERS = int(os.getenv("WEB_WORKERS", "2"))
+# torch intra-op threads per worker (default: the cores split between workers)
+WEB_TORCH_THREADS = int(os.getenv("WEB_TORCH_THREADS", str(max(1, (os.cpu_count() or 1) // max(1, WEB_WORKERS)))))
+# Seconds a worker gets to finish in-flight requests when stopping.
+WEB_GRACEFUL_TIMEOUT_S = float(os.getenv("WEB_GRACEFUL_TIMEOUT_S", "30"))
+# Wait before restarting a worker that died, so a crash loop doesn't spin.
+_RESTART_DELAY_S = 1.0
+
+
+def _set_torch_threads(threads: int):
+    # Only if the models use torch at all (not with the onnx backends)
+    if "torch" in sys.modules:
+        sys.modules["torch"].set_num_threads(threads)
+
+
+def _bind() -> socket.socket:
+    family = socket.AF_INET6 if ":" in HOST else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((HOST, PORT))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _run_worker(index: int, sock: socket.socket):
+    """Body of a forked worker; never returns."""
+    code = 0
+    try:
+        gc.enable()
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        _set_torch_threads(WEB_TORCH_THREADS)
+        # Only one worker submits to the chain: the signers' sequence
+        # numbers are tracked by that process's transaction pipeline
+        os.environ["BACKGROUND_WORKERS"] = "1" if index == 0 else "0"
+
+        import uvicorn
+        import main
+        config = uvicorn.Config(main.app, lifespan="on", timeout_graceful_shutdown=WEB_GRACEFUL_TIMEOUT_S)
+        logger.info("Worker %d (pid %d) serving on %s:%d", index, os.getpid(), HOST, PORT)
+        uvicorn.Server(config).run(sockets=[sock])
+    except BaseException:
+        logger.exception("Worker %d crashed", index)
+        code = 1
+    finally:
+        stop_logging()
+        # Skip the parent's atexit handlers and buffers inherited by fork
+        os._exit(code)
+
+
+def main():
+    from startup import STARTUP_MODELS, preload_models
+
+    # No collections while the long-lived objects are created, then move
+    # them all out of the collector's reach before forking
+    gc.disable()
+    started = time.perf_counter()
+    try:
+        import torch
+        torch.set_num_threads(1)
+    except ImportError:
+        pass
+    preload_models()
+    logger.info("Loaded %s in %.1f s", ", ".join(STARTUP_MODELS) or "nothing", time.perf_counter() - started)
+    gc.collect()
+    gc.freeze()
+
+    sock = _bind()
+    children = {}   # pid -> worker index
+    stopping = False
+
+    def spawn(index: int):
+        pid = os.fork()
+        if pid == 0:
+            _run_worker(index, sock)
+        children[pid] = index
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    logger.info("Starting %d worker(s) on %s:%d", WEB_WORKERS, HOST, PORT)
+    for index in range(WEB_WORKERS):
+        spawn(index)
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        index = children.pop(pid, None)
+        if index is None or stopping:
+            continue
+        logger.warning("Worker %d (pid %d) exited with code %d, restarting",
+                       index, pid, os.waitstatus_to_exitcode(status))
+        time.sleep(_RESTART_DELAY_S)
+        if not stopping:
+            spawn(index)
+
+    sock.close()
+    logger.info("All workers stopped")
+    stop_logging()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
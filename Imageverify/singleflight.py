@@ -0,0 +1,53 @@
+# file: singleflight.py
+#
+# "Single-flight" de-duplication for asyncio code: while a call for some
+# key is in progress, other callers with the same key wait for that call
+# instead of starting their own.
+#
+import asyncio
+from typing import Any, Awaitable, Callable, Hashable, Tuple
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key onto one running task.
+
+    The work runs as its own task, so if the caller that started it is
+    cancelled (e.g. the client disconnected) the other waiters still get
+    their result.
+    """
+
+    def __init__(self):
+        self._inflight = {}
+        self.started = 0
+        self.coalesced = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Tuple[Any, bool]:
+        """
+        Runs `fn()` unless a call for `key` is already in flight.
+
+        Returns (result, shared): `shared` is True when this caller was
+        coalesced onto somebody else's call.
+        """
+        task = self._inflight.get(key)
+        shared = task is not None
+
+        if shared:
+            self.coalesced += 1
+        else:
+            self.started += 1
+            task = asyncio.ensure_future(fn())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, key=key: self._forget(key, t))
+
+        return await asyncio.shield(task), shared
+
+    def _forget(self, key: Hashable, task: asyncio.Future):
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        # Mark the exception as retrieved even if every waiter went away.
+        if not task.cancelled():
+            task.exception()
+
+    def in_flight(self) -> int:
+        return len(self._inflight)
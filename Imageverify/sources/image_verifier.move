@@ -8,6 +8,7 @@ module verifier_admin::image_verifier {
 
     use std::signer;
     use std::vector;
+    use aptos_framework::event;
     use aptos_framework::table::{Self, Table};
     use aptos_framework::timestamp;
 
@@ -15,6 +16,8 @@ module verifier_admin::image_verifier {
     const E_VERDICT_ALREADY_EXISTS: u64 = 1;
     /// Error: The admin hasn't run the initialize_module function yet.
     const E_STORE_NOT_PUBLISHED: u64 = 2;
+    /// Error: The hashes, fakes and confidences vectors have different lengths.
+    const E_BATCH_LENGTH_MISMATCH: u64 = 3;
 
     /// This struct holds the on-chain verification result.
     struct ImageVerdict has store, key, drop {
@@ -30,6 +33,18 @@ module verifier_admin::image_verifier {
         verified_at: u64,
     }
 
+    /// Emitted for every verdict actually added to the table. Batches skip
+    /// hashes that already have a verdict, so off-chain indexers must use
+    /// these events (not the transaction's arguments) as the record.
+    #[event]
+    struct VerdictRegistered has drop, store {
+        image_hash: vector<u8>,
+        is_deepfake: bool,
+        confidence_score: u8,
+        verified_by: address,
+        verified_at: u64,
+    }
+
     /// This resource holds the master Table of all verdicts.
     /// It is stored under the 'verifier_admin' account.
     struct VerdictStore has key {
@@ -76,16 +91,80 @@ module verifier_admin::image_verifier {
         assert!(!table::contains(&store.verdicts, image_hash), E_VERDICT_ALREADY_EXISTS);
 
         // Create the new verdict struct
+        let now = timestamp::now_seconds();
         let new_verdict = ImageVerdict {
             image_hash: image_hash,
             is_deepfake: is_fake,
             confidence_score: confidence,
             verified_by: oracle_addr,
-            verified_at: timestamp::now_seconds(),
+            verified_at: now,
         };
 
         // Add the new verdict to the table, using its hash as the key
         table::add(&mut store.verdicts, image_hash, new_verdict);
+        event::emit(VerdictRegistered {
+            image_hash: image_hash,
+            is_deepfake: is_fake,
+            confidence_score: confidence,
+            verified_by: oracle_addr,
+            verified_at: now,
+        });
+    }
+
+    /// --- Entry Function (Called by our Python Server) ---
+    /// Registers many verdicts in ONE transaction. The three vectors are
+    /// parallel: entry i is (hashes[i], fakes[i], confidences[i]).
+    /// Hashes that already have a verdict are skipped instead of aborting,
+    /// so one known hash can't fail the whole batch.
+    public entry fun register_verdicts_batch(
+        oracle: &signer,
+        hashes: vector<vector<u8>>,
+        fakes: vector<bool>,
+        confidences: vector<u8>
+    ) acquires VerdictStore {
+        let oracle_addr = signer::address_of(oracle);
+        let admin_addr = @verifier_admin;
+
+        // Ensure the store has been initialized
+        assert!(exists<VerdictStore>(admin_addr), E_STORE_NOT_PUBLISHED);
+
+        let count = vector::length(&hashes);
+        assert!(
+            vector::length(&fakes) == count && vector::length(&confidences) == count,
+            E_BATCH_LENGTH_MISMATCH
+        );
+
+        let store = borrow_global_mut<VerdictStore>(admin_addr);
+        let now = timestamp::now_seconds();
+
+        let i = 0;
+        while (i < count) {
+            let image_hash = *vector::borrow(&hashes, i);
+
+            // Skip hashes that already have a verdict (including duplicates
+            // earlier in this same batch)
+            if (!table::contains(&store.verdicts, image_hash)) {
+                let is_deepfake = *vector::borrow(&fakes, i);
+                let confidence_score = *vector::borrow(&confidences, i);
+                let new_verdict = ImageVerdict {
+                    image_hash: image_hash,
+                    is_deepfake: is_deepfake,
+                    confidence_score: confidence_score,
+                    verified_by: oracle_addr,
+                    verified_at: now,
+                };
+                table::add(&mut store.verdicts, image_hash, new_verdict);
+                event::emit(VerdictRegistered {
+                    image_hash: image_hash,
+                    is_deepfake: is_deepfake,
+                    confidence_score: confidence_score,
+                    verified_by: oracle_addr,
+                    verified_at: now,
+                });
+            };
+
+            i = i + 1;
+        };
     }
 
     /// --- View Function (Publicly Readable) ---
@@ -0,0 +1,155 @@
+# file: startup.py
+#
+# Startup and readiness.
+#
+# Importing the service is cheap: torch / transformers / librosa are only
+# imported, and the model weights only loaded, when they are first needed.
+# Loading then happens in the background instead of in the first request:
+#
+#   - start_warmup() (called by main's lifespan) starts a thread that
+#     loads the STARTUP_MODELS and runs one dummy inference through each,
+#   - preload_models() only loads the weights, without running anything;
+#     serve.py calls it in the parent process before forking its workers,
+#     so they all share one copy-on-write copy of the weights.
+#
+# GET /healthz says the process is alive; GET /readyz says whether it can
+# serve /verify yet (models loaded and warm, chain node reachable).
+#
+import asyncio
+import os
+import threading
+import time
+from typing import Dict, List
+
+from instrumentation import get_logger
+
+logger = get_logger("startup")
+
+# --- Config ---
+# Models loaded and warmed up at startup ("image", "audio"). The others
+# are still loaded on first use; readiness only waits for these.
+STARTUP_MODELS = [
+    name.strip() for name in os.getenv("STARTUP_MODELS", "image").split(",") if name.strip()
+]
+# Run the warmup thread at all (1) or load everything on first use (0).
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") == "1"
+# /readyz also requires the chain node to answer (1) or not (0).
+READY_REQUIRE_CHAIN = os.getenv("READY_REQUIRE_CHAIN", "1") == "1"
+# How long a chain node check is reused, in seconds.
+READY_CHAIN_CHECK_TTL_S = float(os.getenv("READY_CHAIN_CHECK_TTL_S", "10"))
+READY_CHAIN_TIMEOUT_S = float(os.getenv("READY_CHAIN_TIMEOUT_S", "5"))
+
+STARTED_AT = time.time()
+
+# States of a model: pending -> loading -> warming -> ready (or failed)
+_models: Dict[str, dict] = {}
+_models_lock = threading.Lock()
+_warmup_thread = None
+
+_chain_checked_at = 0.0
+_chain_status = {"ready": False, "error": "not checked yet"}
+_chain_lock = None
+
+
+def _loaders(name: str):
+    """(load, warmup) functions of one model."""
+    if name == "image":
+        import ai_detector
+        return ai_detector.load_image_model, ai_detector.warmup
+    if name == "audio":
+        import audio_detector
+        return audio_detector._load_audio_model, audio_detector.warmup
+    raise ValueError(f"Unknown model '{name}' in STARTUP_MODELS, use image and/or audio")
+
+
+def _set_state(name: str, state: str, **info):
+    with _models_lock:
+        _models.setdefault(name, {}).update(state=state, **info)
+
+
+def _load(name: str, warm: bool):
+    load, warmup = _loaders(name)
+    _set_state(name, "loading")
+    started = time.perf_counter()
+    try:
+        load()
+        loaded = time.perf_counter()
+        _set_state(name, "warming" if warm else "loaded", load_s=round(loaded - started, 3))
+        if warm:
+            warmup()
+            _set_state(name, "ready", warmup_s=round(time.perf_counter() - loaded, 3))
+        logger.info("%s model %s in %.1f s", name, "ready" if warm else "loaded",
+                    time.perf_counter() - started)
+    except Exception as e:
+        logger.error("Could not load the %s model: %s", name, e)
+        _set_state(name, "failed", error=str(e))
+
+
+def preload_models(names: List[str] = None):
+    """
+    Loads the weights of `names` (default: STARTUP_MODELS) in this thread,
+    WITHOUT running an inference: serve.py forks right after, and the
+    inference thread pools must only start in the workers.
+    """
+    for name in names or STARTUP_MODELS:
+        _load(name, warm=False)
+
+
+def start_warmup():
+    """Loads (if needed) and warms up STARTUP_MODELS in a background thread."""
+    global _warmup_thread
+    for name in STARTUP_MODELS:
+        with _models_lock:
+            _models.setdefault(name, {"state": "pending"})
+    if not STARTUP_WARMUP or _warmup_thread is not None:
+        return
+
+    def run():
+        for name in STARTUP_MODELS:
+            _load(name, warm=True)
+
+    _warmup_thread = threading.Thread(target=run, name="model-warmup", daemon=True)
+    _warmup_thread.start()
+
+
+def models_status() -> Dict[str, dict]:
+    with _models_lock:
+        return {name: dict(info) for name, info in _models.items()}
+
+
+def models_ready() -> bool:
+    status = models_status()
+    if not STARTUP_WARMUP:
+        # Nothing is loaded up front; requests load the models themselves
+        return all(info["state"] != "failed" for info in status.values())
+    return all(status.get(name, {}).get("state") == "ready" for name in STARTUP_MODELS)
+
+
+async def chain_status() -> dict:
+    """Whether the chain node answers, re-checked at most every TTL seconds."""
+    global _chain_checked_at, _chain_status, _chain_lock
+    if _chain_lock is None:
+        _chain_lock = asyncio.Lock()
+    async with _chain_lock:
+        if time.monotonic() - _chain_checked_at < READY_CHAIN_CHECK_TTL_S:
+            return _chain_status
+        import aptos_service
+        try:
+            info = await asyncio.wait_for(aptos_service.check_node(), READY_CHAIN_TIMEOUT_S)
+            _chain_status = {"ready": True, "ledger_version": info.get("ledger_version")}
+        except Exception as e:
+            _chain_status = {"ready": False, "error": str(e) or type(e).__name__}
+        _chain_checked_at = time.monotonic()
+        return _chain_status
+
+
+async def readiness() -> dict:
+    """The /readyz report; "ready" is what the probe is about."""
+    models = models_status()
+    chain = await chain_status() if READY_REQUIRE_CHAIN else {"ready": None, "required": False}
+    return {
+        "ready": models_ready() and (chain["ready"] or not READY_REQUIRE_CHAIN),
+        "models": models,
+        "chain": chain,
+        "uptime_s": round(time.time() - STARTED_AT, 1),
+    }
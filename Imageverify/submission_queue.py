@@ -0,0 +1,376 @@
+# file: submission_queue.py
+#
+# Durable queue of on-chain verdict submissions.
+#
+# /verify only records a job here and returns the AI verdict right away.
+# Background workers then group pending jobs into batches, submit ONE
+# register_verdicts_batch transaction per batch, wait for finality and
+# keep the jobs' status up to date:
+#
+#   pending -> submitted (tx hash known) -> finalized
+#                                        \-> failed (after too many retries)
+#
+# A transaction whose finality wait times out may still commit, so its
+# jobs stay submitted and it is waited for again; they are only sent again
+# once it failed, was replaced or is past its expiration.
+#
+# Jobs live in SQLite, so they survive restarts, and there is at most ONE
+# job per image hash, so a hash is never submitted twice.
+#
+import asyncio
+import os
+import random
+import sqlite3
+import threading
+import time
+from typing import List, Optional
+
+import aptos_service
+from verdict_index import VERDICT_INDEX, index_transaction
+from instrumentation import get_logger
+
+logger = get_logger("submission_queue")
+
+# --- Config ---
+CHAIN_QUEUE_DB = os.getenv("CHAIN_QUEUE_DB", "chain_jobs.db")
+# 0 = one worker per in-flight slot of the transaction pipeline, i.e.
+# number of oracle signers * TX_MAX_IN_FLIGHT_PER_SIGNER.
+CHAIN_QUEUE_WORKERS = int(os.getenv("CHAIN_QUEUE_WORKERS", "0")) or aptos_service.TX_PIPELINE.capacity()
+# Verdicts per register_verdicts_batch transaction. A batch is flushed
+# when it is full or its oldest job has waited CHAIN_BATCH_MAX_WAIT_S.
+# 1 = one register_verdict transaction per verdict (legacy contract).
+CHAIN_BATCH_SIZE = int(os.getenv("CHAIN_BATCH_SIZE", "32"))
+CHAIN_BATCH_MAX_WAIT_S = float(os.getenv("CHAIN_BATCH_MAX_WAIT_S", "2"))
+CHAIN_MAX_ATTEMPTS = int(os.getenv("CHAIN_MAX_ATTEMPTS", "8"))
+# Retry backoff: base * 2^(attempt-1), capped, with a little jitter.
+CHAIN_RETRY_BASE_S = float(os.getenv("CHAIN_RETRY_BASE_S", "2"))
+CHAIN_RETRY_MAX_S = float(os.getenv("CHAIN_RETRY_MAX_S", "300"))
+# How often idle workers look for new jobs.
+CHAIN_POLL_INTERVAL_S = float(os.getenv("CHAIN_POLL_INTERVAL_S", "0.5"))
+# A claimed job whose worker died (crash, restart) is picked up again
+# after this long.
+CHAIN_CLAIM_TIMEOUT_S = float(os.getenv("CHAIN_CLAIM_TIMEOUT_S", "120"))
+# A submitted transaction not committed this long after it was sent has
+# expired (aptos_sdk signs with a 600 s expiration), so it is sent again.
+CHAIN_TX_EXPIRY_S = float(os.getenv("CHAIN_TX_EXPIRY_S", "630"))
+
+STATUS_PENDING = "pending"
+STATUS_SUBMITTED = "submitted"
+STATUS_FINALIZED = "finalized"
+STATUS_FAILED = "failed"
+
+
+def explorer_url(tx_hash: Optional[str]) -> Optional[str]:
+    if not tx_hash:
+        return None
+    return f"https://explorer.aptoslabs.com/txn/{tx_hash}?network=testnet"
+
+
+def _is_timeout(error: Exception) -> bool:
+    """
+    True if waiting for a transaction gave up before the node said anything
+    final about it. (Failed and replaced transactions raise other errors.)
+    """
+    return isinstance(error, TimeoutError) or "timed out" in str(error)
+
+
+def _job_from_row(row: sqlite3.Row) -> dict:
+    return {
+        "job_id": row["id"],
+        "image_hash_hex": row["image_hash"],
+        "is_deepfake": bool(row["is_fake"]),
+        "confidence": row["confidence"],
+        "status": row["status"],
+        "transaction_hash": row["tx_hash"],
+        "explorer_url": explorer_url(row["tx_hash"]),
+        "attempts": row["attempts"],
+        "last_error": row["last_error"],
+        "submitted_at": row["submitted_at"],
+        "created_at": row["created_at"],
+        "updated_at": row["updated_at"],
+    }
+
+
+class SubmissionQueue:
+    """SQLite-backed job queue plus the asyncio workers that drain it."""
+
+    def __init__(self, db_path: str, workers: int = 1):
+        self.db_path = db_path
+        self.workers = max(1, int(workers))
+        self._lock = threading.Lock()
+        self._tasks = []
+        self._loop = None
+        self._wakeup = None
+
+        self._db = sqlite3.connect(db_path, timeout=10, check_same_thread=False,
+                                   isolation_level=None)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id INTEGER PRIMARY KEY AUTOINCREMENT,"
+            " image_hash TEXT NOT NULL UNIQUE,"
+            " is_fake INTEGER NOT NULL,"
+            " confidence INTEGER NOT NULL,"
+            " status TEXT NOT NULL,"
+            " tx_hash TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " last_error TEXT,"
+            " next_attempt_at REAL NOT NULL,"
+            " lease_until REAL,"
+            " submitted_at REAL,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS jobs_due ON jobs (status, next_attempt_at)")
+        columns = {row["name"] for row in self._db.execute("PRAGMA table_info(jobs)")}
+        if "submitted_at" not in columns:
+            # Queue files from before submitted_at: count their in-flight
+            # transactions from their last update
+            self._db.execute("ALTER TABLE jobs ADD COLUMN submitted_at REAL")
+            self._db.execute("UPDATE jobs SET submitted_at = updated_at WHERE status = ?", (STATUS_SUBMITTED,))
+
+    # --- Job table (blocking; call through asyncio.to_thread from async code) ---
+
+    def enqueue(self, image_hash_hex: str, is_fake: bool, confidence: int) -> dict:
+        """
+        Adds a job for this hash, or returns the existing one. A job that
+        previously failed is reset to pending so the new upload retries it.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.execute(
+                    "INSERT OR IGNORE INTO jobs (image_hash, is_fake, confidence, status,"
+                    " next_attempt_at, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (image_hash_hex, int(is_fake), int(confidence), STATUS_PENDING, now, now, now),
+                )
+                self._db.execute(
+                    "UPDATE jobs SET status = ?, attempts = 0, last_error = NULL,"
+                    " next_attempt_at = ?, updated_at = ? WHERE image_hash = ? AND status = ?",
+                    (STATUS_PENDING, now, now, image_hash_hex, STATUS_FAILED),
+                )
+                row = self._db.execute("SELECT * FROM jobs WHERE image_hash = ?", (image_hash_hex,)).fetchone()
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        self._notify()
+        return _job_from_row(row)
+
+    def _notify(self):
+        # enqueue() usually runs in a worker thread, so wake the event loop
+        # side thread-safely.
+        if self._loop is not None and self._wakeup is not None:
+            self._loop.call_soon_threadsafe(self._wakeup.set)
+
+    def get_job(self, job_id: int) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job_from_row(row) if row else None
+
+    def get_job_by_hash(self, image_hash_hex: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute("SELECT * FROM jobs WHERE image_hash = ?", (image_hash_hex,)).fetchone()
+        return _job_from_row(row) if row else None
+
+    def claim_batch(self, max_size: int, max_wait_s: float) -> List[dict]:
+        """
+        Atomically takes a group of due jobs and leases them to the calling
+        worker. Either:
+          - all jobs of one submitted-but-unconfirmed transaction (e.g. left
+            over from a restart), to wait for its finality, or
+          - up to `max_size` pending jobs, but only once there are
+            `max_size` of them or the oldest has waited `max_wait_s`.
+        Returns an empty list if there is nothing to do yet.
+        """
+        now = time.time()
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._db.execute(
+                    "SELECT tx_hash FROM jobs WHERE status = ? AND next_attempt_at <= ?"
+                    " AND (lease_until IS NULL OR lease_until < ?) LIMIT 1",
+                    (STATUS_SUBMITTED, now, now),
+                ).fetchone()
+                if row is not None:
+                    rows = self._db.execute(
+                        "SELECT * FROM jobs WHERE status = ? AND tx_hash = ?",
+                        (STATUS_SUBMITTED, row["tx_hash"]),
+                    ).fetchall()
+                else:
+                    rows = self._db.execute(
+                        "SELECT * FROM jobs WHERE status = ? AND next_attempt_at <= ?"
+                        " AND (lease_until IS NULL OR lease_until < ?)"
+                        " ORDER BY next_attempt_at LIMIT ?",
+                        (STATUS_PENDING, now, now, max_size),
+                    ).fetchall()
+                    # Not a full batch yet: flush only once the oldest job
+                    # (due since next_attempt_at) has waited long enough.
+                    if rows and len(rows) < max_size and now - rows[0]["next_attempt_at"] < max_wait_s:
+                        rows = []
+
+                self._db.executemany(
+                    "UPDATE jobs SET lease_until = ?, updated_at = ? WHERE id = ?",
+                    [(now + CHAIN_CLAIM_TIMEOUT_S, now, r["id"]) for r in rows],
+                )
+                self._db.execute("COMMIT")
+            except Exception:
+                self._db.execute("ROLLBACK")
+                raise
+        return [_job_from_row(r) for r in rows]
+
+    def _update(self, job_ids: List[int], **fields):
+        fields["updated_at"] = time.time()
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._db.executemany(
+                f"UPDATE jobs SET {columns} WHERE id = ?",
+                [(*fields.values(), job_id) for job_id in job_ids],
+            )
+
+    def mark_submitted(self, job_ids: List[int], tx_hash: str):
+        self._update(job_ids, status=STATUS_SUBMITTED, tx_hash=tx_hash, submitted_at=time.time())
+
+    def mark_unconfirmed(self, job_ids: List[int], error: str):
+        """
+        Keeps jobs whose transaction isn't committed yet (nor known to have
+        failed) submitted, to wait for it again a little later.
+        """
+        self._update(job_ids, last_error=error, lease_until=None,
+                     next_attempt_at=time.time() + CHAIN_RETRY_BASE_S)
+
+    def mark_finalized(self, job_ids: List[int], note: Optional[str] = None):
+        self._update(job_ids, status=STATUS_FINALIZED, lease_until=None, last_error=note)
+
+    def mark_retry(self, job_id: int, attempts: int, error: str):
+        """Schedules a retry with exponential backoff, or gives up."""
+        if attempts >= CHAIN_MAX_ATTEMPTS:
+            self._update([job_id], status=STATUS_FAILED, attempts=attempts,
+                         last_error=error, lease_until=None)
+            return
+        delay = min(CHAIN_RETRY_MAX_S, CHAIN_RETRY_BASE_S * (2 ** (attempts - 1)))
+        delay *= random.uniform(0.8, 1.2)
+        # Back to pending: the old transaction (if any) failed, was replaced
+        # or expired, so it can't commit any more.
+        self._update([job_id], status=STATUS_PENDING, tx_hash=None, submitted_at=None, attempts=attempts,
+                     last_error=error, lease_until=None,
+                     next_attempt_at=time.time() + delay)
+
+    def counts(self) -> dict:
+        with self._lock:
+            rows = self._db.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        counts = {STATUS_PENDING: 0, STATUS_SUBMITTED: 0, STATUS_FINALIZED: 0, STATUS_FAILED: 0}
+        counts.update({status: count for (status, count) in rows})
+        return counts
+
+    # --- Workers ---
+
+    async def _submit(self, jobs: List[dict]) -> str:
+        if CHAIN_BATCH_SIZE <= 1:
+            # Single-verdict mode, for a module without register_verdicts_batch
+            job = jobs[0]
+            return await aptos_service.submit_verdict(
+                image_hash=bytes.fromhex(job["image_hash_hex"]),
+                is_fake=job["is_deepfake"],
+                confidence=job["confidence"],
+            )
+        return await aptos_service.submit_verdicts_batch([
+            (bytes.fromhex(job["image_hash_hex"]), job["is_deepfake"], job["confidence"])
+            for job in jobs
+        ])
+
+    async def _process(self, jobs: List[dict]):
+        job_ids = [job["job_id"] for job in jobs]
+        tx_hash = jobs[0]["transaction_hash"]
+        submitted_at = jobs[0]["submitted_at"]
+        try:
+            if jobs[0]["status"] == STATUS_PENDING:
+                tx_hash = await self._submit(jobs)
+                submitted_at = time.time()
+                await asyncio.to_thread(self.mark_submitted, job_ids, tx_hash)
+
+            tx = await aptos_service.wait_for_finality(tx_hash)
+            await asyncio.to_thread(self.mark_finalized, job_ids)
+            logger.info("Jobs %s: finalized (%s)", job_ids, tx_hash)
+
+        except Exception as e:
+            if aptos_service.is_already_registered_error(e):
+                # Somebody (maybe an earlier attempt of ours) already
+                # registered this hash, which is what we wanted anyway.
+                await asyncio.to_thread(self.mark_finalized, job_ids, "already registered on chain")
+                logger.info("Jobs %s: hash was already registered on chain", job_ids)
+                return
+            if (tx_hash is not None and submitted_at is not None and _is_timeout(e)
+                    and time.time() - submitted_at < CHAIN_TX_EXPIRY_S):
+                # Not committed yet, but it still may be: sending it again
+                # could pay for (and in single-verdict mode abort) a second one
+                await asyncio.to_thread(self.mark_unconfirmed, job_ids, str(e))
+                logger.info("Jobs %s: %s not committed yet, waiting again later", job_ids, tx_hash)
+                return
+            logger.warning("Jobs %s: transaction failed: %s", job_ids, e)
+            for job in jobs:
+                await asyncio.to_thread(self.mark_retry, job["job_id"], job["attempts"] + 1, str(e))
+            return
+
+        # What the transaction stored goes straight into the local read
+        # replica. The jobs are final either way; the follower (if enabled)
+        # catches up on anything missed here.
+        try:
+            await index_transaction(VERDICT_INDEX, tx, "submission")
+        except Exception as e:
+            logger.warning("Jobs %s: could not index %s: %s", job_ids, tx_hash, e)
+
+    async def _worker(self, index: int):
+        while True:
+            # Cleared before looking for work, so an enqueue() that lands
+            # while claim_batch runs still wakes the wait below
+            self._wakeup.clear()
+            try:
+                jobs = await asyncio.to_thread(self.claim_batch, CHAIN_BATCH_SIZE, CHAIN_BATCH_MAX_WAIT_S)
+            except Exception as e:
+                logger.error("Chain worker %d: could not claim jobs: %s", index, e)
+                jobs = []
+
+            if not jobs:
+                # Sleep until new work is enqueued or the poll interval passes
+                # (retries and partial batches become due without an enqueue).
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=CHAIN_POLL_INTERVAL_S)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            await self._process(jobs)
+
+    def start(self):
+        """Starts the background workers on the running event loop."""
+        if self._tasks:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._worker(i), name=f"chain-worker-{i}")
+            for i in range(self.workers)
+        ]
+        logger.info("Started %d chain submission worker(s), queue: %s", self.workers, self.db_path)
+
+    async def stop(self):
+        tasks, self._tasks = self._tasks, []
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "batch_size": CHAIN_BATCH_SIZE,
+            "batch_max_wait_s": CHAIN_BATCH_MAX_WAIT_S,
+            "running": bool(self._tasks),
+            "jobs": self.counts(),
+        }
+
+
+# --- Global queue (Initialized once) ---
+SUBMISSION_QUEUE = SubmissionQueue(CHAIN_QUEUE_DB, workers=CHAIN_QUEUE_WORKERS)
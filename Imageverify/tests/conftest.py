@@ -0,0 +1,24 @@
+# file: tests/conftest.py
+#
+# The service modules are flat files in Imageverify/, and several of them
+# open SQLite files when imported. Put Imageverify/ on the path and point
+# every database at a temporary directory before any test imports them.
+#
+# Tests that need an optional dependency (aptos_sdk, fastapi, numpy, ...)
+# skip themselves with pytest.importorskip when it isn't installed.
+#
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+_DB_DIR = tempfile.mkdtemp(prefix="deepshield-tests-")
+for name, filename in (
+    ("CHAIN_QUEUE_DB", "chain_jobs.db"),
+    ("VERDICT_INDEX_DB", "verdict_index.db"),
+    ("PERCEPTUAL_INDEX_DB", "perceptual_index.db"),
+):
+    os.environ.setdefault(name, os.path.join(_DB_DIR, filename))
+# No background follower polling a real node
+os.environ.setdefault("VERDICT_INDEX_FOLLOW", "0")
@@ -0,0 +1,124 @@
+# file: tests/test_admission.py
+#
+# Admission control: detection gates (503 + Retry-After), per-client
+# token buckets (429) and body size limits (413).
+#
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("fastapi")
+
+from fastapi import HTTPException  # noqa: E402
+
+import admission  # noqa: E402
+from admission import Admission, AdmissionGate, TokenBuckets  # noqa: E402
+
+
+def _request(host="203.0.113.7", **headers):
+    return SimpleNamespace(headers=headers, client=SimpleNamespace(host=host))
+
+
+# --- Gates ---
+
+def test_gate_queues_up_to_its_limit_then_answers_503():
+    gate = AdmissionGate("image", limit=1, queue_limit=1, queue_timeout_s=0)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def hold():
+            async with gate.slot():
+                await release.wait()
+
+        running = asyncio.ensure_future(hold())
+        queued = asyncio.ensure_future(hold())
+        await asyncio.sleep(0.01)
+        assert (gate.running, gate.waiting) == (1, 1)
+
+        # A third request can't even be queued
+        with pytest.raises(HTTPException) as rejected:
+            async with gate.slot():
+                pass
+        release.set()
+        await asyncio.gather(running, queued)
+        return rejected.value
+
+    error = asyncio.run(run())
+    assert error.status_code == 503
+    assert int(error.headers["Retry-After"]) >= 1
+    stats = gate.stats()
+    assert (stats["admitted"], stats["rejected_full"], stats["running"], stats["waiting"]) == (2, 1, 0, 0)
+
+
+def test_queued_request_gives_up_after_the_queue_timeout():
+    gate = AdmissionGate("audio", limit=1, queue_limit=4, queue_timeout_s=0.05)
+
+    async def run():
+        release = asyncio.Event()
+
+        async def hold():
+            async with gate.slot():
+                await release.wait()
+
+        running = asyncio.ensure_future(hold())
+        await asyncio.sleep(0)
+        try:
+            with pytest.raises(HTTPException) as rejected:
+                async with gate.slot():
+                    pass
+        finally:
+            release.set()
+            await running
+        return rejected.value
+
+    assert asyncio.run(run()).status_code == 503
+    assert gate.stats()["rejected_timeout"] == 1
+    assert gate.stats()["waiting"] == 0
+
+
+def test_upload_is_rejected_from_its_headers_when_the_gate_is_full():
+    checks = Admission()
+    checks.gates["video"] = AdmissionGate("video", limit=1, queue_limit=0)
+    checks.gates["video"].running = 1
+    upload = SimpleNamespace(content_type="video/mp4")
+
+    with pytest.raises(HTTPException) as rejected:
+        checks.admit_upload(upload)
+    assert rejected.value.status_code == 503
+    assert upload.max_bytes == admission.MAX_UPLOAD_BYTES_VIDEO
+
+
+# --- Rate limits and sizes ---
+
+def test_token_bucket_allows_a_burst_then_says_how_long_to_wait():
+    buckets = TokenBuckets(rate=2.0, burst=3)
+    assert [buckets.take("client") for _ in range(3)] == [None, None, None]
+    wait = buckets.take("client")
+    assert wait is not None and 0 < wait <= 0.5
+    # Other clients have their own bucket
+    assert buckets.take("other") is None
+    assert buckets.stats()["rejected"] == 1
+
+
+def test_rate_limited_client_gets_429_with_retry_after():
+    checks = Admission()
+    checks.buckets = TokenBuckets(rate=0.5, burst=1)
+
+    checks.check_request(_request())
+    with pytest.raises(HTTPException) as rejected:
+        checks.check_request(_request())
+    assert rejected.value.status_code == 429
+    assert rejected.value.headers["Retry-After"] == "2"
+    # A different client is unaffected
+    checks.check_request(_request(host="198.51.100.1"))
+
+
+def test_declared_body_size_is_checked_before_reading_it():
+    checks = Admission()
+    with pytest.raises(HTTPException) as rejected:
+        checks.check_request(_request(**{"content-length": "2048"}), max_body_bytes=1024)
+    assert rejected.value.status_code == 413
+    checks.check_request(_request(**{"content-length": "512"}), max_body_bytes=1024)
+    assert checks.stats()["rejected_too_large"] == 1
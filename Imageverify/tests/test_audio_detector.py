@@ -0,0 +1,63 @@
+# file: tests/test_audio_detector.py
+#
+# detect_audio_deepfake with a stub model: it gives a verdict for audio
+# it can score, and raises (instead of answering "real") when it can't.
+#
+import io
+
+import pytest
+
+np = pytest.importorskip("numpy")
+soundfile = pytest.importorskip("soundfile")
+pytest.importorskip("soxr")
+
+import audio_detector  # noqa: E402
+from audio_detector import detect_audio_deepfake  # noqa: E402
+
+
+def _wav(seconds: float, samplerate: int = 22050) -> io.BytesIO:
+    t = np.arange(int(seconds * samplerate)) / samplerate
+    data = io.BytesIO()
+    soundfile.write(data, (0.3 * np.sin(2 * np.pi * 440 * t)).astype(np.float32), samplerate, format="WAV")
+    data.seek(0)
+    return data
+
+
+class StubModel:
+    """A transformers audio-classification pipeline with a fixed answer."""
+
+    def __init__(self, spoof: float):
+        self.spoof = spoof
+        self.windows = []
+
+    def __call__(self, inputs, batch_size=None, top_k=None):
+        self.windows.extend(len(item["raw"]) for item in inputs)
+        return [[{"label": "spoof", "score": self.spoof}, {"label": "bonafide", "score": 1 - self.spoof}]
+                for _ in inputs]
+
+
+@pytest.fixture
+def model(monkeypatch):
+    model = StubModel(spoof=0.8)
+    monkeypatch.setattr(audio_detector, "audio_pipeline", model)
+    return model
+
+
+def test_verdict_is_the_mean_spoof_score_of_the_windows(model):
+    assert detect_audio_deepfake(_wav(6.0)) == (True, 80)
+    # Resampled to 16 kHz and cut into windows before scoring
+    assert model.windows and max(model.windows) <= audio_detector.AUDIO_WINDOW_S * audio_detector.AUDIO_SAMPLE_RATE
+
+
+def test_audio_without_samples_raises(model):
+    with pytest.raises(ValueError, match="no samples"):
+        detect_audio_deepfake(_wav(0.0))
+
+
+def test_model_failure_raises_instead_of_answering_real(monkeypatch):
+    def broken(inputs, batch_size=None, top_k=None):
+        raise RuntimeError("CUDA out of memory")
+
+    monkeypatch.setattr(audio_detector, "audio_pipeline", broken)
+    with pytest.raises(RuntimeError, match="out of memory"):
+        detect_audio_deepfake(_wav(2.0))
@@ -0,0 +1,180 @@
+# file: tests/test_chain_transport.py
+#
+# FinalityWatcher and ViewCoalescer against a stub node client.
+#
+import asyncio
+
+import pytest
+
+pytest.importorskip("aptos_sdk")
+
+from aptos_sdk.async_client import ApiError  # noqa: E402
+
+from chain_transport import FinalityWatcher, ViewCoalescer  # noqa: E402
+
+SENDER = "0xa11ce"
+
+
+class StubResponse:
+    def __init__(self, status_code: int, body):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception(f"HTTP {self.status_code}")
+
+
+class StubHttp:
+    """RestClient.client: answers GET /accounts/{address}/transactions."""
+
+    def __init__(self, node: "StubNode"):
+        self.node = node
+        self.gets = []
+
+    async def get(self, url: str, params=None):
+        self.gets.append((url, dict(params or {})))
+        prefix = f"{self.node.base_url}/accounts/"
+        assert url.startswith(prefix) and url.endswith("/transactions")
+        address = url[len(prefix):-len("/transactions")]
+        committed = self.node.committed.get(address)
+        if committed is None:
+            return StubResponse(404, {"error_code": "account_not_found"})
+        start, limit = int(params["start"]), int(params["limit"])
+        listed = []
+        for sequence_number in range(start, start + limit):
+            if sequence_number not in committed:
+                break
+            listed.append(committed[sequence_number])
+        return StubResponse(200, listed)
+
+
+class StubNode:
+    """The parts of RestClient the watcher and the coalescer use."""
+
+    base_url = "http://node/v1"
+
+    def __init__(self):
+        # address -> {sequence number: committed transaction}
+        self.committed = {}
+        # tx hash -> transaction, for lookups by hash
+        self.by_hash = {}
+        self.client = StubHttp(self)
+        self.views = 0
+
+    def commit(self, sender: str, sequence_number: int, tx_hash: str, success: bool = True):
+        tx = {"type": "user_transaction", "hash": tx_hash, "sender": sender,
+              "sequence_number": str(sequence_number), "success": success,
+              "vm_status": "Executed successfully" if success else "Move abort: E_SOMETHING"}
+        self.committed.setdefault(sender, {})[sequence_number] = tx
+        self.by_hash[tx_hash] = tx
+        return tx
+
+    async def transaction_by_hash(self, tx_hash: str) -> dict:
+        if tx_hash not in self.by_hash:
+            raise ApiError("transaction not found", 404)
+        return self.by_hash[tx_hash]
+
+    async def view(self, function, type_arguments, arguments):
+        self.views += 1
+        await asyncio.sleep(0.01)
+        return [function, list(arguments)]
+
+
+def _watcher(node: StubNode, timeout_s: float = 5.0) -> FinalityWatcher:
+    return FinalityWatcher(lambda: node, poll_s=0.01, timeout_s=timeout_s)
+
+
+def test_confirms_a_signers_transactions_with_one_request_per_poll():
+    node = StubNode()
+    watcher = _watcher(node)
+    hashes = [f"0x{i:04x}" for i in range(20)]
+    for i, tx_hash in enumerate(hashes):
+        node.commit(SENDER, 100 + i, tx_hash)
+
+    async def run():
+        return await asyncio.gather(*(
+            watcher.wait(tx_hash, SENDER, 100 + i) for i, tx_hash in enumerate(hashes)
+        ))
+
+    transactions = asyncio.run(run())
+    assert [tx["hash"] for tx in transactions] == hashes
+    # One GET of the account's committed transactions settled all 20
+    assert len(node.client.gets) == 1
+    url, params = node.client.gets[0]
+    assert url == f"{node.base_url}/accounts/{SENDER}/transactions"
+    assert params == {"start": 100, "limit": 20}
+    assert watcher.stats()["confirmed"] == 20
+    assert watcher.stats()["pending"] == 0
+
+
+def test_keeps_waiting_until_the_account_has_committed_it():
+    node = StubNode()
+    watcher = _watcher(node)
+
+    async def run():
+        waiting = asyncio.ensure_future(watcher.wait("0xbeef", SENDER, 0))
+        await asyncio.sleep(0.05)
+        # Unknown account (404), then committed
+        assert not waiting.done()
+        node.commit(SENDER, 0, "0xbeef")
+        return await waiting
+
+    assert asyncio.run(run())["hash"] == "0xbeef"
+    assert len(node.client.gets) > 1
+
+
+def test_failed_transaction_raises_with_the_vm_status():
+    node = StubNode()
+    watcher = _watcher(node)
+    node.commit(SENDER, 7, "0xbad", success=False)
+
+    with pytest.raises(Exception, match="E_SOMETHING"):
+        asyncio.run(watcher.wait("0xbad", SENDER, 7))
+    assert watcher.stats()["failed"] == 1
+
+
+def test_sequence_number_taken_by_another_transaction():
+    node = StubNode()
+    watcher = _watcher(node)
+    node.commit(SENDER, 3, "0xother")
+
+    with pytest.raises(Exception, match="was replaced"):
+        asyncio.run(watcher.wait("0xmine", SENDER, 3))
+
+
+def test_times_out():
+    node = StubNode()
+    watcher = _watcher(node, timeout_s=0.05)
+
+    with pytest.raises(TimeoutError):
+        asyncio.run(watcher.wait("0xlost", SENDER, 0))
+    assert watcher.stats()["timed_out"] == 1
+
+
+def test_without_a_sender_looks_up_by_hash():
+    node = StubNode()
+    watcher = _watcher(node)
+    node.commit(SENDER, 5, "0xcafe")
+
+    assert asyncio.run(watcher.wait("0xcafe"))["sequence_number"] == "5"
+    assert node.client.gets == []
+
+
+def test_identical_concurrent_views_share_one_call():
+    node = StubNode()
+    views = ViewCoalescer(lambda: node)
+
+    async def run():
+        same = [views.view("0x1::m::f", [], ["0xaa"]) for _ in range(5)]
+        other = views.view("0x1::m::f", [], ["0xbb"])
+        return await asyncio.gather(*same, other)
+
+    results = asyncio.run(run())
+    assert results[:5] == [["0x1::m::f", ["0xaa"]]] * 5
+    assert results[5] == ["0x1::m::f", ["0xbb"]]
+    assert node.views == 2
+    assert views.stats()["coalesced"] == 4
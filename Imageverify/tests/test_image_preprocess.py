@@ -0,0 +1,113 @@
+# file: tests/test_image_preprocess.py
+#
+# The fast preprocessing path (image_preprocess.py) against the
+# transformers image processor it replaces, on generated images.
+#
+# Tolerances, in normalized pixel_values units (mean 0.5 / std 0.5 maps
+# 0..255 to -1..1, so one uint8 step is ~0.0078):
+#   - full-size decode: max abs difference 1e-4 (float rounding only)
+#   - draft (DCT-scaled) JPEG decode: mean abs difference 0.02. The
+#     reduced-size decode is a slightly different resampling, so single
+#     pixels on sharp edges may differ more; only the mean is bounded.
+#
+import io
+import threading
+
+import pytest
+
+np = pytest.importorskip("numpy")
+Image = pytest.importorskip("PIL.Image")
+transformers = pytest.importorskip("transformers")
+
+from image_preprocess import ImagePreprocessor  # noqa: E402
+
+EXACT_MAX_DIFF = 1e-4
+DRAFT_MEAN_DIFF = 0.02
+
+
+def _processor():
+    return transformers.ViTImageProcessor(
+        size={"height": 224, "width": 224},
+        image_mean=[0.5, 0.5, 0.5],
+        image_std=[0.5, 0.5, 0.5],
+        resample=Image.BILINEAR,
+    )
+
+
+def _generated_image(seed: int, size) -> Image.Image:
+    """A smooth gradient with a few solid shapes: like a photo, not noise."""
+    rng = np.random.default_rng(seed)
+    width, height = size
+    x = np.linspace(0, 1, width, dtype=np.float32)[None, :, None]
+    y = np.linspace(0, 1, height, dtype=np.float32)[:, None, None]
+    colors = rng.uniform(0, 255, size=(3, 3)).astype(np.float32)
+    pixels = colors[0] + (colors[1] - colors[0]) * x + (colors[2] - colors[0]) * y
+    pixels = np.clip(pixels, 0, 255).astype(np.uint8)
+    img = Image.fromarray(pixels, "RGB")
+    for _ in range(4):
+        left, top = int(rng.integers(0, width // 2)), int(rng.integers(0, height // 2))
+        box = (left, top, left + width // 4, top + height // 4)
+        img.paste(tuple(int(c) for c in rng.integers(0, 256, size=3)), box)
+    return img
+
+
+def _encoded(img: Image.Image, fmt: str) -> bytes:
+    buffer = io.BytesIO()
+    if fmt == "JPEG":
+        img.save(buffer, format=fmt, quality=95)
+    else:
+        img.save(buffer, format=fmt)
+    return buffer.getvalue()
+
+
+def _reference(processor, data: bytes):
+    with Image.open(io.BytesIO(data)) as img:
+        return processor(img.convert("RGB"), return_tensors="np")["pixel_values"]
+
+
+CASES = [
+    (1, (640, 480), "PNG"),
+    (2, (224, 224), "PNG"),
+    (3, (1024, 768), "JPEG"),
+    (4, (300, 900), "JPEG"),
+    (5, (1600, 1200), "JPEG"),
+]
+
+
+@pytest.mark.parametrize("seed,size,fmt", CASES)
+def test_full_decode_matches_the_processor(seed, size, fmt):
+    processor = _processor()
+    fast = ImagePreprocessor.from_processor(processor, draft=False)
+    data = _encoded(_generated_image(seed, size), fmt)
+
+    reference = _reference(processor, data)
+    candidate = fast.to_batch([fast.load(io.BytesIO(data))])
+
+    assert candidate.shape == reference.shape == (1, 3, 224, 224)
+    assert candidate.dtype == np.float32
+    assert float(np.abs(reference - candidate).max()) <= EXACT_MAX_DIFF
+
+
+@pytest.mark.parametrize("seed,size,fmt", [case for case in CASES if case[2] == "JPEG"])
+def test_draft_decode_is_close_to_the_processor(seed, size, fmt):
+    processor = _processor()
+    fast = ImagePreprocessor.from_processor(processor, draft=True)
+    data = _encoded(_generated_image(seed, size), fmt)
+
+    diff = np.abs(_reference(processor, data) - fast.to_batch([fast.load(io.BytesIO(data))]))
+    assert float(diff.mean()) <= DRAFT_MEAN_DIFF
+
+
+def test_batches_of_different_threads_do_not_share_a_buffer():
+    fast = ImagePreprocessor.from_processor(_processor(), draft=False)
+    black = np.zeros((224, 224, 3), dtype=np.uint8)
+    white = np.full((224, 224, 3), 255, dtype=np.uint8)
+
+    mine = fast.to_batch([black, black])
+    expected = mine.copy()
+    # The micro-batcher's thread normalizes its own batch meanwhile
+    worker = threading.Thread(target=fast.to_batch, args=([white, white, white],))
+    worker.start()
+    worker.join()
+
+    np.testing.assert_array_equal(mine, expected)
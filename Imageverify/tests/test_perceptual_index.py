@@ -0,0 +1,89 @@
+# file: tests/test_perceptual_index.py
+#
+# PerceptualIndex on a temporary SQLite file: the multi-index probe finds
+# every fingerprint within the distance limit and nothing beyond it.
+#
+import os
+import random
+
+import pytest
+
+pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+
+from perceptual_index import PerceptualIndex, _block_variants, _blocks  # noqa: E402
+
+FINGERPRINT = 0x0123_4567_89AB_CDEF
+
+
+def _flip(value: int, positions) -> int:
+    for position in positions:
+        value ^= 1 << position
+    return value
+
+
+@pytest.fixture
+def index(tmp_path):
+    return PerceptualIndex(os.path.join(tmp_path, "perceptual.db"))
+
+
+def test_block_variants_cover_every_value_within_the_radius():
+    variants = _block_variants(0, 2)
+    # 1 + 16 + 120 values, none repeated
+    assert len(variants) == len(set(variants)) == 137
+    assert all(bin(variant).count("1") <= 2 for variant in variants)
+    assert _blocks(FINGERPRINT) == [0xCDEF, 0x89AB, 0x4567, 0x0123]
+
+
+def test_changes_spread_over_every_block_are_still_found(index):
+    index.add("image:phash", FINGERPRINT, "original", {"is_fake": False, "confidence": 12})
+    # One flipped bit in each 16-bit block: no block matches exactly, but
+    # each is within max_distance // 4 of the original
+    near = _flip(FINGERPRINT, (3, 19, 35, 51))
+
+    match = index.nearest("image:phash", near, max_distance=4)
+
+    assert match == {"content_hash": "original", "distance": 4,
+                     "result": {"is_fake": False, "confidence": 12}}
+
+
+def test_nothing_beyond_the_limit_is_matched(index):
+    index.add("image:phash", FINGERPRINT, "original", {"is_fake": True})
+    assert index.nearest("image:phash", _flip(FINGERPRINT, (0, 1, 2, 3, 4)), max_distance=4) is None
+    # Kinds are never compared with each other
+    assert index.nearest("audio", FINGERPRINT, max_distance=4) is None
+    assert (index.lookups, index.matches) == (2, 0)
+
+
+def test_closest_of_several_candidates_wins(index):
+    index.add("audio", _flip(FINGERPRINT, (0, 20, 40)), "far", {"rank": 3})
+    index.add("audio", _flip(FINGERPRINT, (63,)), "close", {"rank": 1})
+    # Re-adding a known file keeps its first verdict
+    index.add("audio", FINGERPRINT ^ 0xFFFF, "close", {"rank": 99})
+
+    match = index.nearest("audio", FINGERPRINT, max_distance=4)
+    assert (match["content_hash"], match["distance"], match["result"]) == ("close", 1, {"rank": 1})
+    assert index.stats()["entries"] == {"audio": 2}
+
+
+def test_probe_agrees_with_a_linear_scan(index):
+    rng = random.Random(7)
+    stored = {}
+    for n in range(200):
+        # Half of them close to the query, half anywhere
+        if n % 2:
+            value = _flip(FINGERPRINT, rng.sample(range(64), rng.randint(0, 8)))
+        else:
+            value = rng.getrandbits(64)
+        stored[f"file-{n}"] = value
+        index.add("image:dhash", value, f"file-{n}", {"n": n})
+
+    for max_distance in (0, 4, 8):
+        within = {name: (value ^ FINGERPRINT).bit_count() for name, value in stored.items()
+                  if (value ^ FINGERPRINT).bit_count() <= max_distance}
+        match = index.nearest("image:dhash", FINGERPRINT, max_distance)
+        if not within:
+            assert match is None
+        else:
+            assert match["distance"] == min(within.values())
+            assert within[match["content_hash"]] == match["distance"]
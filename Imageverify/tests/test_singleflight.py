@@ -0,0 +1,102 @@
+# file: tests/test_singleflight.py
+#
+# SingleFlight, and the verdict cache's use of it: concurrent uploads of
+# one hash share a detection, and failed detections are never cached.
+#
+import asyncio
+import os
+
+import pytest
+
+from singleflight import SingleFlight
+from verdict_cache import VerdictCache
+
+
+def test_concurrent_calls_with_one_key_share_one_run():
+    flight = SingleFlight()
+    runs = []
+
+    async def work():
+        runs.append(1)
+        await asyncio.sleep(0.01)
+        return "verdict"
+
+    async def run():
+        return await asyncio.gather(*(flight.do("hash", work) for _ in range(5)))
+
+    results = asyncio.run(run())
+    assert [result for (result, _) in results] == ["verdict"] * 5
+    assert sorted(shared for (_, shared) in results) == [False] + [True] * 4
+    assert len(runs) == 1
+    assert (flight.started, flight.coalesced, flight.in_flight()) == (1, 4, 0)
+
+
+def test_different_keys_run_separately():
+    flight = SingleFlight()
+
+    async def run():
+        return await asyncio.gather(
+            flight.do("a", lambda: asyncio.sleep(0.01, result="a")),
+            flight.do("b", lambda: asyncio.sleep(0.01, result="b")),
+        )
+
+    assert asyncio.run(run()) == [("a", False), ("b", False)]
+    assert flight.started == 2
+
+
+def test_every_waiter_gets_the_exception_and_the_key_is_released():
+    flight = SingleFlight()
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("cannot decode")
+
+    async def run():
+        outcomes = await asyncio.gather(*(flight.do("hash", fail) for _ in range(3)),
+                                        return_exceptions=True)
+        assert all(isinstance(outcome, ValueError) for outcome in outcomes)
+        # Nothing remembered: the next call runs again
+        return await flight.do("hash", lambda: asyncio.sleep(0, result="ok"))
+
+    assert asyncio.run(run()) == ("ok", False)
+
+
+def test_a_cancelled_caller_does_not_cancel_the_others():
+    flight = SingleFlight()
+
+    async def run():
+        first = asyncio.ensure_future(flight.do("hash", lambda: asyncio.sleep(0.05, result="done")))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(flight.do("hash", lambda: asyncio.sleep(0, result="other")))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(run()) == ("done", True)
+
+
+def test_cache_coalesces_and_keeps_only_successes(tmp_path):
+    cache = VerdictCache(max_entries=10, db_path=os.path.join(tmp_path, "cache.db"))
+    calls = []
+
+    async def detect():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return {"is_fake": True, "confidence": 91}
+
+    async def broken():
+        raise RuntimeError("model failed")
+
+    async def run():
+        with pytest.raises(RuntimeError):
+            await cache.get_or_compute("bad", broken)
+        results = await asyncio.gather(*(cache.get_or_compute("good", detect) for _ in range(3)))
+        return results, await cache.get_or_compute("good", detect)
+
+    results, again = asyncio.run(run())
+    assert sorted(source for (_, source) in results) == ["coalesced", "coalesced", "computed"]
+    assert again == ({"is_fake": True, "confidence": 91}, "memory")
+    assert len(calls) == 1
+    # The failure left nothing behind, in memory or on disk
+    assert cache.get("bad") == (None, None)
+    assert VerdictCache(db_path=os.path.join(tmp_path, "cache.db")).get("good")[1] == "disk"
@@ -0,0 +1,296 @@
+# file: tests/test_submission_queue.py
+#
+# SubmissionQueue on a temporary SQLite file: claiming, leases, retries
+# and finalizing, with the chain calls of aptos_service stubbed out.
+#
+import asyncio
+import os
+import sqlite3
+import time
+
+import pytest
+
+pytest.importorskip("aptos_sdk")
+
+import aptos_service  # noqa: E402
+import submission_queue  # noqa: E402
+from submission_queue import (  # noqa: E402
+    STATUS_FAILED, STATUS_FINALIZED, STATUS_PENDING, STATUS_SUBMITTED, SubmissionQueue,
+)
+from verdict_index import VerdictIndex  # noqa: E402
+
+HASH_A = "aa" * 32
+HASH_B = "bb" * 32
+HASH_C = "cc" * 32
+SENDER = "0xa11ce"
+EVENT_TYPE = f"{aptos_service.MODULE_ADDRESS_STR}::image_verifier::VerdictRegistered"
+
+
+@pytest.fixture
+def queue(tmp_path):
+    return SubmissionQueue(os.path.join(tmp_path, "jobs.db"))
+
+
+@pytest.fixture
+def index(tmp_path, monkeypatch):
+    index = VerdictIndex(os.path.join(tmp_path, "index.db"))
+    monkeypatch.setattr(submission_queue, "VERDICT_INDEX", index)
+    return index
+
+
+def _committed_batch(tx_hash: str, jobs, stored_hashes, timestamp_s: int = 1_700_000_000) -> dict:
+    """A committed register_verdicts_batch that stored only `stored_hashes`."""
+    return {
+        "type": "user_transaction", "hash": tx_hash, "sender": SENDER, "success": True,
+        "timestamp": str(timestamp_s * 1_000_000),
+        "payload": {
+            "function": f"{aptos_service.MODULE_ADDRESS_STR}::image_verifier::register_verdicts_batch",
+            "arguments": [
+                ["0x" + job["image_hash_hex"] for job in jobs],
+                [job["is_deepfake"] for job in jobs],
+                "0x" + bytes(job["confidence"] for job in jobs).hex(),
+            ],
+        },
+        "events": [
+            {"type": EVENT_TYPE, "data": {
+                "image_hash": "0x" + job["image_hash_hex"], "is_deepfake": job["is_deepfake"],
+                "confidence_score": job["confidence"], "verified_by": SENDER,
+                "verified_at": str(timestamp_s),
+            }}
+            for job in jobs if job["image_hash_hex"] in stored_hashes
+        ],
+    }
+
+
+# --- Claims and leases ---
+
+def test_enqueue_is_idempotent_per_hash(queue):
+    first = queue.enqueue(HASH_A, True, 90)
+    again = queue.enqueue(HASH_A, False, 10)
+    assert again["job_id"] == first["job_id"]
+    assert again["is_deepfake"] is True and again["status"] == STATUS_PENDING
+
+
+def test_partial_batch_waits_for_the_oldest_job(queue):
+    queue.enqueue(HASH_A, True, 90)
+    queue.enqueue(HASH_B, False, 80)
+    assert queue.claim_batch(3, max_wait_s=60) == []
+    # A full batch (or a long enough wait) is claimed at once
+    claimed = queue.claim_batch(2, max_wait_s=60)
+    assert sorted(job["image_hash_hex"] for job in claimed) == [HASH_A, HASH_B]
+
+
+def test_claimed_jobs_are_leased(queue, monkeypatch):
+    queue.enqueue(HASH_A, True, 90)
+    assert len(queue.claim_batch(1, max_wait_s=0)) == 1
+    assert queue.claim_batch(1, max_wait_s=0) == []
+
+    # A worker that died leaves its lease to expire
+    monkeypatch.setattr(submission_queue, "CHAIN_CLAIM_TIMEOUT_S", -1)
+    queue.enqueue(HASH_B, True, 70)
+    assert len(queue.claim_batch(1, max_wait_s=0)) == 1
+    assert [job["image_hash_hex"] for job in queue.claim_batch(1, max_wait_s=0)] == [HASH_B]
+
+
+def test_submitted_transaction_is_claimed_as_a_whole(queue):
+    jobs = [queue.enqueue(h, True, 90) for h in (HASH_A, HASH_B)]
+    queue.enqueue(HASH_C, False, 60)
+    queue.mark_submitted([job["job_id"] for job in jobs], "0xtx")
+
+    claimed = queue.claim_batch(32, max_wait_s=0)
+    assert sorted(job["image_hash_hex"] for job in claimed) == [HASH_A, HASH_B]
+    assert {job["status"] for job in claimed} == {STATUS_SUBMITTED}
+
+
+# --- Retries ---
+
+def test_retry_backs_off_and_finally_fails(queue, monkeypatch):
+    monkeypatch.setattr(submission_queue, "CHAIN_MAX_ATTEMPTS", 2)
+    job = queue.enqueue(HASH_A, True, 90)
+    queue.mark_submitted([job["job_id"]], "0xtx")
+
+    queue.mark_retry(job["job_id"], 1, "node unavailable")
+    retried = queue.get_job(job["job_id"])
+    assert retried["status"] == STATUS_PENDING
+    assert retried["transaction_hash"] is None and retried["attempts"] == 1
+    # Not due yet
+    assert queue.claim_batch(1, max_wait_s=0) == []
+
+    queue.mark_retry(job["job_id"], 2, "node unavailable")
+    assert queue.get_job(job["job_id"])["status"] == STATUS_FAILED
+    # A new upload of the same file starts over
+    assert queue.enqueue(HASH_A, True, 90)["status"] == STATUS_PENDING
+    assert queue.get_job(job["job_id"])["attempts"] == 0
+
+
+def test_enqueue_during_an_empty_claim_wakes_the_worker(queue, monkeypatch):
+    monkeypatch.setattr(submission_queue, "CHAIN_POLL_INTERVAL_S", 60)
+    claim_batch = queue.claim_batch
+    claims, processed = [], []
+
+    def racing_claim(max_size, max_wait_s):
+        claims.append(max_size)
+        if len(claims) == 1:
+            # Nothing due when it looked; a job arrives before it returns
+            queue.enqueue(HASH_A, True, 90)
+            return []
+        return claim_batch(max_size, 0)
+
+    async def process(jobs):
+        processed.extend(job["image_hash_hex"] for job in jobs)
+
+    monkeypatch.setattr(queue, "claim_batch", racing_claim)
+    monkeypatch.setattr(queue, "_process", process)
+
+    async def run():
+        queue.start()
+        try:
+            for _ in range(100):
+                if processed:
+                    break
+                await asyncio.sleep(0.01)
+        finally:
+            await queue.stop()
+
+    asyncio.run(run())
+    # Picked up right away, not after the 60 s poll interval
+    assert processed == [HASH_A]
+
+
+# --- Processing a claimed batch ---
+
+def _stub_chain(monkeypatch, tx_for, error=None, chain_verdicts=None):
+    submitted = []
+
+    async def submit_verdicts_batch(verdicts):
+        submitted.append(verdicts)
+        return "0xtx"
+
+    async def wait_for_finality(tx_hash):
+        if error is not None:
+            raise error
+        return tx_for(tx_hash)
+
+    async def get_verdict_from_chain(image_hash_hex):
+        return chain_verdicts.get(image_hash_hex, {"found": False})
+
+    monkeypatch.setattr(aptos_service, "submit_verdicts_batch", submit_verdicts_batch)
+    monkeypatch.setattr(aptos_service, "wait_for_finality", wait_for_finality)
+    monkeypatch.setattr(aptos_service, "get_verdict_from_chain", get_verdict_from_chain)
+    return submitted
+
+
+def test_finalize_indexes_what_the_chain_stored(queue, index, monkeypatch):
+    queue.enqueue(HASH_A, True, 90)
+    queue.enqueue(HASH_B, True, 80)
+    jobs = queue.claim_batch(2, max_wait_s=0)
+    # B already had a verdict on chain (by another oracle), so the batch
+    # skipped it: only A has an event
+    other = {"found": True, "is_deepfake": False, "confidence": 55, "verified_by": "0xb0b",
+             "verified_at": "2023-01-01 00:00:00", "verified_at_unix": 1_672_531_200}
+    submitted = _stub_chain(
+        monkeypatch, lambda tx_hash: _committed_batch(tx_hash, jobs, {HASH_A}),
+        chain_verdicts={HASH_B: other},
+    )
+
+    asyncio.run(queue._process(jobs))
+
+    assert len(submitted) == 1
+    assert {queue.get_job(job["job_id"])["status"] for job in jobs} == {STATUS_FINALIZED}
+    indexed = index.get_many([HASH_A, HASH_B])
+    assert indexed[HASH_A]["is_deepfake"] is True
+    assert indexed[HASH_A]["verified_by"] == SENDER
+    assert indexed[HASH_A]["transaction_hash"] == "0xtx"
+    # The chain's record for B, not our submitted arguments
+    assert indexed[HASH_B]["is_deepfake"] is False
+    assert indexed[HASH_B]["confidence"] == 55
+    assert indexed[HASH_B]["verified_by"] == "0xb0b"
+    assert indexed[HASH_B]["transaction_hash"] is None
+
+
+def test_already_registered_counts_as_finalized(queue, index, monkeypatch):
+    queue.enqueue(HASH_A, True, 90)
+    jobs = queue.claim_batch(1, max_wait_s=0)
+    _stub_chain(monkeypatch, None, error=Exception("Move abort: E_VERDICT_ALREADY_EXISTS(0x1)"))
+
+    asyncio.run(queue._process(jobs))
+
+    job = queue.get_job(jobs[0]["job_id"])
+    assert job["status"] == STATUS_FINALIZED
+    assert job["last_error"] == "already registered on chain"
+    assert index.get(HASH_A) is None
+
+
+def test_timed_out_transaction_is_waited_for_again(queue, index, monkeypatch):
+    queue.enqueue(HASH_A, True, 90)
+    jobs = queue.claim_batch(1, max_wait_s=0)
+    submitted = _stub_chain(monkeypatch, None, error=TimeoutError("transaction 0xtx timed out"))
+
+    asyncio.run(queue._process(jobs))
+
+    # It may still commit: same transaction, no attempt used up
+    job = queue.get_job(jobs[0]["job_id"])
+    assert (job["status"], job["transaction_hash"], job["attempts"]) == (STATUS_SUBMITTED, "0xtx", 0)
+    assert "timed out" in job["last_error"]
+    assert queue.claim_batch(1, max_wait_s=0) == []
+
+    # Once due, the transaction is polled again, not sent again
+    monkeypatch.setattr(submission_queue, "CHAIN_RETRY_BASE_S", 0)
+    queue.mark_unconfirmed([job["job_id"]], job["last_error"])
+    jobs = queue.claim_batch(1, max_wait_s=0)
+    assert [(j["status"], j["transaction_hash"]) for j in jobs] == [(STATUS_SUBMITTED, "0xtx")]
+    _stub_chain(monkeypatch, lambda tx_hash: _committed_batch(tx_hash, jobs, {HASH_A}))
+    asyncio.run(queue._process(jobs))
+
+    assert len(submitted) == 1
+    assert queue.get_job(job["job_id"])["status"] == STATUS_FINALIZED
+    assert index.get(HASH_A)["transaction_hash"] == "0xtx"
+
+
+def test_expired_transaction_is_sent_again(queue, index, monkeypatch):
+    queue.enqueue(HASH_A, True, 90)
+    jobs = queue.claim_batch(1, max_wait_s=0)
+    queue.mark_submitted([jobs[0]["job_id"]], "0xold")
+    jobs = [queue.get_job(jobs[0]["job_id"])]
+    monkeypatch.setattr(submission_queue, "CHAIN_TX_EXPIRY_S", 0)
+    _stub_chain(monkeypatch, None, error=TimeoutError("transaction 0xold timed out"))
+
+    asyncio.run(queue._process(jobs))
+
+    job = queue.get_job(jobs[0]["job_id"])
+    assert (job["status"], job["transaction_hash"], job["submitted_at"]) == (STATUS_PENDING, None, None)
+    assert job["attempts"] == 1
+
+
+def test_failed_transaction_is_retried_later(queue, index, monkeypatch):
+    queue.enqueue(HASH_A, True, 90)
+    jobs = queue.claim_batch(1, max_wait_s=0)
+    _stub_chain(monkeypatch, None, error=Exception("Move abort: OUT_OF_GAS - 0xtx"))
+
+    before = time.time()
+    asyncio.run(queue._process(jobs))
+
+    job = queue.get_job(jobs[0]["job_id"])
+    assert (job["status"], job["transaction_hash"]) == (STATUS_PENDING, None)
+    assert job["attempts"] == 1 and "OUT_OF_GAS" in job["last_error"]
+    assert queue.claim_batch(1, max_wait_s=0) == []
+    assert index.get(HASH_A) is None
+    assert job["updated_at"] >= before
+
+
+def test_queue_file_without_submitted_at_is_upgraded(tmp_path):
+    path = os.path.join(tmp_path, "old.db")
+    db = sqlite3.connect(path)
+    db.execute(
+        "CREATE TABLE jobs (id INTEGER PRIMARY KEY AUTOINCREMENT, image_hash TEXT NOT NULL UNIQUE,"
+        " is_fake INTEGER NOT NULL, confidence INTEGER NOT NULL, status TEXT NOT NULL, tx_hash TEXT,"
+        " attempts INTEGER NOT NULL DEFAULT 0, last_error TEXT, next_attempt_at REAL NOT NULL,"
+        " lease_until REAL, created_at REAL NOT NULL, updated_at REAL NOT NULL)"
+    )
+    db.execute("INSERT INTO jobs (image_hash, is_fake, confidence, status, tx_hash, next_attempt_at,"
+               " created_at, updated_at) VALUES (?, 1, 90, ?, '0xtx', 0, 100, 200)", (HASH_A, STATUS_SUBMITTED))
+    db.commit()
+    db.close()
+
+    job = SubmissionQueue(path).get_job_by_hash(HASH_A)
+    assert (job["status"], job["submitted_at"]) == (STATUS_SUBMITTED, 200)
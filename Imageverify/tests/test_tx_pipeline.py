@@ -0,0 +1,180 @@
+# file: tests/test_tx_pipeline.py
+#
+# TransactionPipeline's local sequence numbers against a stub node:
+# allocation, when they are resynced, and in-flight limits.
+#
+import asyncio
+
+import pytest
+
+pytest.importorskip("aptos_sdk")
+
+from aptos_sdk.async_client import ApiError  # noqa: E402
+
+from tx_pipeline import TransactionPipeline  # noqa: E402
+
+
+class StubAccount:
+    def __init__(self, address: str):
+        self._address = address
+
+    def address(self) -> str:
+        return self._address
+
+
+class StubNode:
+    """Signs locally and accepts submissions; failures are queued up front."""
+
+    def __init__(self):
+        self.sequence_numbers = {}
+        self.reads = 0
+        self.submitted = []
+        # Exceptions the next submissions raise, in order
+        self.submit_errors = []
+        # Transactions wait_for_transaction holds until released
+        self.finality = asyncio.Event()
+        self.finality.set()
+
+    async def account_sequence_number(self, address) -> int:
+        self.reads += 1
+        return self.sequence_numbers.get(address, 0)
+
+    async def create_bcs_signed_transaction(self, account, payload, sequence_number=None):
+        return (account.address(), sequence_number)
+
+    async def submit_bcs_transaction(self, signed_tx) -> str:
+        if self.submit_errors:
+            raise self.submit_errors.pop(0)
+        self.submitted.append(signed_tx)
+        return f"0x{signed_tx[0]}-{signed_tx[1]}"
+
+    async def wait_for_transaction(self, tx_hash: str):
+        await self.finality.wait()
+        if "lost" in tx_hash:
+            raise AssertionError(f"transaction {tx_hash} timed out")
+
+    async def transaction_by_hash(self, tx_hash: str) -> dict:
+        return {"hash": tx_hash, "success": True}
+
+
+def _pipeline(node, signers=("s1",), max_in_flight=4) -> TransactionPipeline:
+    return TransactionPipeline(lambda: node, [StubAccount(a) for a in signers],
+                               max_in_flight_per_signer=max_in_flight)
+
+
+def test_sequence_numbers_are_allocated_locally():
+    node = StubNode()
+    node.sequence_numbers["s1"] = 10
+    pipeline = _pipeline(node)
+
+    async def run():
+        return await asyncio.gather(*(pipeline.submit(None) for _ in range(4)))
+
+    hashes = asyncio.run(run())
+    assert sorted(hashes) == [f"0xs1-{n}" for n in range(10, 14)]
+    # One read of the node, then counted locally
+    assert node.reads == 1
+    assert pipeline.slots[0].pending == {10, 11, 12, 13}
+
+
+def test_load_is_spread_over_the_signers():
+    node = StubNode()
+    pipeline = _pipeline(node, signers=("s1", "s2"), max_in_flight=2)
+
+    async def run():
+        return await asyncio.gather(*(pipeline.submit(None) for _ in range(4)))
+
+    assert sorted(asyncio.run(run())) == ["0xs1-0", "0xs1-1", "0xs2-0", "0xs2-1"]
+    assert pipeline.stats()["in_flight"] == 4
+
+
+def test_in_flight_limit_waits_for_a_confirmation():
+    node = StubNode()
+    pipeline = _pipeline(node, max_in_flight=1)
+
+    async def run():
+        first = await pipeline.submit(None)
+        second = asyncio.ensure_future(pipeline.submit(None))
+        await asyncio.sleep(0.01)
+        assert not second.done()
+        assert (await pipeline.wait(first))["hash"] == first
+        return await second
+
+    assert asyncio.run(run()) == "0xs1-1"
+
+
+def test_transport_errors_keep_the_local_count():
+    node = StubNode()
+    pipeline = _pipeline(node)
+
+    async def run():
+        await pipeline.submit(None)
+        node.submit_errors.append(ConnectionError("read timeout"))
+        with pytest.raises(ConnectionError):
+            await pipeline.submit(None)
+        node.submit_errors.append(ApiError("service unavailable", 503))
+        with pytest.raises(ApiError):
+            await pipeline.submit(None)
+        return await pipeline.submit(None)
+
+    # The node may have taken 1 and 2, so they aren't handed out again
+    assert asyncio.run(run()) == "0xs1-3"
+    assert node.reads == 1
+
+
+def test_rejected_transaction_gives_its_number_back():
+    node = StubNode()
+    pipeline = _pipeline(node)
+
+    async def run():
+        await pipeline.submit(None)
+        node.submit_errors.append(ApiError("invalid payload", 400))
+        with pytest.raises(ApiError):
+            await pipeline.submit(None)
+        return await pipeline.submit(None)
+
+    assert asyncio.run(run()) == "0xs1-1"
+    assert node.reads == 1
+
+
+def test_sequence_error_resyncs_only_after_in_flight_transactions_settle():
+    node = StubNode()
+    node.finality.clear()
+    pipeline = _pipeline(node)
+
+    async def run():
+        in_flight = [await pipeline.submit(None) for _ in range(2)]
+        # Another process used this signer: the node is at 5 now
+        node.sequence_numbers["s1"] = 5
+        node.submit_errors.append(ApiError("SEQUENCE_NUMBER_TOO_OLD", 400))
+        retrying = asyncio.ensure_future(pipeline.submit(None))
+        await asyncio.sleep(0.01)
+        # Still waiting: resyncing now could hand out 0 or 1 again
+        assert not retrying.done() and node.reads == 1
+
+        node.finality.set()
+        await asyncio.gather(*(pipeline.wait(tx_hash) for tx_hash in in_flight))
+        return await retrying
+
+    assert asyncio.run(run()) == "0xs1-5"
+    assert node.reads == 2
+    assert pipeline.slots[0].resyncs == 2
+
+
+def test_expired_transaction_forces_a_resync():
+    node = StubNode()
+    pipeline = _pipeline(node)
+
+    async def run():
+        await pipeline.submit(None)
+        # Pretend its hash shows it was lost
+        tx_hash = next(iter(pipeline._tx_slots))
+        pipeline._tx_slots["0xlost"] = pipeline._tx_slots.pop(tx_hash)
+        with pytest.raises(AssertionError, match="timed out"):
+            await pipeline.wait("0xlost")
+        node.sequence_numbers["s1"] = 0
+        return await pipeline.submit(None)
+
+    assert asyncio.run(run()) == "0xs1-0"
+    assert node.reads == 2
+    assert pipeline.stats()["in_flight"] == 1
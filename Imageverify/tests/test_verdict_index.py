@@ -0,0 +1,227 @@
+# file: tests/test_verdict_index.py
+#
+# The verdict index: which verdicts a committed transaction is indexed
+# with, and the follower that tails the signers' transactions.
+#
+import asyncio
+import os
+
+import pytest
+
+pytest.importorskip("aptos_sdk")
+
+import aptos_service  # noqa: E402
+from verdict_index import ChainFollower, VerdictIndex, index_transaction, verdicts_from_transaction  # noqa: E402
+
+MODULE = f"{aptos_service.MODULE_ADDRESS_STR}::image_verifier"
+HASH_A = "aa" * 32
+HASH_B = "bb" * 32
+SENDER = "0xa11ce"
+TIMESTAMP_S = 1_700_000_000
+
+
+def _tx(function: str, arguments, events=(), success=True, tx_hash="0xtx", sequence_number=0) -> dict:
+    return {
+        "type": "user_transaction", "hash": tx_hash, "sender": SENDER, "success": success,
+        "sequence_number": str(sequence_number), "timestamp": str(TIMESTAMP_S * 1_000_000),
+        "payload": {"function": f"{MODULE}::{function}", "arguments": arguments},
+        "events": list(events),
+    }
+
+
+def _event(image_hash_hex: str, is_fake: bool, confidence: int) -> dict:
+    return {"type": f"{MODULE}::VerdictRegistered", "data": {
+        "image_hash": "0x" + image_hash_hex, "is_deepfake": is_fake, "confidence_score": confidence,
+        "verified_by": SENDER, "verified_at": str(TIMESTAMP_S),
+    }}
+
+
+def _batch(events=(), **kwargs) -> dict:
+    # vector<u8> confidences come back as one hex string
+    return _tx("register_verdicts_batch", [["0x" + HASH_A, "0x" + HASH_B], [True, False], "0x5a3c"],
+               events=events, **kwargs)
+
+
+@pytest.fixture
+def index(tmp_path):
+    return VerdictIndex(os.path.join(tmp_path, "index.db"))
+
+
+# --- What a transaction stored ---
+
+def test_single_registration_is_its_arguments():
+    entries, unresolved = verdicts_from_transaction(_tx("register_verdict", ["0x" + HASH_A, True, "87"]))
+    assert entries == [(HASH_A, True, 87, SENDER, TIMESTAMP_S, "0xtx")]
+    assert unresolved == []
+
+
+def test_batch_uses_events_and_leaves_skipped_hashes_unresolved():
+    entries, unresolved = verdicts_from_transaction(_batch(events=[_event(HASH_A, True, 90)]))
+    assert entries == [(HASH_A, True, 90, SENDER, TIMESTAMP_S, "0xtx")]
+    assert unresolved == [HASH_B]
+
+
+def test_batch_without_events_is_not_taken_at_its_word():
+    entries, unresolved = verdicts_from_transaction(_batch())
+    assert entries == []
+    assert unresolved == [HASH_A, HASH_B]
+
+
+def test_failed_or_foreign_transactions_store_nothing():
+    assert verdicts_from_transaction(_batch(success=False)) == ([], [])
+    other = _tx("register_verdict", ["0x" + HASH_A, True, "87"])
+    other["payload"]["function"] = "0x1::coin::transfer"
+    assert verdicts_from_transaction(other) == ([], [])
+
+
+def test_unresolved_hashes_are_read_back_from_the_chain(index, monkeypatch):
+    chain = {
+        # Stored by this transaction (our sender, its block time)
+        HASH_A: {"found": True, "is_deepfake": True, "confidence": 90, "verified_by": SENDER,
+                 "verified_at": "", "verified_at_unix": TIMESTAMP_S},
+        # Skipped: registered earlier by somebody else
+        HASH_B: {"found": True, "is_deepfake": True, "confidence": 40, "verified_by": "0xb0b",
+                 "verified_at": "", "verified_at_unix": TIMESTAMP_S - 3600},
+    }
+
+    async def get_verdict_from_chain(image_hash_hex):
+        return dict(chain[image_hash_hex])
+
+    monkeypatch.setattr(aptos_service, "get_verdict_from_chain", get_verdict_from_chain)
+    # An older, wrong row is replaced by the chain's record
+    index.put(HASH_B, False, 60, SENDER, TIMESTAMP_S, "0xtx", "submission")
+
+    assert asyncio.run(index_transaction(index, _batch(), "follower")) == 2
+
+    indexed = index.get_many([HASH_A, HASH_B])
+    assert (indexed[HASH_A]["confidence"], indexed[HASH_A]["transaction_hash"]) == (90, "0xtx")
+    assert indexed[HASH_B]["is_deepfake"] is True
+    assert (indexed[HASH_B]["verified_by"], indexed[HASH_B]["transaction_hash"]) == ("0xb0b", None)
+
+
+# --- Follower ---
+
+class StubResponse:
+    def __init__(self, status_code: int, body):
+        self.status_code = status_code
+        self._body = body
+
+    def json(self):
+        return self._body
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise Exception(f"HTTP {self.status_code}")
+
+
+class StubNode:
+    base_url = "http://node/v1"
+
+    def __init__(self, transactions):
+        self.transactions = transactions
+        self.client = self
+        self.gets = []
+
+    async def get(self, url: str, params=None):
+        self.gets.append(dict(params))
+        start, limit = params["start"], params["limit"]
+        return StubResponse(200, self.transactions[start:start + limit])
+
+
+def test_follower_indexes_events_and_saves_its_cursor(index, monkeypatch):
+    node = StubNode([
+        _tx("register_verdict", ["0x" + HASH_A, True, "87"], tx_hash="0x1", sequence_number=0),
+        _batch(events=[_event(HASH_B, False, 70)], tx_hash="0x2", sequence_number=1),
+    ])
+    monkeypatch.setattr(aptos_service, "get_client", lambda: node)
+
+    async def get_verdict_from_chain(image_hash_hex):
+        # HASH_A is skipped by the batch; the chain has the first verdict
+        return {"found": True, "is_deepfake": True, "confidence": 87, "verified_by": SENDER,
+                "verified_at": "", "verified_at_unix": TIMESTAMP_S}
+
+    monkeypatch.setattr(aptos_service, "get_verdict_from_chain", get_verdict_from_chain)
+    follower = ChainFollower(index, [SENDER])
+
+    asyncio.run(follower.sync_address(SENDER))
+
+    assert index.get(HASH_A)["confidence"] == 87
+    assert index.get(HASH_B)["is_deepfake"] is False
+    assert index.get_cursor(SENDER) == 2
+    # The next sync starts after what was seen
+    asyncio.run(follower.sync_address(SENDER))
+    assert node.gets[-1]["start"] == 2
+
+
+# --- /check-hash lookups ---
+
+class StubChain:
+    """get_verdict_from_chain, counting calls; knows only `verdicts`."""
+
+    def __init__(self, verdicts):
+        self.verdicts = verdicts
+        # Hashes whose lookup fails
+        self.failing = set()
+        self.calls = []
+
+    async def __call__(self, image_hash_hex: str) -> dict:
+        self.calls.append(image_hash_hex)
+        await asyncio.sleep(0.01)
+        if image_hash_hex in self.failing:
+            raise ConnectionError("node unreachable")
+        if image_hash_hex not in self.verdicts:
+            return {"found": False}
+        return {"found": True, "verified_at": "2023-11-14 22:13:20", **self.verdicts[image_hash_hex]}
+
+
+@pytest.fixture
+def lookups(index, monkeypatch):
+    import verdict_index
+    monkeypatch.setattr(verdict_index, "VERDICT_INDEX", index)
+    chain = StubChain({HASH_A: {"is_deepfake": True, "confidence": 90, "verified_by": SENDER,
+                                "verified_at_unix": TIMESTAMP_S}})
+    monkeypatch.setattr(aptos_service, "get_verdict_from_chain", chain)
+    return verdict_index, chain
+
+
+def test_chain_answer_keeps_the_check_hash_shape_and_is_indexed(lookups, index):
+    verdict_index, chain = lookups
+
+    async def run():
+        return await asyncio.gather(*(verdict_index.lookup_verdict(HASH_A.upper()) for _ in range(3)))
+
+    results = asyncio.run(run())
+    assert results[0] == {"found": True, "is_deepfake": True, "confidence": 90, "verified_by": SENDER,
+                          "verified_at": "2023-11-14 22:13:20", "source": "chain"}
+    assert results[1] == results[0] and results[1] is not results[0]
+    # Concurrent lookups shared one view call; the next one is local
+    assert chain.calls == [HASH_A]
+    assert index.get(HASH_A)["verified_by"] == SENDER
+    assert asyncio.run(verdict_index.lookup_verdict(HASH_A))["source"] == "index"
+
+
+def test_unknown_hash_is_remembered_as_a_miss(lookups):
+    verdict_index, chain = lookups
+
+    assert asyncio.run(verdict_index.lookup_verdict(HASH_B))["found"] is False
+    # Answered from the miss cache, without asking the chain again
+    assert asyncio.run(verdict_index.lookup_verdict(HASH_B)) == {"found": False}
+    assert chain.calls == [HASH_B]
+
+
+def test_many_hashes_are_looked_up_in_one_pass(lookups, index):
+    verdict_index, chain = lookups
+    hash_c, hash_d, hash_e = "cc" * 32, "dd" * 32, "ee" * 32
+    index.put(hash_c, False, 75, SENDER, TIMESTAMP_S, "0xc", "submission")
+    index.record_miss(hash_d)
+    chain.failing.add(hash_e)
+
+    results = asyncio.run(verdict_index.lookup_verdicts([hash_c, HASH_A, hash_d, hash_e, HASH_A.upper()]))
+
+    assert list(results) == [hash_c, HASH_A, hash_d, hash_e]
+    assert (results[hash_c]["source"], results[hash_c]["confidence"]) == ("index", 75)
+    assert (results[HASH_A]["source"], results[HASH_A]["confidence"]) == ("chain", 90)
+    assert results[hash_d] == {"found": False}
+    assert results[hash_e]["found"] is False and "error" in results[hash_e]
+    # Only the hashes neither indexed nor known misses went to the chain
+    assert sorted(chain.calls) == [HASH_A, hash_e]
@@ -0,0 +1,101 @@
+# file: tests/test_verify.py
+#
+# verify_upload with a stub detector, a temporary job queue and verdict
+# cache: cached verdicts whose chain submission failed are queued again.
+#
+import asyncio
+import hashlib
+import os
+
+import pytest
+
+for module in ("fastapi", "python_multipart", "uvicorn", "aptos_sdk", "numpy", "PIL", "av", "soundfile", "soxr"):
+    pytest.importorskip(module)
+
+import main  # noqa: E402
+import submission_queue  # noqa: E402
+from submission_queue import STATUS_FAILED, STATUS_PENDING, SubmissionQueue  # noqa: E402
+from upload_ingest import IngestedUpload  # noqa: E402
+from verdict_cache import VerdictCache  # noqa: E402
+
+
+def _upload(data: bytes = b"\xff\xd8 not really a jpeg") -> IngestedUpload:
+    upload = IngestedUpload("photo.jpg", "image/jpeg")
+    upload.write(data)
+    upload.finish()
+    return upload
+
+
+@pytest.fixture
+def service(tmp_path, monkeypatch):
+    queue = SubmissionQueue(os.path.join(tmp_path, "jobs.db"))
+    cache = VerdictCache(db_path=os.path.join(tmp_path, "cache.db"))
+    monkeypatch.setattr(main, "SUBMISSION_QUEUE", queue)
+    monkeypatch.setattr(main, "VERDICT_CACHE", cache)
+    monkeypatch.setattr(main, "PERCEPTUAL_INDEX", False)
+    detections = []
+
+    async def run_image_detection(source):
+        detections.append(source)
+        return (True, 91)
+
+    monkeypatch.setattr(main, "run_image_detection", run_image_detection)
+    return queue, cache, detections
+
+
+def _give_up(queue, job_id: int, monkeypatch):
+    monkeypatch.setattr(submission_queue, "CHAIN_MAX_ATTEMPTS", 1)
+    queue.mark_retry(job_id, 1, "node unavailable")
+    assert queue.get_job(job_id)["status"] == STATUS_FAILED
+
+
+def test_cached_verdict_with_a_failed_job_is_queued_again(service, monkeypatch):
+    queue, _, detections = service
+    first = asyncio.run(main.verify_upload(_upload()))
+    job_id = first["blockchain_result"]["job_id"]
+    _give_up(queue, job_id, monkeypatch)
+
+    again = asyncio.run(main.verify_upload(_upload()))
+
+    assert again["cache"] == "memory"
+    assert len(detections) == 1
+    assert again["blockchain_result"]["job_id"] == job_id
+    assert again["blockchain_result"]["status"] == STATUS_PENDING
+    job = queue.get_job(job_id)
+    assert (job["status"], job["attempts"], job["is_deepfake"], job["confidence"]) == (STATUS_PENDING, 0, True, 91)
+
+
+def test_cached_verdict_without_a_job_gets_a_new_one(service, monkeypatch, tmp_path):
+    _, _, detections = service
+    first = asyncio.run(main.verify_upload(_upload()))
+    # The queue database was lost (e.g. a new volume); the cache wasn't
+    queue = SubmissionQueue(os.path.join(tmp_path, "new-jobs.db"))
+    monkeypatch.setattr(main, "SUBMISSION_QUEUE", queue)
+
+    again = asyncio.run(main.verify_upload(_upload()))
+
+    assert len(detections) == 1
+    assert again["blockchain_result"]["status"] == STATUS_PENDING
+    assert queue.get_job_by_hash(first["image_hash_hex"])["job_id"] == again["blockchain_result"]["job_id"]
+
+
+def test_near_duplicate_requeues_its_original(service, monkeypatch):
+    queue, cache, detections = service
+    original = "aa" * 32
+    job = queue.enqueue(original, False, 73)
+    _give_up(queue, job["job_id"], monkeypatch)
+    data = b"\xff\xd8 a re-encoded copy"
+    cache.put(hashlib.sha256(data).hexdigest(), {
+        "ai_verdict": {"is_deepfake": False, "confidence": 73},
+        "job_id": job["job_id"],
+        "near_duplicate_of": {"image_hash_hex": original, "distance": 2},
+    })
+
+    response = asyncio.run(main.verify_upload(_upload(data)))
+
+    assert detections == []
+    assert response["near_duplicate_of"]["image_hash_hex"] == original
+    assert response["blockchain_result"]["job_id"] == job["job_id"]
+    # The original's verdict is what goes on chain, not the copy's hash
+    assert queue.get_job(job["job_id"])["status"] == STATUS_PENDING
+    assert queue.counts()[STATUS_PENDING] == 1
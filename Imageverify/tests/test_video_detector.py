@@ -0,0 +1,58 @@
+# file: tests/test_video_detector.py
+#
+# Frame sampling of videos: the sampled frames are spread over the whole
+# video, not taken from its start.
+#
+import pytest
+
+av = pytest.importorskip("av")
+np = pytest.importorskip("numpy")
+pytest.importorskip("PIL")
+
+import video_detector  # noqa: E402
+from video_detector import iter_sampled_frames  # noqa: E402
+
+FPS = 10
+
+
+@pytest.fixture
+def clip(tmp_path):
+    """A 10 s, 10 fps MPEG-4 video of 64x48 gray frames."""
+    path = str(tmp_path / "clip.mp4")
+    with av.open(path, "w") as container:
+        stream = container.add_stream("mpeg4", rate=FPS)
+        stream.width, stream.height, stream.pix_fmt = 64, 48, "yuv420p"
+        for n in range(10 * FPS):
+            pixels = np.full((48, 64, 3), (n * 2) % 256, dtype=np.uint8)
+            for packet in stream.encode(av.VideoFrame.from_ndarray(pixels, format="rgb24")):
+                container.mux(packet)
+        for packet in stream.encode():
+            container.mux(packet)
+    return path
+
+
+@pytest.fixture
+def every_frame(monkeypatch):
+    # Every frame is a candidate, so the expected times don't depend on
+    # where the encoder put its keyframes
+    monkeypatch.setattr(video_detector, "VIDEO_SAMPLE", "every_n")
+    monkeypatch.setattr(video_detector, "VIDEO_EVERY_N", 1)
+    monkeypatch.setattr(video_detector, "VIDEO_MAX_FRAMES", 5)
+
+
+def test_header_gives_the_length(clip):
+    start_s, duration_s = video_detector._time_span(clip)
+    assert duration_s == pytest.approx(10.0, abs=0.2)
+
+
+def test_frames_are_spread_over_the_whole_video(clip, every_frame):
+    frames = list(iter_sampled_frames(clip))
+    # One frame from each 2 s slot
+    assert [round(time_s) for (time_s, _) in frames] == [0, 2, 4, 6, 8]
+    assert frames[0][1].size == (64, 48)
+
+
+def test_unknown_length_falls_back_to_the_first_frames(clip, every_frame, monkeypatch):
+    monkeypatch.setattr(video_detector, "_time_span", lambda source: None)
+    times = [time_s for (time_s, _) in iter_sampled_frames(clip)]
+    assert times == pytest.approx([0.0, 0.1, 0.2, 0.3, 0.4], abs=0.01)
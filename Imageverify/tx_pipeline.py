@@ -0,0 +1,263 @@
+# file: tx_pipeline.py
+#
+# Concurrent transaction pipeline for a pool of oracle signer accounts.
+#
+# Asking the node for the sequence number before every transaction
+# serializes all submissions of an account (and concurrent requests race
+# on the same number). Instead, every signer keeps its next sequence
+# number locally, so several transactions per account can be in flight at
+# once, and load is spread over all configured signers.
+#
+# When the node rejects a sequence number, or a transaction expires, the
+# local sequence number can no longer be trusted and is re-read from the
+# node ("resync"). The node's number is only right once none of the
+# signer's transactions are in flight, so a resync first waits for them
+# to settle ("drain"); resyncing earlier would hand out numbers that are
+# still in use. Transport errors and 5xx responses don't resync: the
+# transaction may well have reached the node.
+#
+# With a FinalityWatcher (chain_transport.py), waiting for transactions
+# is done by its single polling loop, which confirms all transactions of
+# a signer at once by their sequence numbers.
+#
+import asyncio
+from typing import Callable, Dict, List, Optional, Tuple
+
+from aptos_sdk.account import Account
+from aptos_sdk.async_client import ApiError, RestClient
+from aptos_sdk.transactions import TransactionPayload
+
+from instrumentation import get_logger, span
+
+logger = get_logger("tx_pipeline")
+
+# Submission errors that mean our local sequence number is wrong.
+_SEQUENCE_ERRORS = (
+    "SEQUENCE_NUMBER_TOO_OLD",
+    "SEQUENCE_NUMBER_TOO_NEW",
+    "sequence_number_too_old",
+    "sequence_number_too_new",
+    "INVALID_SEQ_NUMBER",
+)
+
+
+def _is_sequence_error(error: Exception) -> bool:
+    error_string = str(error)
+    return any(marker in error_string for marker in _SEQUENCE_ERRORS)
+
+
+def _is_rejection(error: Exception) -> bool:
+    """True if the node definitely refused the transaction (a 4xx answer)."""
+    return isinstance(error, ApiError) and 400 <= error.status_code < 500
+
+
+def _is_lost(error: Exception) -> bool:
+    """
+    True if waiting failed because the transaction expired or its sequence
+    number went to another transaction. (Not for committed transactions that
+    failed, which used their sequence number normally.)
+    """
+    error_string = str(error)
+    return isinstance(error, TimeoutError) or "timed out" in error_string or "was replaced" in error_string
+
+
+class SignerSlot:
+    """One signer account and its locally tracked sequence number."""
+
+    def __init__(self, account: Account, max_in_flight: int):
+        self.account = account
+        self.max_in_flight = max(1, int(max_in_flight))
+        self.next_sequence_number: Optional[int] = None
+        # Sequence numbers handed out and not settled yet
+        self.pending = set()
+        self._drained = asyncio.Event()
+        self._drained.set()
+        self.in_flight = 0
+        self.submitted = 0
+        self.resyncs = 0
+        self._lock = asyncio.Lock()
+
+    @property
+    def address(self) -> str:
+        return str(self.account.address())
+
+    def invalidate(self):
+        """Forces a resync from the node once the pending transactions settle."""
+        self.next_sequence_number = None
+
+    def settle(self, sequence_number: int):
+        """`sequence_number` is no longer in flight (committed, failed or dropped)."""
+        self.pending.discard(sequence_number)
+        if not self.pending:
+            self._drained.set()
+
+    def unused(self, sequence_number: int):
+        """`sequence_number` never reached the chain: hand it out again."""
+        self.settle(sequence_number)
+        if self.next_sequence_number == sequence_number + 1:
+            self.next_sequence_number = sequence_number
+        else:
+            # Numbers after it are out, and can't commit across the gap
+            self.invalidate()
+
+    async def allocate_sequence_number(self, client: RestClient) -> int:
+        async with self._lock:
+            if self.next_sequence_number is None:
+                # Holding the lock, so nothing new is handed out meanwhile
+                while self.pending:
+                    await self._drained.wait()
+                self.next_sequence_number = await client.account_sequence_number(self.account.address())
+                self.resyncs += 1
+                logger.info("Signer %s: sequence number synced to %d", self.address, self.next_sequence_number)
+            sequence_number = self.next_sequence_number
+            self.next_sequence_number += 1
+            self.pending.add(sequence_number)
+            self._drained.clear()
+            return sequence_number
+
+    def stats(self) -> dict:
+        return {
+            "address": self.address,
+            "next_sequence_number": self.next_sequence_number,
+            "in_flight": self.in_flight,
+            "pending_sequence_numbers": len(self.pending),
+            "max_in_flight": self.max_in_flight,
+            "submitted": self.submitted,
+            "resyncs": self.resyncs,
+        }
+
+
+class TransactionPipeline:
+    """
+    Signs and submits transactions across a pool of signers, with up to
+    `max_in_flight_per_signer` unconfirmed transactions per signer.
+
+    Usage:
+        tx_hash = await pipeline.submit(payload)   # takes an in-flight slot
+        await pipeline.wait(tx_hash)               # frees it again
+    """
+
+    def __init__(self, get_client: Callable[[], RestClient], accounts: List[Account],
+                 max_in_flight_per_signer: int = 8, watcher=None):
+        if not accounts:
+            raise ValueError("TransactionPipeline needs at least one signer account")
+        # The client is looked up on every call, so it can be swapped
+        # (e.g. for a stub) after the pipeline has been created.
+        self._get_client = get_client
+        self.slots = [SignerSlot(account, max_in_flight_per_signer) for account in accounts]
+        # Without a watcher, every wait() polls the node on its own
+        self._watcher = watcher
+        # tx_hash -> (signer slot, sequence number) of our unconfirmed transactions
+        self._tx_slots: Dict[str, Tuple[SignerSlot, int]] = {}
+        self._capacity_changed = None
+
+    def capacity(self) -> int:
+        """How many transactions can be in flight at once in total."""
+        return sum(slot.max_in_flight for slot in self.slots)
+
+    def _condition(self) -> asyncio.Condition:
+        if self._capacity_changed is None:
+            self._capacity_changed = asyncio.Condition()
+        return self._capacity_changed
+
+    async def _acquire_slot(self) -> SignerSlot:
+        condition = self._condition()
+        async with condition:
+            while True:
+                free = [slot for slot in self.slots if slot.in_flight < slot.max_in_flight]
+                if free:
+                    slot = min(free, key=lambda s: s.in_flight)
+                    slot.in_flight += 1
+                    return slot
+                await condition.wait()
+
+    async def _release_slot(self, slot: SignerSlot):
+        condition = self._condition()
+        async with condition:
+            slot.in_flight -= 1
+            condition.notify()
+
+    async def submit(self, payload: TransactionPayload) -> str:
+        """
+        Signs `payload` with the least busy signer using a locally assigned
+        sequence number and submits it. Returns the transaction hash.
+        """
+        client = self._get_client()
+        with span("tx_slot_wait"):
+            slot = await self._acquire_slot()
+        try:
+            for attempt in range(2):
+                sequence_number = await slot.allocate_sequence_number(client)
+                try:
+                    with span("tx_sign"):
+                        signed_tx = await client.create_bcs_signed_transaction(
+                            slot.account, payload, sequence_number=sequence_number
+                        )
+                except BaseException:
+                    slot.unused(sequence_number)
+                    raise
+                try:
+                    with span("tx_submit"):
+                        tx_hash = await client.submit_bcs_transaction(signed_tx)
+                except Exception as e:
+                    if _is_sequence_error(e):
+                        # Our numbering is off: resync once the signer's
+                        # other transactions have settled.
+                        slot.settle(sequence_number)
+                        slot.invalidate()
+                        if attempt == 0:
+                            logger.warning("Signer %s: sequence number %d rejected, resyncing", slot.address, sequence_number)
+                            continue
+                    elif _is_rejection(e):
+                        # Refused (e.g. invalid payload): the number is still free
+                        slot.unused(sequence_number)
+                    else:
+                        # Timeout, connection error or 5xx: the node may have
+                        # it, so keep counting from here. If it didn't, the
+                        # later transactions expire and that resyncs.
+                        slot.settle(sequence_number)
+                    raise
+                except BaseException:
+                    slot.settle(sequence_number)
+                    raise
+                slot.submitted += 1
+                self._tx_slots[tx_hash] = (slot, sequence_number)
+                return tx_hash
+        except BaseException:
+            await self._release_slot(slot)
+            raise
+
+    async def wait(self, tx_hash: str) -> dict:
+        """
+        Waits until `tx_hash` is committed; raises if it failed or expired.
+        Frees the signer's in-flight slot either way. Returns the committed
+        transaction (REST API JSON, with its sender and events).
+        """
+        slot, sequence_number = self._tx_slots.pop(tx_hash, (None, None))
+        try:
+            if self._watcher is not None:
+                tx = await self._watcher.wait(tx_hash, slot.address if slot is not None else None, sequence_number)
+            else:
+                client = self._get_client()
+                await client.wait_for_transaction(tx_hash)
+                tx = await client.transaction_by_hash(tx_hash)
+        except Exception as e:
+            if slot is not None and _is_lost(e):
+                # Expired or replaced: later sequence numbers of this signer
+                # may be stuck behind it, so start again from the node's view
+                # (once the others have settled too).
+                slot.invalidate()
+            raise
+        finally:
+            if slot is not None:
+                slot.settle(sequence_number)
+                await self._release_slot(slot)
+        return tx
+
+    def stats(self) -> dict:
+        return {
+            "signers": len(self.slots),
+            "capacity": self.capacity(),
+            "in_flight": sum(slot.in_flight for slot in self.slots),
+            "per_signer": [slot.stats() for slot in self.slots],
+        }
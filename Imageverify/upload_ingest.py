@@ -0,0 +1,317 @@
+# file: upload_ingest.py
+#
+# Streaming upload ingest.
+#
+# The multipart body is parsed as it arrives from the client. Every file
+# part is SHA-256 hashed chunk by chunk while it streams in and kept in
+# memory; only files bigger than UPLOAD_SPOOL_MAX_MEMORY spill to a
+# uniquely named spool file. The decoders then read from that same buffer,
+# so a file is never written to disk and re-read just to be hashed.
+#
+import hashlib
+import io
+import mimetypes
+import os
+import tarfile
+import tempfile
+import zipfile
+from typing import AsyncIterator, Callable, Iterator, Optional, Union
+
+from fastapi import HTTPException, Request
+from python_multipart.multipart import MultipartParser, parse_options_header
+
+# --- Config ---
+# Uploads up to this many bytes stay in memory.
+UPLOAD_SPOOL_MAX_MEMORY = int(os.getenv("UPLOAD_SPOOL_MAX_MEMORY", str(8 * 1024 * 1024)))
+# Where bigger uploads are spooled (default: the system temp dir).
+UPLOAD_SPOOL_DIR = os.getenv("UPLOAD_SPOOL_DIR") or None
+
+# Chunk size used when copying archive members into their own buffers.
+_ARCHIVE_CHUNK_SIZE = 64 * 1024
+
+_ARCHIVE_CONTENT_TYPES = (
+    "application/zip",
+    "application/x-zip-compressed",
+    "application/x-tar",
+    "application/gzip",
+    "application/x-gzip",
+    "application/x-bzip2",
+    "application/x-xz",
+)
+_ARCHIVE_EXTENSIONS = (".zip", ".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+
+
+class IngestedUpload:
+    """
+    One uploaded file: its metadata, its SHA-256 and its bytes, either in
+    memory or in a spool file on disk.
+    """
+
+    def __init__(self, filename: str, content_type: str,
+                 max_memory: int = UPLOAD_SPOOL_MAX_MEMORY):
+        self.filename = filename
+        self.content_type = content_type or "application/octet-stream"
+        self.size = 0
+        self.max_memory = max_memory
+        # Set by admission control: bigger files are rejected with a 413
+        # while they stream in (and on_too_large is called first).
+        self.max_bytes: Optional[int] = None
+        self.on_too_large: Optional[Callable[[], None]] = None
+
+        self._sha256 = hashlib.sha256()
+        self._buffer = io.BytesIO()
+        self._data: Optional[bytes] = None
+        self._spool = None
+        self.spool_path: Optional[str] = None
+
+    # --- Writing (while the body streams in) ---
+
+    def write(self, chunk: bytes):
+        if not chunk:
+            return
+        self.size += len(chunk)
+        if self.max_bytes is not None and self.size > self.max_bytes:
+            if self.on_too_large is not None:
+                self.on_too_large()
+            raise HTTPException(
+                status_code=413,
+                detail=f"{self.filename} is larger than the {self.max_bytes} byte limit for its type."
+            )
+        self._sha256.update(chunk)
+
+        if self._spool is not None:
+            self._spool.write(chunk)
+            return
+
+        self._buffer.write(chunk)
+        if self.size > self.max_memory:
+            self._spill()
+
+    def _spill(self):
+        # mkstemp gives every request its own file, so two uploads with
+        # the same filename can't collide.
+        fd, self.spool_path = tempfile.mkstemp(prefix="upload_", dir=UPLOAD_SPOOL_DIR)
+        self._spool = os.fdopen(fd, "wb")
+        self._spool.write(self._buffer.getbuffer())
+        self._buffer = None
+
+    def finish(self):
+        """Called once the whole part has been received."""
+        if self._spool is not None:
+            self._spool.close()
+        else:
+            # BytesIO.getvalue() hands over its internal bytes object, and
+            # BytesIO(bytes) shares it, so readers below don't copy it again.
+            self._data = self._buffer.getvalue()
+            self._buffer = None
+
+    # --- Reading (by the hasher's callers and the decoders) ---
+
+    @property
+    def in_memory(self) -> bool:
+        return self.spool_path is None
+
+    def digest(self) -> bytes:
+        return self._sha256.digest()
+
+    def hexdigest(self) -> str:
+        return self._sha256.hexdigest()
+
+    def source(self) -> Union[str, io.BytesIO]:
+        """
+        Something `Image.open` / `librosa.load` can read: a fresh in-memory
+        stream over the buffered bytes, or the spool file's path.
+        """
+        if self.spool_path is not None:
+            return self.spool_path
+        return io.BytesIO(self._data)
+
+    def close(self):
+        """Frees the buffer and removes the spool file, if any."""
+        self._data = None
+        self._buffer = None
+        if self._spool is not None and not self._spool.closed:
+            self._spool.close()
+        if self.spool_path is not None and os.path.exists(self.spool_path):
+            os.remove(self.spool_path)
+
+
+async def iter_uploads(request: Request,
+                       on_part: Optional[Callable[[IngestedUpload], None]] = None
+                       ) -> AsyncIterator[IngestedUpload]:
+    """
+    Parses a multipart/form-data request body as it streams in and yields
+    every file part as soon as it has been fully received.
+
+    `on_part` is called with every file part as soon as its headers are
+    in, before any of its data; it may raise to reject the request.
+    Plain (non-file) form fields are ignored. The caller owns the yielded
+    uploads and must close() them.
+    """
+    content_type, params = parse_options_header(request.headers.get("content-type", ""))
+    boundary = params.get(b"boundary")
+    if content_type != b"multipart/form-data" or not boundary:
+        raise HTTPException(
+            status_code=400,
+            detail="Expected a multipart/form-data upload."
+        )
+
+    state = {
+        "header_field": b"",
+        "header_value": b"",
+        "headers": {},
+        "current": None,
+    }
+    completed = []
+
+    def on_part_begin():
+        state["headers"] = {}
+        state["current"] = None
+
+    def on_header_field(data: bytes, start: int, end: int):
+        state["header_field"] += data[start:end]
+
+    def on_header_value(data: bytes, start: int, end: int):
+        state["header_value"] += data[start:end]
+
+    def on_header_end():
+        state["headers"][state["header_field"].lower()] = state["header_value"]
+        state["header_field"] = b""
+        state["header_value"] = b""
+
+    def on_headers_finished():
+        _, options = parse_options_header(state["headers"].get(b"content-disposition", b""))
+        filename = options.get(b"filename")
+        if filename is None:
+            return  # Not a file field
+        part_type = state["headers"].get(b"content-type", b"").decode("latin-1")
+        state["current"] = IngestedUpload(
+            filename=filename.decode("utf-8", errors="replace"),
+            content_type=part_type,
+        )
+        if on_part is not None:
+            on_part(state["current"])
+
+    def on_part_data(data: bytes, start: int, end: int):
+        if state["current"] is not None:
+            state["current"].write(data[start:end])
+
+    def on_part_end():
+        upload = state["current"]
+        if upload is not None:
+            upload.finish()
+            completed.append(upload)
+            state["current"] = None
+
+    parser = MultipartParser(boundary, callbacks={
+        "on_part_begin": on_part_begin,
+        "on_header_field": on_header_field,
+        "on_header_value": on_header_value,
+        "on_header_end": on_header_end,
+        "on_headers_finished": on_headers_finished,
+        "on_part_data": on_part_data,
+        "on_part_end": on_part_end,
+    })
+
+    try:
+        async for chunk in request.stream():
+            if chunk:
+                parser.write(chunk)
+            while completed:
+                yield completed.pop(0)
+        parser.finalize()
+        while completed:
+            yield completed.pop(0)
+    finally:
+        # Anything not handed to the caller yet is ours to clean up.
+        for upload in completed:
+            upload.close()
+        if state["current"] is not None:
+            state["current"].close()
+
+
+async def receive_upload(request: Request,
+                         on_part: Optional[Callable[[IngestedUpload], None]] = None) -> IngestedUpload:
+    """
+    Streams in a single-file upload (the first file part of the form).
+    Any further file parts are drained and discarded. See iter_uploads
+    for `on_part`.
+    """
+    upload = None
+    try:
+        async for part in iter_uploads(request, on_part):
+            if upload is None:
+                upload = part
+            else:
+                part.close()
+    except Exception:
+        if upload is not None:
+            upload.close()
+        raise
+
+    if upload is None:
+        raise HTTPException(status_code=400, detail="No file was uploaded.")
+    return upload
+
+
+# --- Archives (zip / tar) ---
+
+def is_archive(upload: IngestedUpload) -> bool:
+    """True if the upload looks like a zip or tar archive of files to verify."""
+    if upload.content_type.split(";")[0].strip().lower() in _ARCHIVE_CONTENT_TYPES:
+        return True
+    return upload.filename.lower().endswith(_ARCHIVE_EXTENSIONS)
+
+
+def _member_upload(name: str, stream, on_member=None) -> IngestedUpload:
+    content_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+    member = IngestedUpload(filename=name, content_type=content_type)
+    try:
+        if on_member is not None:
+            on_member(member)
+        for chunk in iter(lambda: stream.read(_ARCHIVE_CHUNK_SIZE), b""):
+            member.write(chunk)
+        member.finish()
+    except Exception:
+        member.close()
+        raise
+    return member
+
+
+def iter_archive_members(upload: IngestedUpload,
+                         on_member: Optional[Callable[[IngestedUpload], None]] = None
+                         ) -> Iterator[IngestedUpload]:
+    """
+    Yields every regular file inside a zip or tar archive upload as its own
+    IngestedUpload (hashed, in memory or spooled like any other upload).
+    `on_member` is called with each member before it is read, like
+    iter_uploads' `on_part`.
+
+    Members are read one at a time, so the archive is never unpacked as a
+    whole; tar archives are even read strictly front to back. This is
+    blocking I/O: call it from a worker thread. The caller must close()
+    the yielded uploads.
+    """
+    source = upload.source()
+    if zipfile.is_zipfile(source):
+        if not isinstance(source, str):
+            source.seek(0)
+        with zipfile.ZipFile(source) as archive:
+            for info in archive.infolist():
+                if info.is_dir():
+                    continue
+                with archive.open(info) as stream:
+                    yield _member_upload(info.filename, stream, on_member)
+        return
+
+    if isinstance(source, str):
+        archive = tarfile.open(name=source, mode="r|*")
+    else:
+        source.seek(0)
+        archive = tarfile.open(fileobj=source, mode="r|*")
+    with archive:
+        for info in archive:
+            if not info.isfile():
+                continue
+            stream = archive.extractfile(info)
+            yield _member_upload(info.name, stream, on_member)
@@ -0,0 +1,220 @@
+# file: verdict_cache.py
+#
+# Cache of finished verdicts, keyed on the SHA-256 of the uploaded file.
+#
+# Two tiers:
+#   1. An in-memory LRU with size and TTL eviction (per process).
+#   2. An optional SQLite file that survives restarts and can be shared
+#      by several uvicorn workers on the same machine.
+#
+# Concurrent uploads of the same hash are coalesced onto ONE computation.
+#
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from singleflight import SingleFlight
+from instrumentation import get_logger
+
+logger = get_logger("verdict_cache")
+
+# --- Config ---
+VERDICT_CACHE_SIZE = int(os.getenv("VERDICT_CACHE_SIZE", "10000"))
+# Seconds a verdict stays valid (0 = forever). On-chain verdicts never
+# change, so this mostly exists to bound memory of rarely-seen hashes.
+VERDICT_CACHE_TTL_S = float(os.getenv("VERDICT_CACHE_TTL_S", "86400"))
+# Path of the persistent tier. Empty string disables it.
+VERDICT_CACHE_DB = os.getenv("VERDICT_CACHE_DB", "")
+
+
+class VerdictCache:
+    """
+    Two-tier verdict cache with single-flight computation.
+
+    Values must be JSON-serializable (they are stored as JSON on disk).
+    """
+
+    def __init__(self, max_entries: int = 10000, ttl_s: float = 0,
+                 db_path: Optional[str] = None):
+        self.max_entries = max(1, int(max_entries))
+        self.ttl_s = float(ttl_s)
+        self.db_path = db_path or None
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._flight = SingleFlight()
+        self._db = None
+        self._db_lock = threading.Lock()
+
+        # --- Stats ---
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+        if self.db_path:
+            self._open_db()
+
+    # --- Persistent tier ---
+
+    def _open_db(self):
+        self._db = sqlite3.connect(self.db_path, timeout=10, check_same_thread=False)
+        # WAL lets several worker processes read while one writes.
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS verdict_cache ("
+            " content_hash TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " created_at REAL NOT NULL)"
+        )
+        self._db.commit()
+        logger.info("Verdict cache: persistent tier at %s", self.db_path)
+
+    def _disk_get(self, key: str) -> Optional[Any]:
+        with self._db_lock:
+            row = self._db.execute(
+                "SELECT value, created_at FROM verdict_cache WHERE content_hash = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            value, created_at = row
+            if self.ttl_s and time.time() - created_at > self.ttl_s:
+                self._db.execute("DELETE FROM verdict_cache WHERE content_hash = ?", (key,))
+                self._db.commit()
+                return None
+            return json.loads(value)
+
+    def _disk_put(self, key: str, value: Any):
+        with self._db_lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO verdict_cache (content_hash, value, created_at) VALUES (?, ?, ?)",
+                (key, json.dumps(value), time.time()),
+            )
+            self._db.commit()
+
+    # --- Memory tier ---
+
+    def _memory_get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at and time.monotonic() > expires_at:
+                del self._memory[key]
+                self.expirations += 1
+                return None
+            self._memory.move_to_end(key)
+            return value
+
+    def _memory_put(self, key: str, value: Any):
+        expires_at = time.monotonic() + self.ttl_s if self.ttl_s else 0
+        with self._lock:
+            self._memory[key] = (value, expires_at)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_entries:
+                self._memory.popitem(last=False)
+                self.evictions += 1
+
+    # --- Public API ---
+
+    def get(self, key: str) -> Tuple[Optional[Any], Optional[str]]:
+        """Returns (value, tier) or (None, None). Blocking on the disk tier."""
+        value = self._memory_get(key)
+        if value is not None:
+            self.hits_memory += 1
+            return value, "memory"
+        if self._db is not None:
+            value = self._disk_get(key)
+            if value is not None:
+                self.hits_disk += 1
+                # Promote to memory so the next lookup doesn't touch disk
+                self._memory_put(key, value)
+                return value, "disk"
+        self.misses += 1
+        return None, None
+
+    def peek_many(self, keys: List[str]) -> Dict[str, Any]:
+        """
+        {key: value} for the keys that are cached. Blocking on the disk
+        tier. Not counted as hits / misses: this is the upload precheck
+        of /lookup-hashes, and its misses are followed by an upload.
+        """
+        found = {}
+        for key in keys:
+            value = self._memory_get(key)
+            if value is None and self._db is not None:
+                value = self._disk_get(key)
+            if value is not None:
+                found[key] = value
+        return found
+
+    def put(self, key: str, value: Any):
+        """Stores a value in both tiers. Blocking on the disk tier."""
+        self._memory_put(key, value)
+        if self._db is not None:
+            self._disk_put(key, value)
+
+    async def get_or_compute(self, key: str, compute: Callable[[], Awaitable[Any]]) -> Tuple[Any, str]:
+        """
+        Returns (value, source) where source is "memory", "disk",
+        "computed" or "coalesced".
+
+        Only successful results are cached; if `compute` raises, every
+        coalesced caller gets the same exception.
+        """
+        value = self._memory_get(key)
+        if value is not None:
+            self.hits_memory += 1
+            return value, "memory"
+
+        async def load_or_compute():
+            if self._db is not None:
+                cached = await asyncio.to_thread(self._disk_get, key)
+                if cached is not None:
+                    self.hits_disk += 1
+                    self._memory_put(key, cached)
+                    return cached, "disk"
+            self.misses += 1
+            computed = await compute()
+            self._memory_put(key, computed)
+            if self._db is not None:
+                await asyncio.to_thread(self._disk_put, key, computed)
+            return computed, "computed"
+
+        (value, source), shared = await self._flight.do(key, load_or_compute)
+        return value, ("coalesced" if shared else source)
+
+    def stats(self) -> dict:
+        with self._lock:
+            size = len(self._memory)
+        lookups = self.hits_memory + self.hits_disk + self.misses
+        return {
+            "entries": size,
+            "max_entries": self.max_entries,
+            "ttl_s": self.ttl_s,
+            "persistent": self._db is not None,
+            "hits_memory": self.hits_memory,
+            "hits_disk": self.hits_disk,
+            "misses": self.misses,
+            "coalesced": self._flight.coalesced,
+            "in_flight": self._flight.in_flight(),
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": ((self.hits_memory + self.hits_disk) / lookups) if lookups else 0.0,
+        }
+
+
+# --- Global cache (Initialized once) ---
+VERDICT_CACHE = VerdictCache(
+    max_entries=VERDICT_CACHE_SIZE,
+    ttl_s=VERDICT_CACHE_TTL_S,
+    db_path=VERDICT_CACHE_DB,
+)
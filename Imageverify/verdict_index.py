@@ -0,0 +1,456 @@
+# file: verdict_index.py
+#
+# Local read replica of the on-chain verdicts, so /check-hash can answer
+# from a SQLite lookup instead of a view call to the full node.
+#
+# The index is filled from two sides:
+#   1. The submission queue adds our own verdicts once they are final.
+#   2. A background follower tails the transactions of the oracle signer
+#      accounts (and any extra addresses configured) and indexes every
+#      successful register_verdict / register_verdicts_batch call.
+#
+# Both index what the chain stored, not what was sent: a batch skips
+# hashes that already have a verdict, so its VerdictRegistered events are
+# used, and hashes without one are read back with get_verdict.
+#
+# On a miss, /check-hash can fall through to the chain; hashes the chain
+# doesn't know are remembered for a while (negative caching). Concurrent
+# chain lookups of the same hash share one view call.
+#
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+import aptos_service
+from instrumentation import get_logger
+from singleflight import SingleFlight
+
+logger = get_logger("verdict_index")
+
+# --- Config ---
+VERDICT_INDEX_DB = os.getenv("VERDICT_INDEX_DB", "verdict_index.db")
+# Tail the signers' transactions in the background (1) or not (0).
+VERDICT_INDEX_FOLLOW = os.getenv("VERDICT_INDEX_FOLLOW", "1") == "1"
+VERDICT_INDEX_POLL_S = float(os.getenv("VERDICT_INDEX_POLL_S", "10"))
+# Extra (comma-separated) sender addresses to follow, e.g. other oracles.
+VERDICT_INDEX_FOLLOW_ADDRESSES = [
+    address.strip() for address in os.getenv("VERDICT_INDEX_FOLLOW_ADDRESSES", "").split(",")
+    if address.strip()
+]
+# Ask the chain when the index doesn't know a hash (1) or answer 404 (0).
+CHECK_HASH_CHAIN_FALLBACK = os.getenv("CHECK_HASH_CHAIN_FALLBACK", "1") == "1"
+# How long a "not on chain" answer is remembered, in seconds.
+CHECK_HASH_NEGATIVE_TTL_S = float(os.getenv("CHECK_HASH_NEGATIVE_TTL_S", "60"))
+# View calls to the chain at once, over all lookups of this process.
+CHECK_HASH_CHAIN_CONCURRENCY = int(os.getenv("CHECK_HASH_CHAIN_CONCURRENCY", "16"))
+
+_FOLLOW_PAGE_SIZE = 100
+
+
+class VerdictIndex:
+    """SQLite table of verdicts keyed by image hash, plus a miss cache."""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(db_path, timeout=10, check_same_thread=False)
+        self._db.row_factory = sqlite3.Row
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS verdicts ("
+            " image_hash TEXT PRIMARY KEY,"
+            " is_fake INTEGER NOT NULL,"
+            " confidence INTEGER NOT NULL,"
+            " verified_by TEXT,"
+            " verified_at INTEGER,"
+            " tx_hash TEXT,"
+            " source TEXT NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS misses ("
+            " image_hash TEXT PRIMARY KEY,"
+            " checked_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS follower_cursor ("
+            " address TEXT PRIMARY KEY,"
+            " next_sequence_number INTEGER NOT NULL)"
+        )
+        self._db.commit()
+
+        # --- Stats ---
+        self.hits = 0
+        self.misses = 0
+        self.negative_hits = 0
+
+    def get(self, image_hash_hex: str) -> Optional[dict]:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT * FROM verdicts WHERE image_hash = ?", (image_hash_hex,)
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return self._result(row)
+
+    def get_many(self, image_hashes: List[str]) -> Dict[str, dict]:
+        """{image_hash_hex: verdict} for the hashes that are indexed, in one query."""
+        if not image_hashes:
+            return {}
+        placeholders = ",".join("?" * len(image_hashes))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT * FROM verdicts WHERE image_hash IN ({placeholders})", list(image_hashes)
+            ).fetchall()
+        found = {row["image_hash"]: self._result(row) for row in rows}
+        self.hits += len(found)
+        self.misses += len(image_hashes) - len(found)
+        return found
+
+    @staticmethod
+    def _result(row: sqlite3.Row) -> dict:
+        return {
+            "found": True,
+            "is_deepfake": bool(row["is_fake"]),
+            "confidence": row["confidence"],
+            "verified_by": row["verified_by"],
+            "verified_at": aptos_service.format_verified_at(row["verified_at"]) if row["verified_at"] else None,
+            "transaction_hash": row["tx_hash"],
+        }
+
+    def put_many(self, entries: List[tuple], source: str, replace: bool = False):
+        """
+        Adds (image_hash_hex, is_fake, confidence, verified_by, verified_at,
+        tx_hash) entries. The first verdict for a hash wins, as on chain,
+        unless `replace` is set (used for answers read back from the chain).
+        """
+        verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+        with self._lock:
+            self._db.executemany(
+                f"{verb} INTO verdicts (image_hash, is_fake, confidence, verified_by,"
+                " verified_at, tx_hash, source) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(h, int(f), int(c), by, at, tx, source) for (h, f, c, by, at, tx) in entries],
+            )
+            self._db.executemany(
+                "DELETE FROM misses WHERE image_hash = ?", [(entry[0],) for entry in entries]
+            )
+            self._db.commit()
+
+    def put(self, image_hash_hex: str, is_fake: bool, confidence: int,
+            verified_by: Optional[str], verified_at: Optional[int],
+            tx_hash: Optional[str], source: str, replace: bool = False):
+        self.put_many([(image_hash_hex, is_fake, confidence, verified_by, verified_at, tx_hash)],
+                      source, replace=replace)
+
+    def record_miss(self, image_hash_hex: str):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO misses (image_hash, checked_at) VALUES (?, ?)",
+                (image_hash_hex, time.time()),
+            )
+            self._db.commit()
+
+    def known_misses(self, image_hashes: List[str]) -> set:
+        """The hashes the chain said "not found" for less than the negative TTL ago."""
+        if not image_hashes:
+            return set()
+        placeholders = ",".join("?" * len(image_hashes))
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT image_hash FROM misses WHERE image_hash IN ({placeholders}) AND checked_at >= ?",
+                list(image_hashes) + [time.time() - CHECK_HASH_NEGATIVE_TTL_S],
+            ).fetchall()
+        self.negative_hits += len(rows)
+        return {row["image_hash"] for row in rows}
+
+    def is_known_miss(self, image_hash_hex: str) -> bool:
+        """True if the chain said "not found" less than the negative TTL ago."""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT checked_at FROM misses WHERE image_hash = ?", (image_hash_hex,)
+            ).fetchone()
+        if row is None or time.time() - row["checked_at"] > CHECK_HASH_NEGATIVE_TTL_S:
+            return False
+        self.negative_hits += 1
+        return True
+
+    def get_cursor(self, address: str) -> int:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT next_sequence_number FROM follower_cursor WHERE address = ?", (address,)
+            ).fetchone()
+        return row["next_sequence_number"] if row else 0
+
+    def set_cursor(self, address: str, next_sequence_number: int):
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO follower_cursor (address, next_sequence_number) VALUES (?, ?)",
+                (address, next_sequence_number),
+            )
+            self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            (entries,) = self._db.execute("SELECT COUNT(*) FROM verdicts").fetchone()
+        return {
+            "entries": entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "negative_hits": self.negative_hits,
+            "chain_fallback": CHECK_HASH_CHAIN_FALLBACK,
+            "chain_lookups": _chain_flight.started,
+            "chain_lookups_coalesced": _chain_flight.coalesced,
+        }
+
+
+def _hex_to_bytes(value: str) -> bytes:
+    return bytes.fromhex(value[2:] if value.startswith("0x") else value)
+
+
+def verdicts_from_transaction(tx: dict) -> Tuple[List[tuple], List[str]]:
+    """
+    Extracts index entries from one committed transaction (REST API JSON).
+    Returns (entries, unresolved): the verdicts the transaction is known to
+    have stored, and the hashes it was called with whose stored verdict is
+    unknown. Both are empty if it isn't a successful verdict registration.
+
+    register_verdicts_batch skips hashes that already have a verdict, so
+    its arguments are not the chain's record. The module emits a
+    VerdictRegistered event for every verdict it actually stores; batch
+    hashes without one (skipped, or sent to an older module without
+    events) are returned as unresolved, to be read back from the chain.
+    """
+    payload = tx.get("payload") or {}
+    function = payload.get("function", "")
+    module_prefix = f"{aptos_service.MODULE_ADDRESS_STR}::image_verifier::"
+    if not tx.get("success") or not function.startswith(module_prefix):
+        return [], []
+
+    tx_hash = tx.get("hash")
+    entries = [
+        (_hex_to_bytes(data["image_hash"]).hex(), bool(data["is_deepfake"]),
+         int(data["confidence_score"]), data["verified_by"], int(data["verified_at"]), tx_hash)
+        for data in (event.get("data") or {} for event in tx.get("events") or []
+                     if event.get("type") == module_prefix + "VerdictRegistered")
+    ]
+    args = payload.get("arguments", [])
+
+    if function.endswith("::register_verdict"):
+        if entries:
+            return entries, []
+        # register_verdict aborts instead of skipping, so a successful call
+        # stored exactly its arguments (at the block's timestamp, in
+        # microseconds here)
+        image_hash, is_fake, confidence = args
+        return [(_hex_to_bytes(image_hash).hex(), bool(is_fake), int(confidence),
+                 tx.get("sender"), int(tx.get("timestamp", 0)) // 1_000_000, tx_hash)], []
+
+    if function.endswith("::register_verdicts_batch"):
+        stored = {entry[0] for entry in entries}
+        unresolved = [
+            _hex_to_bytes(image_hash).hex() for image_hash in args[0]
+            if _hex_to_bytes(image_hash).hex() not in stored
+        ]
+        return entries, unresolved
+
+    return [], []
+
+
+async def _read_back(index: "VerdictIndex", image_hashes: List[str], tx: dict):
+    """Indexes the chain's verdicts for `image_hashes`, as read with get_verdict."""
+    # The transaction stored a verdict if it carries its sender and block time
+    verified_at = int(tx.get("timestamp", 0)) // 1_000_000
+
+    async def read(image_hash_hex: str):
+        async with _chain_semaphore():
+            result = await aptos_service.get_verdict_from_chain(image_hash_hex)
+        if not result["found"]:
+            # Can't happen after a committed registration; leave it unindexed
+            logger.warning("Verdict index: %s not found on chain after %s", image_hash_hex, tx.get("hash"))
+            return
+        stored_here = result["verified_by"] == tx.get("sender") and result["verified_at_unix"] == verified_at
+        await asyncio.to_thread(
+            index.put, image_hash_hex, result["is_deepfake"], result["confidence"],
+            result["verified_by"], result["verified_at_unix"],
+            tx.get("hash") if stored_here else None, "chain", True,
+        )
+
+    await asyncio.gather(*(read(image_hash_hex) for image_hash_hex in image_hashes))
+
+
+async def index_transaction(index: "VerdictIndex", tx: dict, source: str) -> int:
+    """
+    Indexes the verdicts one committed transaction stored on chain.
+    Returns how many hashes were indexed.
+    """
+    entries, unresolved = verdicts_from_transaction(tx)
+    if entries:
+        await asyncio.to_thread(index.put_many, entries, source)
+    if unresolved:
+        await _read_back(index, unresolved, tx)
+    return len(entries) + len(unresolved)
+
+
+class ChainFollower:
+    """Keeps the index in sync by tailing the followed accounts' transactions."""
+
+    def __init__(self, index: VerdictIndex, addresses: List[str]):
+        self.index = index
+        self.addresses = addresses
+        self._task = None
+        self.transactions_seen = 0
+        self.verdicts_indexed = 0
+        self.errors = 0
+
+    async def _fetch_page(self, address: str, start: int) -> list:
+        client = aptos_service.get_client()
+        response = await client.client.get(
+            f"{client.base_url}/accounts/{address}/transactions",
+            params={"start": start, "limit": _FOLLOW_PAGE_SIZE},
+        )
+        if response.status_code == 404:
+            return []  # Account doesn't exist (yet)
+        response.raise_for_status()
+        return response.json()
+
+    async def sync_address(self, address: str):
+        """Indexes every transaction of `address` since the saved cursor."""
+        start = await asyncio.to_thread(self.index.get_cursor, address)
+        while True:
+            transactions = await self._fetch_page(address, start)
+            if not transactions:
+                return
+            for tx in transactions:
+                self.verdicts_indexed += await index_transaction(self.index, tx, "follower")
+            self.transactions_seen += len(transactions)
+
+            start = int(transactions[-1]["sequence_number"]) + 1
+            await asyncio.to_thread(self.index.set_cursor, address, start)
+            if len(transactions) < _FOLLOW_PAGE_SIZE:
+                return
+
+    async def _run(self):
+        while True:
+            for address in self.addresses:
+                try:
+                    await self.sync_address(address)
+                except Exception as e:
+                    self.errors += 1
+                    logger.warning("Verdict index follower: error syncing %s: %s", address, e)
+            await asyncio.sleep(VERDICT_INDEX_POLL_S)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._run(), name="verdict-index-follower")
+            logger.info("Verdict index follower started for %d address(es)", len(self.addresses))
+
+    async def stop(self):
+        task, self._task = self._task, None
+        if task is not None:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "running": self._task is not None,
+            "addresses": self.addresses,
+            "transactions_seen": self.transactions_seen,
+            "verdicts_indexed": self.verdicts_indexed,
+            "errors": self.errors,
+        }
+
+
+# Concurrent chain lookups of one hash share a view call, and at most
+# CHECK_HASH_CHAIN_CONCURRENCY view calls run at once
+_chain_flight = SingleFlight()
+_chain_slots = None
+
+
+def _chain_semaphore() -> asyncio.Semaphore:
+    # Created on first use, inside the event loop that serves the lookups
+    global _chain_slots
+    if _chain_slots is None:
+        _chain_slots = asyncio.Semaphore(max(1, CHECK_HASH_CHAIN_CONCURRENCY))
+    return _chain_slots
+
+
+async def _lookup_on_chain(image_hash_hex: str) -> dict:
+    """The chain's answer for one hash, remembered in the index (or as a miss)."""
+    async def fetch():
+        async with _chain_semaphore():
+            result = await aptos_service.get_verdict_from_chain(image_hash_hex)
+        if result["found"]:
+            # The raw timestamp is for the index only; /check-hash answers
+            # keep the shape they always had
+            verified_at = result.pop("verified_at_unix")
+            await asyncio.to_thread(
+                VERDICT_INDEX.put, image_hash_hex, result["is_deepfake"], result["confidence"],
+                result["verified_by"], verified_at, None, "chain", True,
+            )
+        else:
+            await asyncio.to_thread(VERDICT_INDEX.record_miss, image_hash_hex)
+        result["source"] = "chain"
+        return result
+
+    result, _ = await _chain_flight.do(image_hash_hex, fetch)
+    # Coalesced callers each get their own copy
+    return dict(result)
+
+
+async def lookup_verdict(image_hash_hex: str) -> dict:
+    """
+    Answers a /check-hash lookup: index first, then (optionally) the chain.
+    Returns {"found": False} for unknown hashes.
+    """
+    image_hash_hex = image_hash_hex.lower()
+    result = await asyncio.to_thread(VERDICT_INDEX.get, image_hash_hex)
+    if result is not None:
+        result["source"] = "index"
+        return result
+
+    if not CHECK_HASH_CHAIN_FALLBACK:
+        return {"found": False}
+    if await asyncio.to_thread(VERDICT_INDEX.is_known_miss, image_hash_hex):
+        return {"found": False}
+
+    return await _lookup_on_chain(image_hash_hex)
+
+
+async def lookup_verdicts(image_hashes: List[str]) -> Dict[str, dict]:
+    """
+    lookup_verdict() for many hashes at once: one index query for all of
+    them, then concurrent chain lookups for the misses. A hash whose chain
+    lookup failed gets {"found": False, "error": ...}.
+    """
+    image_hashes = list(dict.fromkeys(h.lower() for h in image_hashes))
+    results = await asyncio.to_thread(VERDICT_INDEX.get_many, image_hashes)
+    for result in results.values():
+        result["source"] = "index"
+
+    missing = [h for h in image_hashes if h not in results]
+    if missing and CHECK_HASH_CHAIN_FALLBACK:
+        known_misses = await asyncio.to_thread(VERDICT_INDEX.known_misses, missing)
+        missing = [h for h in missing if h not in known_misses]
+        answers = await asyncio.gather(
+            *(_lookup_on_chain(h) for h in missing), return_exceptions=True
+        )
+        for image_hash_hex, answer in zip(missing, answers):
+            if isinstance(answer, Exception):
+                logger.warning("Chain lookup of %s failed: %s", image_hash_hex, answer)
+                answer = {"found": False, "error": "The chain lookup failed."}
+            results[image_hash_hex] = answer
+
+    return {h: results.get(h, {"found": False}) for h in image_hashes}
+
+
+# --- Global index and follower (Initialized once) ---
+VERDICT_INDEX = VerdictIndex(VERDICT_INDEX_DB)
+CHAIN_FOLLOWER = ChainFollower(
+    VERDICT_INDEX,
+    [str(account.address()) for account in aptos_service.ORACLE_ACCOUNTS] + VERDICT_INDEX_FOLLOW_ADDRESSES,
+)
@@ -0,0 +1,289 @@
+# file: video_detector.py
+#
+# Video deepfake verification.
+#
+# The container is demuxed and decoded as a stream (PyAV), so a video is
+# never loaded into memory as a whole. Only sampled frames are scored:
+#   - "keyframes": the decoder skips every non-key frame, so decoding
+#                  cost scales with the number of keyframes
+#   - "every_n":   every VIDEO_EVERY_N-th decoded frame
+# Sampled frames (optionally cropped to the largest face) go through the
+# image model via the shared image batcher, and their fake scores are
+# averaged into one verdict. Scoring stops early once that is decisive.
+#
+# The audio track is scored separately by the audio detector (see
+# inference_executor.run_video_detection, which runs both in parallel)
+# and combined with the frames by combine_verdicts().
+#
+import os
+import threading
+from typing import Iterator, Optional, Tuple
+
+import av
+import numpy as np
+from PIL import Image
+
+from instrumentation import get_logger, span
+
+logger = get_logger("video_detector")
+
+# --- Config ---
+# "keyframes" or "every_n"
+VIDEO_SAMPLE = os.getenv("VIDEO_SAMPLE", "keyframes")
+VIDEO_EVERY_N = int(os.getenv("VIDEO_EVERY_N", "30"))
+# Never score more than this many frames of one video. They are spread
+# evenly over its whole length.
+VIDEO_MAX_FRAMES = int(os.getenv("VIDEO_MAX_FRAMES", "64"))
+# Frames scored between two early-exit checks.
+VIDEO_FRAME_BATCH = int(os.getenv("VIDEO_FRAME_BATCH", "8"))
+# Crop frames to the largest detected face (needs opencv-python).
+VIDEO_FACE_CROP = os.getenv("VIDEO_FACE_CROP", "0") == "1"
+# Early exit: stop once at least VIDEO_EARLY_EXIT_MIN_FRAMES frames are
+# scored and their mean fake score is beyond VIDEO_EARLY_EXIT_CONFIDENCE
+# (or below 1 - it).
+VIDEO_EARLY_EXIT = os.getenv("VIDEO_EARLY_EXIT", "1") == "1"
+VIDEO_EARLY_EXIT_MIN_FRAMES = int(os.getenv("VIDEO_EARLY_EXIT_MIN_FRAMES", "8"))
+VIDEO_EARLY_EXIT_CONFIDENCE = float(os.getenv("VIDEO_EARLY_EXIT_CONFIDENCE", "0.9"))
+
+# Extra space kept around a detected face, as a share of its size
+_FACE_MARGIN = 0.3
+
+_face_cascade = None
+_face_cascade_lock = threading.Lock()
+
+
+def _get_face_cascade():
+    """OpenCV's frontal face detector, or None if OpenCV isn't installed."""
+    global _face_cascade
+    with _face_cascade_lock:
+        if _face_cascade is None:
+            try:
+                import cv2
+            except ImportError:
+                logger.warning("VIDEO_FACE_CROP needs opencv-python; using whole frames")
+                _face_cascade = False
+            else:
+                _face_cascade = cv2.CascadeClassifier(
+                    cv2.data.haarcascades + "haarcascade_frontalface_default.xml"
+                )
+    return _face_cascade or None
+
+
+def crop_to_face(img: Image.Image) -> Image.Image:
+    """The largest face in `img` (with some margin), or `img` if none is found."""
+    cascade = _get_face_cascade()
+    if cascade is None:
+        return img
+    gray = np.asarray(img.convert("L"))
+    faces = cascade.detectMultiScale(gray, scaleFactor=1.1, minNeighbors=5, minSize=(48, 48))
+    if len(faces) == 0:
+        return img
+    x, y, w, h = max(faces, key=lambda face: face[2] * face[3])
+    margin_x, margin_y = int(w * _FACE_MARGIN), int(h * _FACE_MARGIN)
+    return img.crop((
+        max(0, x - margin_x),
+        max(0, y - margin_y),
+        min(img.width, x + w + margin_x),
+        min(img.height, y + h + margin_y),
+    ))
+
+
+def _rewind(source):
+    if hasattr(source, "seek"):
+        source.seek(0)
+
+
+def _time_span(source) -> Optional[Tuple[float, float]]:
+    """
+    (start_s, duration_s) of a video's first video track: from the stream
+    or container header, else from the timestamps of its packets (demuxed,
+    not decoded). None if neither gives a length.
+    """
+    with av.open(source) as container:
+        if not container.streams.video:
+            return None
+        stream = container.streams.video[0]
+        start_s = float(stream.start_time * stream.time_base) if stream.start_time is not None else 0.0
+        if stream.duration and stream.time_base:
+            return (start_s, float(stream.duration * stream.time_base))
+        if container.duration:
+            return (start_s, container.duration / av.time_base)
+        # No length in the header (e.g. some live-recorded WebM): one pass
+        # over the packets, which costs reading the file but no decoding
+        last_s = None
+        for packet in container.demux(stream):
+            if packet.pts is not None:
+                end_s = float((packet.pts + (packet.duration or 0)) * stream.time_base)
+                last_s = end_s if last_s is None else max(last_s, end_s)
+        if last_s is None or last_s <= start_s:
+            return None
+        return (start_s, last_s - start_s)
+
+
+def iter_sampled_frames(source) -> Iterator[Tuple[float, Image.Image]]:
+    """
+    Yields (time_s, frame) for the sampled frames of a video, streaming.
+
+    At most VIDEO_MAX_FRAMES frames, spread over the whole video: the
+    length is cut into that many equal slots and the first sampled frame
+    (keyframe, or every VIDEO_EVERY_N-th) in each slot is yielded.
+    """
+    span_s = _time_span(source)
+    _rewind(source)
+    with av.open(source) as container:
+        if not container.streams.video:
+            raise ValueError("The file has no video track.")
+        stream = container.streams.video[0]
+        stream.thread_type = "AUTO"
+        if VIDEO_SAMPLE == "keyframes":
+            # The decoder drops everything but keyframes
+            stream.codec_context.skip_frame = "NONKEY"
+
+        if span_s is None:
+            # Unknown length: the first VIDEO_MAX_FRAMES sampled frames
+            logger.warning("Video length unknown; scoring its first %d sampled frames", VIDEO_MAX_FRAMES)
+            start_s, interval_s = 0.0, 0.0
+        else:
+            start_s, interval_s = span_s[0], span_s[1] / max(1, VIDEO_MAX_FRAMES)
+        next_due_s = start_s
+
+        sampled = 0
+        for index, frame in enumerate(container.decode(stream)):
+            if VIDEO_SAMPLE != "keyframes" and index % max(1, VIDEO_EVERY_N):
+                continue
+            time_s = float(frame.time or 0.0)
+            if time_s < next_due_s:
+                continue  # This slot already has its frame
+            yield (time_s, frame.to_image())
+            sampled += 1
+            if sampled >= VIDEO_MAX_FRAMES:
+                return
+            if interval_s:
+                # The start of the slot after the one this frame is in
+                next_due_s = start_s + interval_s * (int((time_s - start_s) / interval_s) + 1)
+
+
+def analyze_video_frames(source) -> dict:
+    """
+    Scores the sampled frames of a video (path or binary file-like).
+
+    Returns a dict with is_fake / confidence (from the mean fake score of
+    the scored frames), frames (one {"time_s", "fake_score"} each) and
+    early_exit.
+    """
+    from ai_detector import submit_image
+
+    frames = []
+    score_total = 0.0
+    early_exit = False
+    pending = []
+
+    def collect():
+        nonlocal score_total
+        with span("video_frames_batch"):
+            for time_s, future in pending:
+                is_fake, confidence = future.result()
+                fake_score = confidence / 100.0 if is_fake else 1.0 - confidence / 100.0
+                score_total += fake_score
+                frames.append({"time_s": round(time_s, 3), "fake_score": round(fake_score, 4)})
+        pending.clear()
+
+    def decided() -> bool:
+        if not VIDEO_EARLY_EXIT or len(frames) < VIDEO_EARLY_EXIT_MIN_FRAMES:
+            return False
+        mean = score_total / len(frames)
+        return mean >= VIDEO_EARLY_EXIT_CONFIDENCE or mean <= 1.0 - VIDEO_EARLY_EXIT_CONFIDENCE
+
+    with span("video_analyze"):
+        sampled = iter_sampled_frames(source)
+        try:
+            for time_s, img in sampled:
+                if VIDEO_FACE_CROP:
+                    img = crop_to_face(img)
+                # Queued right away: frames are batched together (and with
+                # concurrent image requests) by the image batcher
+                pending.append((time_s, submit_image(img)))
+                if len(pending) >= VIDEO_FRAME_BATCH:
+                    collect()
+                    if decided():
+                        early_exit = True
+                        break
+            if pending:
+                collect()
+        finally:
+            sampled.close()
+
+    if not frames:
+        raise ValueError("No video frames could be decoded.")
+
+    fake_score = score_total / len(frames)
+    is_fake = fake_score >= 0.5
+    confidence = fake_score if is_fake else 1.0 - fake_score
+    return {
+        "is_fake": is_fake,
+        "confidence": int(confidence * 100),
+        "frames": frames,
+        "early_exit": early_exit,
+    }
+
+
+def iter_audio_track_blocks(source) -> Iterator[np.ndarray]:
+    """
+    Yields a video's audio track as 16 kHz mono float32 blocks (nothing
+    if it has no audio), streaming.
+    """
+    from audio_detector import AUDIO_SAMPLE_RATE
+
+    with av.open(source) as container:
+        if not container.streams.audio:
+            return
+        stream = container.streams.audio[0]
+        resampler = av.AudioResampler(format="flt", layout="mono", rate=AUDIO_SAMPLE_RATE)
+        for frame in container.decode(stream):
+            for resampled in resampler.resample(frame):
+                yield resampled.to_ndarray().reshape(-1)
+        # Flush the resampler
+        for resampled in resampler.resample(None):
+            yield resampled.to_ndarray().reshape(-1)
+
+
+def analyze_video_audio(source) -> Optional[dict]:
+    """The audio detector's analysis of a video's audio track, or None if it has none."""
+    from audio_detector import analyze_audio_stream
+
+    with av.open(source) as container:
+        has_audio = bool(container.streams.audio)
+    if not has_audio:
+        return None
+
+    def open_blocks():
+        _rewind(source)
+        return iter_audio_track_blocks(source)
+
+    return analyze_audio_stream(open_blocks)
+
+
+def combine_verdicts(frames: dict, audio: Optional[dict]) -> dict:
+    """
+    One verdict for a video: fake if the frames OR the audio track are
+    judged fake (with the most confident such score), otherwise real
+    (with the least confident score).
+    """
+    parts = [frames] + ([audio] if audio is not None else [])
+    fakes = [part for part in parts if part["is_fake"]]
+    if fakes:
+        is_fake, confidence = True, max(part["confidence"] for part in fakes)
+    else:
+        is_fake, confidence = False, min(part["confidence"] for part in parts)
+    return {
+        "is_fake": is_fake,
+        "confidence": confidence,
+        "frames": frames["frames"],
+        "early_exit": frames["early_exit"],
+        "audio": None if audio is None else {
+            "is_deepfake": audio["is_fake"],
+            "confidence": audio["confidence"],
+            "segments": audio["segments"],
+            "early_exit": audio["early_exit"],
+        },
+    }